@@ -0,0 +1,212 @@
+"""
+Admission control for the API's three classes of work:
+
+    verdict  /analyze with no explainers
+    explain  /analyze with SHAP and/or Grad-CAM
+    video    /video_verify jobs
+
+Each class has its own worker pool (the concurrency budget), a bounded
+queue in front of it and a deadline for time spent queued. Model work
+runs on these pools instead of the event loop, so GET / and other cheap
+routes never wait behind a forward pass.
+
+/analyze sheds load in steps, explanations first:
+    1. explain queue under ADMISSION_DEGRADE_AT full   -> SHAP and Grad-CAM
+    2. explain queue fuller than that                  -> Grad-CAM only
+    3. explain queue full                              -> verdict class, no explainers
+    4. verdict queue full                              -> 503 with Retry-After
+An explanation that waits past the explain deadline also runs as a bare
+verdict. A verdict that waits past its deadline, or a video job submitted
+while the video queue is full, gets a 503 too. Retry-After is estimated from
+the class's recent service time and queue depth. /analyze_batch is
+admitted only while the verdict queue has room, and its explanations are
+dropped while the explain queue is full; once admitted, each scoring chunk
+queues for a verdict worker and each explanation for an explain worker,
+like any other request of that class.
+
+Queue wait is recorded per class in admission_queue_wait_seconds. Settings
+can be overridden per class with env vars, e.g. EXPLAIN_CONCURRENCY,
+VERDICT_QUEUE_LIMIT, VIDEO_DEADLINE (seconds, 0 = no deadline).
+"""
+import asyncio
+import contextvars
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from metrics import Histogram, Gauge, Counter, LATENCY_BUCKETS, REGISTRY, METRICS_ENABLED, current_endpoint
+
+ADMISSION_DEGRADE_AT = float(os.getenv('ADMISSION_DEGRADE_AT', '0.5'))
+
+QUEUE_WAIT = Histogram(
+    'admission_queue_wait_seconds',
+    'Time requests spent queued before a worker of their class picked them up',
+    LATENCY_BUCKETS, ('endpoint', 'request_class')
+)
+DECISIONS = Counter(
+    'admission_decisions_total',
+    'Admission outcomes per request class',
+    ('request_class', 'outcome')
+)
+OCCUPANCY = Gauge(
+    'admission_occupancy',
+    'Requests running and waiting per request class',
+    ('request_class', 'state')
+)
+REGISTRY.extend([QUEUE_WAIT, DECISIONS, OCCUPANCY])
+
+
+@dataclass
+class ClassConfig:
+    concurrency: int = 4             # worker threads
+    queue_limit: int = 16            # requests allowed to wait for a worker
+    deadline: float = 30.0           # seconds queued before shedding; 0 = never
+
+    @classmethod
+    def from_env(cls, prefix, **defaults):
+        cfg = cls(**defaults)
+        for field in cls.__dataclass_fields__:
+            value = os.getenv(f'{prefix}_{field.upper()}')
+            if value is not None:
+                setattr(cfg, field, type(getattr(cfg, field))(value))
+        return cfg
+
+
+class Overloaded(RuntimeError):
+    def __init__(self, request_class, retry_after, reason):
+        super().__init__(f'{request_class}: {reason}')
+        self.request_class = request_class
+        self.retry_after = retry_after
+
+
+class RequestClass:
+    def __init__(self, name, config):
+        self.name = name
+        self.config = config
+        self.pool = ThreadPoolExecutor(max_workers=config.concurrency, thread_name_prefix=f'admit-{name}')
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.running = 0
+        self.service_ewma = None
+
+    def _record(self, outcome):
+        if METRICS_ENABLED:
+            DECISIONS.inc(request_class=self.name, outcome=outcome)
+
+    def _occupancy(self):
+        if METRICS_ENABLED:
+            OCCUPANCY.set(self.running, request_class=self.name, state='running')
+            OCCUPANCY.set(self.waiting, request_class=self.name, state='waiting')
+
+    def pressure(self):
+        """Fraction of the queue in use; 1.0 means the next request is rejected."""
+        return self.waiting / self.config.queue_limit if self.config.queue_limit else 1.0
+
+    def retry_after(self):
+        """Seconds until a newly queued request would likely start, at least 1."""
+        per_request = self.service_ewma or 1.0
+        return max(1, math.ceil(per_request * (self.waiting + 1) / self.config.concurrency))
+
+    def full(self):
+        return self.waiting >= self.config.queue_limit
+
+    def check(self):
+        if self.full():
+            self._record('rejected')
+            raise Overloaded(self.name, self.retry_after(), 'queue full')
+
+    def _run(self, ctx, enqueued, fn, args, kwargs, on_expired):
+        waited = time.perf_counter() - enqueued
+        with self.lock:
+            self.waiting -= 1
+            self.running += 1
+        self._occupancy()
+        if METRICS_ENABLED:
+            QUEUE_WAIT.observe(waited, endpoint=ctx.get(current_endpoint), request_class=self.name)
+        start = time.perf_counter()
+        try:
+            if self.config.deadline and waited > self.config.deadline:
+                if on_expired is None:
+                    self._record('expired')
+                    raise Overloaded(self.name, self.retry_after(), f'queued {waited:.1f}s, deadline {self.config.deadline}s')
+                self._record('expired_degraded')
+                return ctx.run(on_expired)
+            self._record('admitted')
+            return ctx.run(fn, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.running -= 1
+                self.service_ewma = elapsed if self.service_ewma is None else 0.8 * self.service_ewma + 0.2 * elapsed
+            self._occupancy()
+
+    def submit(self, fn, *args, on_expired=None, **kwargs):
+        """
+        Queue fn(*args, **kwargs) on this class's pool; returns a Future.
+        Does not reject: call check() first where load should be shed.
+        `on_expired()` runs instead of fn if the deadline passes in the queue.
+        """
+        ctx = contextvars.copy_context()
+        with self.lock:
+            self.waiting += 1
+        self._occupancy()
+        return self.pool.submit(self._run, ctx, time.perf_counter(), fn, args, kwargs, on_expired)
+
+    async def run(self, fn, *args, on_expired=None, **kwargs):
+        """check(), then await fn on the pool."""
+        self.check()
+        return await asyncio.wrap_future(self.submit(fn, *args, on_expired=on_expired, **kwargs))
+
+    def status(self):
+        return {
+            'config': {
+                'concurrency': self.config.concurrency,
+                'queue_limit': self.config.queue_limit,
+                'deadline_s': self.config.deadline,
+            },
+            'running': self.running,
+            'waiting': self.waiting,
+            'pressure': round(self.pressure(), 3),
+            'service_ewma_s': self.service_ewma,
+        }
+
+
+verdict = RequestClass('verdict', ClassConfig.from_env('VERDICT', concurrency=4, queue_limit=32, deadline=10.0))
+explain = RequestClass('explain', ClassConfig.from_env('EXPLAIN', concurrency=2, queue_limit=8, deadline=30.0))
+video = RequestClass('video', ClassConfig.from_env('VIDEO', concurrency=int(os.getenv('VIDEO_WORKERS', '2')),
+                                                    queue_limit=16, deadline=0.0))
+
+CLASSES = {c.name: c for c in (verdict, explain, video)}
+
+
+def plan_explanation(explainers):
+    """
+    (request class, explainers to run) for a request that wants `explainers`,
+    by explain-queue pressure. Raises Overloaded when even a verdict won't fit.
+    """
+    if not explain.full():
+        if explain.pressure() < ADMISSION_DEGRADE_AT:
+            return explain, tuple(explainers)
+        # SHAP is the expensive one: dozens of text forward passes against one backward pass
+        explain._record('shed_shap')
+        return explain, tuple(e for e in explainers if e != 'shap')
+    verdict.check()
+    explain._record('shed_all')
+    return verdict, ()
+
+
+async def run_explained(fn, explainers):
+    """
+    Await fn(explainers_to_run) on the class plan_explanation picks. An
+    explanation that outlives the explain deadline in the queue runs as fn(()).
+    """
+    request_class, chosen = plan_explanation(explainers)
+    on_expired = (lambda: fn(())) if chosen else None
+    return await asyncio.wrap_future(request_class.submit(fn, chosen, on_expired=on_expired))
+
+
+def status():
+    return {name: c.status() for name, c in CLASSES.items()}
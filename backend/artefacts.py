@@ -0,0 +1,259 @@
+"""
+Content-addressed store for uploaded images and explanation overlays.
+
+Every artefact is named by the SHA-256 of its bytes, `<sha256><ext>`,
+directly under ARTEFACT_DIR (the directory served at /uploads). Writes go
+to a temporary file in the same directory and are renamed into place, so a
+reader never sees a partial file. Two requests that upload the same image,
+or render the same overlay, share one file; different content can never
+overwrite each other.
+
+The store is kept within ARTEFACT_MAX_MB and ARTEFACT_MAX_AGE_S by a
+collector on a background thread that runs every ARTEFACT_GC_INTERVAL_S:
+    1. leftover *.part files from interrupted writes are removed
+    2. artefacts older than the age limit are removed
+    3. while over the byte limit, the least recently used are removed
+Recency is the file's mtime. It is bumped when an identical artefact is put
+again and when /uploads serves the file. Files younger than
+ARTEFACT_MIN_AGE_S are never collected, so a request's own upload cannot
+disappear while the request is running.
+
+Since a name fixes the bytes, /uploads serves artefacts with the hash as a
+strong ETag and `Cache-Control: public, max-age=31536000, immutable`.
+ARTEFACT_WEBP=1 encodes heatmap overlays as WebP (ARTEFACT_WEBP_QUALITY),
+which is about half the size of the quality-95 JPEG written before.
+"""
+import contextlib
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+
+import cv2
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+import logs
+from metrics import Counter, Gauge, REGISTRY, METRICS_ENABLED
+
+_NAME = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]{1,5}$')
+_EXT = re.compile(r'^\.[a-z0-9]{1,5}$')
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+STORE_BYTES = Gauge(
+    'artefact_store_bytes',
+    'Bytes held in the artefact store after the last collection',
+    ()
+)
+EVICTIONS = Counter(
+    'artefact_evictions_total',
+    'Artefacts removed by the collector',
+    ('reason',)
+)
+REGISTRY.extend([STORE_BYTES, EVICTIONS])
+
+log = logs.get('artefacts')
+
+# os.umask can only be read by setting it, so do it once while importing
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+FILE_MODE = 0o666 & ~_UMASK
+
+
+@dataclass
+class ArtefactConfig:
+    directory: str = 'uploads'
+    max_bytes: int = 2 << 30
+    max_age: float = 7 * 24 * 3600.0
+    min_age: float = 300.0
+    gc_interval: float = 300.0
+    webp: bool = False
+    webp_quality: int = 80
+    jpeg_quality: int = 95
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            directory=os.getenv('ARTEFACT_DIR', 'uploads'),
+            max_bytes=int(float(os.getenv('ARTEFACT_MAX_MB', '2048')) * (1 << 20)),
+            max_age=float(os.getenv('ARTEFACT_MAX_AGE_S', str(7 * 24 * 3600))),
+            min_age=float(os.getenv('ARTEFACT_MIN_AGE_S', '300')),
+            gc_interval=float(os.getenv('ARTEFACT_GC_INTERVAL_S', '300')),
+            webp=os.getenv('ARTEFACT_WEBP', '0') == '1',
+            webp_quality=int(os.getenv('ARTEFACT_WEBP_QUALITY', '80')),
+            jpeg_quality=int(os.getenv('ARTEFACT_JPEG_QUALITY', '95')),
+        )
+
+
+def safe_ext(filename, default='.jpg'):
+    """The lower-cased extension of a client filename, if it is a plain one."""
+    ext = os.path.splitext(filename or '')[1].lower()
+    return ext if _EXT.match(ext) else default
+
+
+class ArtefactStore:
+    def __init__(self, config):
+        self.config = config
+        self.directory = config.directory
+        os.makedirs(self.directory, exist_ok=True)
+        self._gc_thread = None
+        self._stop = threading.Event()
+        self.last_gc = None
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _finish(self, tmp_path, digest, ext):
+        final_path = self.path(digest + ext)
+        # mkstemp creates the file 0600; give it the mode open() would have
+        os.chmod(tmp_path, FILE_MODE)
+        # Always rename, even over an identical file: checking for it first
+        # and touching it races the collector, which may remove it in between.
+        # The new file's mtime marks the artefact recently used.
+        os.replace(tmp_path, final_path)
+        return final_path
+
+    def put_bytes(self, data, ext='.jpg'):
+        """Store data; returns its path under the store directory."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return self._finish(tmp_path, hashlib.sha256(data).hexdigest(), ext)
+
+    def put_file(self, fileobj, ext='.jpg'):
+        """Stream a file object into the store, hashing as it goes."""
+        h = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for block in iter(lambda: fileobj.read(1 << 20), b''):
+                    h.update(block)
+                    f.write(block)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return self._finish(tmp_path, h.hexdigest(), ext)
+
+    def put_image(self, image, heatmap=False):
+        """Encode a BGR array (JPEG, or WebP for heatmaps with ARTEFACT_WEBP=1) and store it."""
+        if heatmap and self.config.webp:
+            ext, params = '.webp', [cv2.IMWRITE_WEBP_QUALITY, self.config.webp_quality]
+        else:
+            ext, params = '.jpg', [cv2.IMWRITE_JPEG_QUALITY, self.config.jpeg_quality]
+        ok, buf = cv2.imencode(ext, image, params)
+        if not ok:
+            raise ValueError(f'could not encode image as {ext}')
+        return self.put_bytes(buf.tobytes(), ext)
+
+    def touch(self, name):
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(self.path(name))
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    entries.append((entry.name, st.st_size, st.st_mtime))
+        return entries
+
+    def _evict(self, name, reason):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path(name))
+        if METRICS_ENABLED:
+            EVICTIONS.inc(reason=reason)
+
+    def gc(self, now=None):
+        """One collection pass; returns what it removed and what is left."""
+        now = time.time() if now is None else now
+        cfg = self.config
+        removed = {'partial': 0, 'age': 0, 'size': 0}
+        kept = []
+        for name, size, mtime in self._entries():
+            age = now - mtime
+            if name.endswith('.part'):
+                if age > max(cfg.min_age, 3600):
+                    self._evict(name, 'partial')
+                    removed['partial'] += 1
+                continue
+            if cfg.max_age and age > cfg.max_age and age > cfg.min_age:
+                self._evict(name, 'age')
+                removed['age'] += 1
+                continue
+            kept.append((mtime, name, size))
+
+        total = sum(size for _, _, size in kept)
+        kept.sort()
+        for mtime, name, size in kept:
+            if total <= cfg.max_bytes:
+                break
+            if now - mtime <= cfg.min_age:
+                break
+            self._evict(name, 'size')
+            removed['size'] += 1
+            total -= size
+
+        if METRICS_ENABLED:
+            STORE_BYTES.set(total)
+        self.last_gc = {'at': now, 'removed': removed, 'bytes': total}
+        return self.last_gc
+
+    def _gc_loop(self):
+        while not self._stop.wait(self.config.gc_interval):
+            try:
+                self.gc()
+            except Exception:
+                log.warning('artefact gc failed', exc_info=True)
+
+    def start(self):
+        """Collect once now, then every gc_interval seconds on a daemon thread."""
+        if self._gc_thread is not None:
+            return
+        self.gc()
+        self._gc_thread = threading.Thread(target=self._gc_loop, daemon=True, name='artefact-gc')
+        self._gc_thread.start()
+
+    def status(self):
+        entries = [e for e in self._entries() if not e[0].endswith('.part')]
+        return {
+            'directory': self.directory,
+            'files': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.config.max_bytes,
+            'max_age_s': self.config.max_age,
+            'webp': self.config.webp,
+            'last_gc': self.last_gc,
+        }
+
+
+class ArtefactFiles(StaticFiles):
+    """StaticFiles for the store: strong ETags and immutable caching for content-addressed names."""
+    def __init__(self, store, **kwargs):
+        super().__init__(directory=store.directory, **kwargs)
+        self.store = store
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        name = os.path.basename(full_path)
+        if not _NAME.match(name):
+            # files from before the store keep StaticFiles' mtime-based ETag
+            return super().file_response(full_path, stat_result, scope, status_code)
+        etag = f'"{name.split(".")[0]}"'
+        self.store.touch(name)
+        headers = {'etag': etag, 'cache-control': CACHE_CONTROL}
+        if_none_match = Headers(scope=scope).get('if-none-match')
+        # strong comparison: a W/ tag never matches a content hash
+        if if_none_match and (if_none_match.strip() == '*' or etag in [t.strip() for t in if_none_match.split(',')]):
+            return NotModifiedResponse(Headers(headers))
+        return FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+
+
+store = ArtefactStore(ArtefactConfig.from_env())
@@ -0,0 +1,181 @@
+"""
+Word-level aggregation of token attributions (SHAP values over the title).
+
+One tokenizer call with return_offsets_mapping gives every token's
+character span in the title. A word is a whitespace-delimited run of the
+title, and each token belongs to the word its span starts in. Word impacts
+are then a single segment sum (np.bincount) over the token values.
+
+This replaces the old '##'-prefix merging. That heuristic starts a new
+word wherever the tokenizer starts a piece without '##', which the BERT
+pre-tokenizer does at every punctuation mark and at characters it treats as
+separators, so Kannada words with attached punctuation or joiners came out
+in fragments. Pieces outside the vocabulary were shown as '[UNK]'. Here
+every word is an exact slice of the title.
+
+SHAP's Text masker tokenizes the title the same way (same tokenizer,
+special tokens included), so values[i] belongs to input_ids[i]. The
+encoding comes from tokenization.py's cache, usually filled already by the
+forward pass for the same title.
+
+A slow tokenizer (tokenization.load falls back to one when the fast one
+cannot be built) gives no offsets. Then words are rebuilt the old way, by
+'##' merging of the token pieces, with a warning, rather than coming back
+empty.
+"""
+import re
+import threading
+
+import numpy as np
+
+import logs
+import tokenization
+
+log = logs.get('attribution')
+
+_WORD = re.compile(r'\S+')
+MIN_IMPACT = 1e-8
+_warned = set()
+_warned_lock = threading.Lock()
+
+
+def encode(title, tokenizer):
+    """input_ids and offset_mapping for the title, as SHAP's masker tokenizes it (memoized)."""
+    return tokenization.encode(tokenizer, title)
+
+
+def word_spans(text):
+    """(starts, ends) character spans of the whitespace-delimited words in text."""
+    spans = np.array([m.span() for m in _WORD.finditer(text)], dtype=np.int64).reshape(-1, 2)
+    return spans[:, 0], spans[:, 1]
+
+
+def token_values(values):
+    """SHAP values as a 1-D array; explanations of a (B, 1) model come back as (n_tokens, 1)."""
+    values = np.asarray(values, dtype=np.float64)
+    return values.reshape(values.shape[0], -1)[:, 0] if values.ndim > 1 else values
+
+
+def aggregate(values, offsets, starts):
+    """
+    Segment-sum token values into words.
+
+    Returns (impacts per word, word index per token, mask of tokens that
+    cover title text). Special tokens, with empty (0, 0) spans, get word -1.
+    """
+    n = min(len(values), len(offsets))
+    values, offsets = values[:n], offsets[:n]
+    real = offsets[:, 1] > offsets[:, 0]
+    word_of = np.where(real, np.searchsorted(starts, offsets[:, 0], side='right') - 1, -1)
+    impacts = np.bincount(word_of[real], weights=values[real], minlength=len(starts))
+    return impacts, word_of, real
+
+
+def has_offsets(offsets):
+    """False for a slow tokenizer's encoding, whose spans are all (0, 0)."""
+    return bool(offsets[:, 1].any())
+
+
+def merge_pieces(values, ids, tokenizer):
+    """
+    Fallback for encodings without offsets: a word starts at every piece
+    without a '##' prefix and runs through the '##' pieces after it.
+
+    Returns (words, impacts per word, word index per token, mask of
+    non-special tokens, token texts).
+    """
+    n = min(len(values), len(ids))
+    ids = ids[:n].tolist()
+    pieces = tokenizer.convert_ids_to_tokens(ids)
+    special = set(tokenizer.all_special_ids)
+    words, word_of = [], np.full(n, -1, dtype=np.int64)
+    for i, (token_id, piece) in enumerate(zip(ids, pieces)):
+        if token_id in special:
+            continue
+        if piece.startswith('##') and words:
+            words[-1] += piece[2:]
+        else:
+            words.append(piece)
+        word_of[i] = len(words) - 1
+    real = word_of >= 0
+    impacts = np.bincount(word_of[real], weights=values[:n][real], minlength=len(words))
+    return words, impacts, word_of, real, [p.removeprefix('##') for p in pieces]
+
+
+def _warn_no_offsets(tokenizer):
+    name = getattr(tokenizer, 'name_or_path', type(tokenizer).__name__)
+    with _warned_lock:
+        if name in _warned:
+            return
+        _warned.add(name)
+    log.warning('tokenizer gives no offsets; merging ## pieces into words', extra=logs.fields(tokenizer=name))
+
+
+def _top(scores, keep, top_n):
+    order = np.argsort(-np.abs(scores), kind='stable')
+    return order[keep[order]][:top_n].tolist()
+
+
+def shap_insights(values, title, tokenizer, top_n=5, encoding=None):
+    """
+    Evidence dict for one title. `encoding` is an (input_ids, offsets) pair
+    from encode(), if the caller already has one.
+    """
+    values = token_values(values)
+    ids, offsets = encoding if encoding is not None else encode(title, tokenizer)
+    starts, ends = word_spans(title)
+    insights = {
+        'important_words': [],
+        'positive_contributors': [],
+        'negative_contributors': [],
+        'all_tokens': [],
+    }
+    if len(values) == 0 or len(starts) == 0:
+        insights['reconstructed_words'] = []
+        insights['frontend_display'] = {'highlighted_text': [], 'token_count': 0}
+        return insights
+
+    if has_offsets(offsets):
+        impacts, word_of, real = aggregate(values, offsets, starts)
+        # plain Python lists from here on: per-element NumPy indexing dominates otherwise
+        words = [title[s:e] for s, e in zip(starts.tolist(), ends.tolist())]
+        spans = list(zip(starts.tolist(), ends.tolist()))
+    else:
+        _warn_no_offsets(tokenizer)
+        words, impacts, word_of, real, pieces = merge_pieces(values, ids, tokenizer)
+        spans = None
+    n = len(real)
+    significant = np.abs(impacts) > MIN_IMPACT
+    impact_list = impacts.tolist()
+
+    for w in _top(impacts, significant, top_n):
+        word, impact = words[w], impact_list[w]
+        insights['important_words'].append({'word': word, 'impact': impact})
+        (insights['positive_contributors'] if impact > 0 else insights['negative_contributors']).append(word)
+
+    token_keep = real & (np.abs(values[:n]) > MIN_IMPACT)
+    for i in _top(values[:n], token_keep, top_n):
+        impact = float(values[i])
+        insights['all_tokens'].append({
+            'token': title[offsets[i, 0]:offsets[i, 1]] if spans is not None else pieces[i],
+            'impact': impact,
+            'abs_impact': abs(impact),
+            'position': i,
+            'word': int(word_of[i]),
+        })
+
+    # words are whole already; kept under the old key for existing consumers
+    insights['reconstructed_words'] = insights['important_words']
+    highlighted = []
+    for w in np.flatnonzero(significant).tolist():
+        segment = {
+            'text': words[w],
+            'impact': impact_list[w],
+            'color_intensity': min(abs(impact_list[w]) * 10, 1.0),
+            'type': 'fake' if impact_list[w] > 0 else 'real',
+        }
+        if spans is not None:
+            segment['start'], segment['end'] = spans[w]
+        highlighted.append(segment)
+    insights['frontend_display'] = {'highlighted_text': highlighted, 'token_count': int(real.sum())}
+    return insights
@@ -0,0 +1,231 @@
+"""
+Audio front-end for transcription.
+
+ffmpeg decodes the video's audio track straight to 16 kHz mono s16le PCM
+on a pipe, so nothing is written to disk and only one chunk is ever held
+in memory. Each 30 ms frame goes through voice-activity detection:
+    - silence between utterances is dropped, keeping VAD_PAD_MS of context
+      around speech so word edges survive
+    - chunks are cut at pauses of at least VAD_MIN_PAUSE_MS once they are
+      VAD_MIN_CHUNK_S long
+    - a chunk never exceeds VAD_MAX_CHUNK_S; at the cap it is split at the
+      latest short pause in the chunk rather than mid-word where possible
+
+VAD uses webrtcvad when it is installed (VAD_BACKEND=webrtc|energy, default
+auto). Otherwise it uses an energy detector with an adaptive noise floor.
+
+    python audio_stream.py video.mp4       # print the chunk plan and savings
+"""
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import wave
+from collections import deque
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+VAD_BACKEND = os.getenv('VAD_BACKEND', 'auto')
+VAD_MAX_CHUNK_S = float(os.getenv('VAD_MAX_CHUNK_S', '25'))
+VAD_MIN_CHUNK_S = float(os.getenv('VAD_MIN_CHUNK_S', '3'))
+VAD_MIN_PAUSE_MS = int(os.getenv('VAD_MIN_PAUSE_MS', '400'))
+VAD_PAD_MS = int(os.getenv('VAD_PAD_MS', '210'))
+VAD_ENERGY_MARGIN_DB = float(os.getenv('VAD_ENERGY_MARGIN_DB', '12'))
+VAD_ENERGY_MIN_DB = float(os.getenv('VAD_ENERGY_MIN_DB', '-55'))
+
+# pauses shorter than VAD_MIN_PAUSE_MS still mark a good place to split at the cap
+SHORT_PAUSE_MS = 120
+
+
+def ffmpeg_binary():
+    """FFMPEG_BINARY, else ffmpeg on PATH, else the copy bundled with imageio-ffmpeg."""
+    binary = os.getenv('FFMPEG_BINARY') or shutil.which('ffmpeg')
+    if binary:
+        return binary
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        raise RuntimeError('ffmpeg not found; install it or set FFMPEG_BINARY')
+
+
+def pcm_frames(video_path, sample_rate=SAMPLE_RATE, frame_ms=FRAME_MS):
+    """Yield fixed-size s16le mono frames decoded by ffmpeg; the last one is zero-padded."""
+    frame_bytes = sample_rate * frame_ms // 1000 * 2
+    cmd = [
+        ffmpeg_binary(), '-nostdin', '-loglevel', 'error',
+        '-i', video_path, '-vn', '-ac', '1', '-ar', str(sample_rate),
+        '-f', 's16le', '-'
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    produced = False
+    try:
+        while True:
+            buf = proc.stdout.read(frame_bytes)
+            if not buf:
+                break
+            produced = True
+            if len(buf) < frame_bytes:
+                buf = buf + b'\0' * (frame_bytes - len(buf))
+            yield buf
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.stdout.close()
+        err = proc.stderr.read().decode('utf-8', 'replace').strip()
+        proc.stderr.close()
+        code = proc.wait()
+    if code != 0 and not produced:
+        raise RuntimeError(f'ffmpeg failed ({code}): {err[-500:]}')
+
+
+class EnergyVAD:
+    """
+    Frame energy against a noise-floor estimate that drops instantly to any
+    quieter frame and rises slowly (time constant ~1 min), so stationary
+    background noise is learned while speech pauses keep pulling it down.
+    """
+    def __init__(self, margin_db=VAD_ENERGY_MARGIN_DB, min_db=VAD_ENERGY_MIN_DB):
+        self.margin_db = margin_db
+        self.min_db = min_db
+        self.floor = min_db
+
+    def is_speech(self, frame, sample_rate=SAMPLE_RATE):
+        samples = np.frombuffer(frame, dtype=np.int16).astype(np.float32) / 32768.0
+        db = 10 * np.log10(np.mean(samples * samples) + 1e-10)
+        if db < self.floor:
+            self.floor = db
+        else:
+            self.floor += 0.0005 * (db - self.floor)
+        return db > max(self.floor + self.margin_db, self.min_db)
+
+
+def make_vad(backend=VAD_BACKEND):
+    if backend in ('auto', 'webrtc'):
+        try:
+            import webrtcvad
+            vad = webrtcvad.Vad(int(os.getenv('VAD_AGGRESSIVENESS', '2')))
+            return vad
+        except ImportError:
+            if backend == 'webrtc':
+                raise
+    return EnergyVAD()
+
+
+def to_wav(pcm, sample_rate=SAMPLE_RATE):
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(pcm)
+    return buf.getvalue()
+
+
+class VadChunker:
+    """
+    Turns a stream of PCM frames into speech chunks. feed() returns the
+    chunks completed by that frame; call flush() at end of stream.
+    Each chunk is (start_seconds, pcm_bytes).
+    """
+    def __init__(self, vad, sample_rate=SAMPLE_RATE, frame_ms=FRAME_MS, max_chunk_s=VAD_MAX_CHUNK_S,
+                 min_chunk_s=VAD_MIN_CHUNK_S, min_pause_ms=VAD_MIN_PAUSE_MS, pad_ms=VAD_PAD_MS):
+        self.vad = vad
+        self.sample_rate = sample_rate
+        self.frame_s = frame_ms / 1000
+        self.max_frames = int(max_chunk_s * 1000 / frame_ms)
+        self.min_frames = int(min_chunk_s * 1000 / frame_ms)
+        self.pause_frames = max(1, min_pause_ms // frame_ms)
+        self.pad_frames = pad_ms // frame_ms
+        self.short_pause_frames = max(1, SHORT_PAUSE_MS // frame_ms)
+
+        self.frames = []          # current chunk
+        self.indices = []         # stream frame index of each chunk frame (silence gaps are dropped)
+        self.split_at = None      # where to cut at the cap: end of the latest short pause's trailing pad
+        self.silence_run = 0      # non-speech frames since the last speech frame
+        self.lead = deque(maxlen=self.pad_frames)   # (index, frame) pre-roll before speech
+        self.position = 0
+        self.sent_frames = 0
+
+    def _emit(self, n):
+        chunk = (self.indices[0] * self.frame_s, b''.join(self.frames[:n]))
+        last = self.indices[n - 1]
+        self.sent_frames += n
+        self.frames, self.indices = self.frames[n:], self.indices[n:]
+        self.split_at = None
+        # trailing pad just sent is also in the pre-roll; it must not open the next chunk again
+        while self.lead and self.lead[0][0] <= last:
+            self.lead.popleft()
+        return chunk
+
+    def _append(self, index, frame):
+        self.frames.append(frame)
+        self.indices.append(index)
+
+    def feed(self, frame):
+        index = self.position
+        self.position += 1
+        out = []
+
+        if self.vad.is_speech(frame, self.sample_rate):
+            if self.frames and self.silence_run >= self.short_pause_frames:
+                self.split_at = len(self.frames)
+            # pre-roll: the silence just before this speech that is not already in the chunk
+            if self.silence_run > self.pad_frames or not self.frames:
+                missing = self.silence_run - self.pad_frames if self.frames else len(self.lead)
+                for i, f in list(self.lead)[-missing:] if missing > 0 else []:
+                    self._append(i, f)
+            self._append(index, frame)
+            self.silence_run = 0
+            self.lead.clear()
+        else:
+            self.lead.append((index, frame))
+            if self.frames:
+                self.silence_run += 1
+                if self.silence_run <= self.pad_frames:
+                    self._append(index, frame)
+                if self.silence_run >= self.pause_frames and len(self.frames) >= self.min_frames:
+                    out.append(self._emit(len(self.frames)))
+
+        if len(self.frames) >= self.max_frames:
+            cut = self.split_at if self.split_at and self.split_at > self.max_frames // 2 else len(self.frames)
+            out.append(self._emit(cut))
+        return out
+
+    def flush(self):
+        return [self._emit(len(self.frames))] if self.frames else []
+
+    def stats(self):
+        return {
+            'audio_seconds': round(self.position * self.frame_s, 2),
+            'sent_seconds': round(self.sent_frames * self.frame_s, 2),
+            'dropped_fraction': round(1 - self.sent_frames / self.position, 4) if self.position else 0.0,
+        }
+
+
+def speech_chunks(video_path, chunker=None):
+    """Yield (start_seconds, wav_bytes) speech chunks from a video; returns the chunker for stats."""
+    chunker = chunker or VadChunker(make_vad())
+    for frame in pcm_frames(video_path, chunker.sample_rate, int(chunker.frame_s * 1000)):
+        for start, pcm in chunker.feed(frame):
+            yield start, to_wav(pcm, chunker.sample_rate)
+    for start, pcm in chunker.flush():
+        yield start, to_wav(pcm, chunker.sample_rate)
+
+
+def main():
+    if len(sys.argv) != 2:
+        raise SystemExit('usage: python audio_stream.py <video>')
+    chunker = VadChunker(make_vad())
+    plan = []
+    for start, wav in speech_chunks(sys.argv[1], chunker):
+        plan.append({'start_s': round(start, 2), 'seconds': round((len(wav) - 44) / 2 / SAMPLE_RATE, 2)})
+    print(json.dumps({'vad': type(chunker.vad).__name__, 'chunks': plan, **chunker.stats()}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
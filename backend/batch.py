@@ -0,0 +1,410 @@
+"""
+Bulk analysis for /analyze_batch.
+
+Items arrive either as multipart fields or as one tarball. Each item is
+a title and an image, and may set its own `explain` flag. Processing:
+    1. decode every image; an item that fails here is reported and dropped
+    2. score in chunks of ANALYZE_BATCH_CHUNK: one padded MuRIL pass, one ViT
+       pass and one heads pass per chunk (prediction.score_batch). If a
+       chunk fails, its items are retried one at a time, so a single bad
+       item cannot sink its neighbours.
+    3. claim-index matches, then one zero-shot classifier call for the
+       chunk's titles without a match
+    4. finish each item on a pool of ANALYZE_BATCH_WORKERS threads: the web
+       check, plus SHAP and Grad-CAM for items that asked for an explanation
+    5. draw the Grad-CAM overlays ANALYZE_BATCH_OVERLAYS at a time with one
+       overlays.render() call, or whatever is waiting once nothing else is
+       in flight; an explained item's line is sent once its overlay is written
+Steps 2-3 run chunk after chunk on a scoring thread, and a chunk's items are
+finished while the next chunk is scored, so the first lines go out after
+one chunk, not after the whole batch.
+Given admission classes (server.py passes admission.verdict and
+admission.explain), every chunk's scoring and the classifier call run on a
+verdict worker, and each explanation on an explain worker, so a batch
+shares the model with /analyze under the same concurrency limits instead
+of beside them. An explanation that waits past the explain deadline is
+finished without one; scoring that waits past the verdict deadline fails
+its chunk's items.
+Results stream back as NDJSON in completion order, one line per item:
+    {"index": 3, "id": "...", "ok": true, "result": {...evidence...}}
+    {"index": 4, "id": "...", "ok": false, "error": "..."}
+and a final {"done": true, ...} summary line.
+
+Tarball layout: images anywhere in the archive, plus manifest.json (a list)
+or manifest.jsonl, where each entry is
+{"title": ..., "image": <member name>, "id": optional, "explain": optional}.
+Members are read into memory, so an archive whose images add up to more
+than ANALYZE_BATCH_MAX_BYTES is refused with 413.
+"""
+import contextvars
+import io
+import json
+import os
+import queue
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+from PIL import Image
+
+import artefacts
+import logs
+import overlays
+from metrics import observe_batch
+from prediction import score_batch, finish_analysis, match_prior_claim, CLAIM_LABELS
+
+log = logs.get('batch')
+
+ANALYZE_BATCH_MAX = int(os.getenv('ANALYZE_BATCH_MAX', '256'))
+ANALYZE_BATCH_CHUNK = int(os.getenv('ANALYZE_BATCH_CHUNK', '32'))
+ANALYZE_BATCH_WORKERS = int(os.getenv('ANALYZE_BATCH_WORKERS', '4'))
+ANALYZE_BATCH_OVERLAYS = int(os.getenv('ANALYZE_BATCH_OVERLAYS', '16'))
+ANALYZE_BATCH_MAX_IMAGE_BYTES = int(os.getenv('ANALYZE_BATCH_MAX_IMAGE_BYTES', str(20 * 1024 * 1024)))
+# all images of one batch together, as held in memory
+ANALYZE_BATCH_MAX_BYTES = int(os.getenv('ANALYZE_BATCH_MAX_BYTES', str(256 * 1024 * 1024)))
+
+
+class BatchError(ValueError):
+    """The request as a whole is unusable (bad manifest, too many items)."""
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass
+class BatchItem:
+    index: int
+    id: str
+    title: str
+    name: str
+    data: bytes
+    explain: bool = False
+    image: Optional[Image.Image] = None
+    error: Optional[str] = None
+
+
+def check_size(count, limit=ANALYZE_BATCH_MAX):
+    if count == 0:
+        raise BatchError('batch is empty')
+    if count > limit:
+        raise BatchError(f'batch has {count} items; the limit is {limit}', status_code=413)
+
+
+def check_bytes(total):
+    if total > ANALYZE_BATCH_MAX_BYTES:
+        raise BatchError(f'batch holds more than {ANALYZE_BATCH_MAX_BYTES} bytes of images', status_code=413)
+
+
+def _entry_explain(entry, default):
+    value = entry.get('explain', default)
+    return value if isinstance(value, bool) else str(value).lower() in ('1', 'true', 'yes')
+
+
+def items_from_fields(images, titles=None, manifest=None, explain=False):
+    """
+    images: list of (filename, bytes). Either titles line up with images by
+    position, or manifest (JSON list) names each item's image by filename.
+    """
+    if manifest:
+        try:
+            entries = json.loads(manifest)
+        except json.JSONDecodeError as e:
+            raise BatchError(f'manifest is not valid JSON: {e}')
+        if not isinstance(entries, list):
+            raise BatchError('manifest must be a JSON list')
+        check_size(len(entries))
+        by_name = dict(images)
+        items = []
+        for i, entry in enumerate(entries):
+            name = entry.get('image', '')
+            item = BatchItem(i, str(entry.get('id', i)), str(entry.get('title', '')), name,
+                             by_name.get(name, b''), _entry_explain(entry, explain))
+            if name not in by_name:
+                item.error = f'image {name!r} not in the upload'
+            items.append(item)
+        return items
+
+    titles = titles or []
+    if len(titles) != len(images):
+        raise BatchError(f'{len(titles)} titles for {len(images)} images; send one title per image or a manifest')
+    check_size(len(images))
+    return [BatchItem(i, str(i), title, name, data, explain)
+            for i, (title, (name, data)) in enumerate(zip(titles, images))]
+
+
+def _member_name(name):
+    """
+    A tar member or manifest image name, relative to the archive root; None
+    for names that are absolute or climb out of it with '..'.
+    """
+    name = str(name).removeprefix('./')
+    if name.startswith('/') or '..' in name.split('/'):
+        return None
+    return name
+
+
+def items_from_tar(fileobj, explain=False):
+    """Read a (optionally compressed) tarball in memory; nothing is extracted to disk."""
+    try:
+        tar = tarfile.open(fileobj=fileobj, mode='r:*')
+    except tarfile.TarError as e:
+        raise BatchError(f'not a readable tar archive: {e}')
+    with tar:
+        members = {}
+        for m in tar.getmembers():
+            name = _member_name(m.name)
+            if m.isfile() and name is not None:
+                members[name] = m
+        manifest = members.get('manifest.json') or members.get('manifest.jsonl')
+        if manifest is None:
+            raise BatchError('archive has no manifest.json or manifest.jsonl')
+        total = manifest.size
+        check_bytes(total)
+        raw = tar.extractfile(manifest).read().decode('utf-8')
+        try:
+            if manifest.name.endswith('.jsonl'):
+                entries = [json.loads(line) for line in raw.splitlines() if line.strip()]
+            else:
+                entries = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise BatchError(f'manifest is not valid JSON: {e}')
+        check_size(len(entries))
+
+        items = []
+        for i, entry in enumerate(entries):
+            raw_name = str(entry.get('image', ''))
+            name = _member_name(raw_name)
+            item = BatchItem(i, str(entry.get('id', i)), str(entry.get('title', '')), name or raw_name, b'',
+                             _entry_explain(entry, explain))
+            member = members.get(name)
+            if name is None:
+                item.error = f'image {raw_name!r} is outside the archive'
+            elif member is None:
+                item.error = f'image {name!r} not in the archive'
+            elif member.size > ANALYZE_BATCH_MAX_IMAGE_BYTES:
+                item.error = f'image {name!r} is larger than {ANALYZE_BATCH_MAX_IMAGE_BYTES} bytes'
+            else:
+                total += member.size
+                check_bytes(total)
+                item.data = tar.extractfile(member).read()
+            items.append(item)
+        return items
+
+
+def _decode(item):
+    if item.error:
+        return
+    if not item.title.strip():
+        item.error = 'empty title'
+        return
+    if len(item.data) > ANALYZE_BATCH_MAX_IMAGE_BYTES:
+        item.error = f'image is larger than {ANALYZE_BATCH_MAX_IMAGE_BYTES} bytes'
+        return
+    try:
+        item.image = Image.open(io.BytesIO(item.data)).convert('RGB')
+    except Exception as e:
+        item.error = f'could not decode image: {e}'
+
+
+def _score(chunk, model, tokenizer, image_index, cascade):
+    """Score a chunk in one batch; on failure fall back to one item at a time."""
+    try:
+        return list(zip(chunk, score_batch([i.title for i in chunk], [i.image for i in chunk],
+                                           model, tokenizer, image_index, cascade)))
+    except Exception as e:
+        if len(chunk) == 1:
+            chunk[0].error = f'scoring failed: {e}'
+            return []
+    scored = []
+    for item in chunk:
+        scored.extend(_score([item], model, tokenizer, image_index, cascade))
+    return scored
+
+
+def _classify(titles, classifier):
+    """Zero-shot claim types for many titles in one pipeline call."""
+    if not titles:
+        return []
+    try:
+        results = classifier(list(titles), CLAIM_LABELS, hypothesis_template="ಈ ಸುದ್ದಿ {} ಕುರಿತು ಇದೆ.")
+        if isinstance(results, dict):
+            results = [results]
+        return [r['labels'][0] for r in results]
+    except Exception:
+        log.warning('batch claim classification failed', exc_info=True)
+        return ['unknown'] * len(titles)
+
+
+def _save_image(item, store):
+    # only explained items need a file; the overlay itself is drawn on the decoded image
+    return store.put_bytes(item.data, artefacts.safe_ext(item.name))
+
+
+def _line(obj):
+    return json.dumps(obj, ensure_ascii=False, default=str) + '\n'
+
+
+def _on(request_class, fn, *args, on_expired=None):
+    """fn(*args) on a worker of request_class, blocking until it is done; inline without one."""
+    if request_class is None:
+        return fn(*args)
+    return request_class.submit(fn, *args, on_expired=on_expired).result()
+
+
+def run(items, model, tokenizer, classifier, claim_index=None, image_index=None, cascade=None,
+        store=None, chunk_size=ANALYZE_BATCH_CHUNK, workers=ANALYZE_BATCH_WORKERS,
+        overlay_batch=ANALYZE_BATCH_OVERLAYS, verdict_class=None, explain_class=None):
+    """
+    Generator of NDJSON lines, one per item in completion order, then a
+    summary line. verdict_class and explain_class are admission classes
+    whose workers run the model work (see above); None runs it here.
+    """
+    store = store or artefacts.store
+    start = time.perf_counter()
+    errors = 0
+
+    def failed(item):
+        return _line({'index': item.index, 'id': item.id, 'ok': False, 'error': item.error})
+
+    for item in items:
+        _decode(item)
+    for item in items:
+        if item.error:
+            errors += 1
+            yield failed(item)
+
+    ready = [i for i in items if not i.error]
+    decoded = {}
+    pending = overlays.OverlayBatch(store, images=decoded)
+    # the scoring thread and the finishing workers report here:
+    # ('failed', item), ('submitted', item), ('finished', item, future), ('scored',)
+    events = queue.Queue()
+    stop = threading.Event()
+    reported = set()          # indexes the scoring thread has passed on, failed or submitted
+
+    def finish_item(item, s, prior, claim_type, explain):
+        if explain and not s['resolved_early']:
+            image_path = _save_image(item, store)
+            decoded[image_path] = item.image
+        else:
+            image_path = item.name
+        return finish_analysis(item.title, image_path, s, model, tokenizer, classifier,
+                               claim_index, image_index, cascade, explain=explain,
+                               prior=prior, claim_type=claim_type, overlay_batch=pending)
+
+    def finish(item, s, prior, claim_type):
+        if not item.explain or s['resolved_early']:
+            return finish_item(item, s, prior, claim_type, item.explain)
+        return _on(explain_class, finish_item, item, s, prior, claim_type, True,
+                   on_expired=lambda: finish_item(item, s, prior, claim_type, False))
+
+    def score_chunk(chunk, pool):
+        observe_batch('analyze_batch', len(chunk))
+        try:
+            scored = _on(verdict_class, _score, chunk, model, tokenizer, image_index, cascade)
+        except Exception as e:
+            # the verdict deadline passed while the chunk was queued
+            scored = []
+            for item in chunk:
+                item.error = f'scoring failed: {e}'
+        for item in chunk:
+            if item.error:
+                reported.add(item.index)
+                events.put(('failed', item))
+
+        priors = [match_prior_claim(s, claim_index) for _, s in scored]
+        unmatched = [k for k, prior in enumerate(priors) if prior is None]
+        titles = [scored[k][0].title for k in unmatched]
+        try:
+            types = _on(verdict_class, _classify, titles, classifier) if titles else []
+        except Exception:
+            log.warning('batch claim classification not admitted', exc_info=True)
+            types = ['unknown'] * len(titles)
+        claim_types = dict(zip(unmatched, types))
+
+        for k, (item, s) in enumerate(scored):
+            reported.add(item.index)
+            events.put(('submitted', item))
+            # workers keep the request's context (metrics endpoint label)
+            future = pool.submit(contextvars.copy_context().run, finish, item, s, priors[k], claim_types.get(k))
+            future.add_done_callback(lambda f, item=item: events.put(('finished', item, f)))
+
+    def score_all(pool):
+        try:
+            for offset in range(0, len(ready), chunk_size):
+                if stop.is_set():
+                    break
+                score_chunk(ready[offset:offset + chunk_size], pool)
+        except Exception as e:
+            log.error('batch scoring failed', exc_info=True)
+            for item in ready:
+                if item.index not in reported:
+                    item.error = f'scoring failed: {e}'
+                    events.put(('failed', item))
+        finally:
+            events.put(('scored',))
+
+    drawing = []
+
+    def draw():
+        nonlocal errors
+        broken = {id(result): e for result, e in pending.flush()}
+        for item, evidence in drawing:
+            error = broken.get(id(evidence['image_analysis']))
+            if error is None:
+                yield _line({'index': item.index, 'id': item.id, 'ok': True, 'result': evidence})
+            else:
+                item.error = str(error)
+                errors += 1
+                yield failed(item)
+        drawing.clear()
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='analyze_batch')
+    scorer = threading.Thread(target=contextvars.copy_context().run, args=(score_all, pool),
+                              daemon=True, name='analyze_batch-score')
+    scorer.start()
+    in_flight = 0
+    scoring = True
+    try:
+        while scoring or in_flight:
+            event = events.get()
+            kind, item = event[0], event[1] if len(event) > 1 else None
+            if kind == 'scored':
+                scoring = False
+            elif kind == 'failed':
+                errors += 1
+                yield failed(item)
+            elif kind == 'submitted':
+                in_flight += 1
+            else:
+                in_flight -= 1
+                try:
+                    evidence = event[2].result()
+                except Exception as e:
+                    item.error = str(e)
+                    errors += 1
+                    yield failed(item)
+                    continue
+                if pending.is_pending(evidence['image_analysis']):
+                    # held back until its overlay is drawn with the others
+                    drawing.append((item, evidence))
+                else:
+                    yield _line({'index': item.index, 'id': item.id, 'ok': True, 'result': evidence})
+            if drawing and (len(drawing) >= overlay_batch or not in_flight):
+                yield from draw()
+        yield from draw()
+    finally:
+        # also reached when the client goes away mid-stream
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    yield _line({
+        'done': True,
+        'items': len(items),
+        'succeeded': len(items) - errors,
+        'failed': errors,
+        'seconds': round(time.perf_counter() - start, 3),
+    })
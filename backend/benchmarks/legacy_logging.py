@@ -0,0 +1,43 @@
+"""
+The print() calls /analyze and video verification made per request before
+logs.py, kept verbatim as the baseline for the logging benchmark.
+"""
+
+
+def analysis_prints(title, fake_prob, fake_label, claim_type, image_analysis, web_sources):
+    print("Title:", title)
+    print("Fake Probability:", round(fake_prob,3))
+    print("Prediction:", fake_label)
+
+    print("\n===== MODEL OUTPUT =====")
+    print("Title:", title)
+    print("Fake Probability:", round(fake_prob,3))
+    print("Prediction:", fake_label)
+    print("Claim Type:", claim_type)
+
+    print("Using Grad-CAM (input gradient method)...")
+    print(f"Attention Score: {image_analysis['attention_score']:.3f}")
+    print(f"Interpretation: {image_analysis['interpretation']}")
+    print(f"Saved to: {image_analysis['file']}")
+    print(image_analysis)
+
+    print('\n===== GOOGLE CHECK ======')
+    print(f"✓ Found {len(web_sources)} related sources")
+
+    print("\n===== MODEL OUTPUT =====")
+    print("Title:", title)
+    print("Fake Probability:", round(fake_prob,3))
+    print("Prediction:", fake_label)
+    print("Claim Type:", claim_type)
+
+
+def verification_prints(questions, questions_text, response, result_text):
+    print('\n' + '=' * 60)
+    print('VIDEO VERIFICATION')
+    print('[1/2] Generating questions....')
+    print(f"Reponse questions:\n {questions_text}")
+    print('questions :\n',questions)
+    print("[2/2] Analyzing and generating verdict...")
+    print('Response :\n ',response)
+    print('response after extract json :\n',result_text)
+    print('verdict:\n',result_text['verdict'])
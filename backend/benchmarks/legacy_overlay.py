@@ -0,0 +1,43 @@
+"""
+prediction.vit_explain as it was before overlays.py: one image at a time,
+read, resized, normalized, colour-mapped, blended and encoded in turn. Kept
+verbatim as the baseline (and the reference output) for the overlays
+benchmark.
+"""
+import os
+
+import cv2
+import numpy as np
+
+import artefacts
+
+
+def vit_explain(image_path, attention_map, alpha=0.4, colormap=cv2.COLORMAP_JET):
+    img = cv2.imread(image_path)
+    if img is None:
+        raise ValueError(f"Could not load image from {image_path}")
+    img = cv2.resize(img, (224, 224))
+    
+    # Resize attention map to match image
+    heatmap = cv2.resize(attention_map, (224, 224))
+    
+    # Normalize to 0-255
+    heatmap = (heatmap - heatmap.min()) / (heatmap.max() - heatmap.min() + 1e-8)
+    heatmap = np.uint8(255 * heatmap)
+    
+    # Apply colormap
+    heatmap_color = cv2.applyColorMap(heatmap, colormap)
+    
+    # Blend with original image
+    overlay = cv2.addWeighted(img, 1-alpha, heatmap_color, alpha, 0)
+    
+    # content-addressed: concurrent requests never overwrite each other's overlay
+    output_path = artefacts.store.put_image(overlay, heatmap=True)
+    
+    return {
+        "attention_score": float(attention_map.mean()),
+        "max_attention": float(attention_map.max()),
+        "std_attention": float(attention_map.std()),
+        "file": output_path,
+        "url": f"/uploads/{os.path.basename(output_path)}"
+    }
@@ -0,0 +1,166 @@
+"""
+The '##'-merging SHAP aggregation that attribution.py replaced, kept
+verbatim as the baseline for the shap_insights benchmark.
+"""
+
+
+def prepare_shap_for_frontend(shap_insights,title,tokenizer,values):
+    try:
+        token_ids = tokenizer.encode(title,add_special_tokens = True)
+        token_words = tokenizer.convert_ids_to_tokens(token_ids)
+
+        highlighted_segments = []
+        min_len = min(len(values),len(token_words))
+
+        current_word = ''
+        current_impact = 0
+
+        for i in range(min_len):
+            token = token_words[i]
+            impact =float(values[i])
+
+            if token in ['[CLS]', '[SEP]', '[PAD]']:
+                continue
+            if token.startswith('##'):
+                # Continuation of previous word
+                current_word += token.replace('##', '')
+                current_impact += impact
+            else:
+                if current_word and abs(current_impact) > 1e-8:
+                    highlighted_segments.append({
+                        'text': current_word,
+                        'impact': current_impact,
+                        'color_intensity': min(abs(current_impact) * 10, 1.0),
+                        'type': 'fake' if current_impact > 0 else 'real'
+                    })
+                current_word = token
+                current_impact = impact
+        
+        if current_word and abs(current_impact) > 1e-8:
+            highlighted_segments.append({
+                'text': current_word,
+                'impact': current_impact,
+                'color_intensity': min(abs(current_impact) * 10, 1.0),
+                'type': 'fake' if current_impact > 0 else 'real'
+            })
+
+        frontend_data = {
+            'highlighted_text': highlighted_segments,
+            'token_count': len([t for t in token_words if t not in ['[CLS]', '[SEP]', '[PAD]']])
+            
+        }
+        return frontend_data
+    
+    except Exception as e:
+        print(f"Frontend prep error: {e}")
+        return {
+            'highlighted_text': [],
+            'token_count': 0,
+            'overall_sentiment': 'neutral'
+        }
+    
+
+def extract_shap_insights(shap_values,title,tokenizer,top_n=5):
+    try:
+        values = shap_values.values
+        data = shap_values.data
+
+        print(f"\nDEBUG SHAP:")
+        print(f"Values shape: {values.shape if hasattr(values, 'shape') else type(values)}")
+        print(f"Data shape: {data.shape if hasattr(data, 'shape') else type(data)}")
+
+        tokens = tokenizer.tokenize(title)
+        token_ids = tokenizer.encode(title,add_special_tokens = True)
+        token_words = tokenizer.convert_ids_to_tokens(token_ids)
+
+        insights = {
+            'important_words' : [],
+            'positive_contributors':[],
+            'negative_contributors':[],
+            'all_tokens': []
+        }
+
+        if len(values) == 0 or len(token_words) == 0:
+            print("Warning: No SHAP values or tokens found")
+            return insights
+        
+        min_len = min(len(values),len(token_words))
+
+        token_impacts= []
+        for i in range(min_len):
+            token = token_words[i]
+            impact = float(values[i])
+
+            if token not in ['[CLS]', '[SEP]', '[PAD]'] and abs(impact) > 1e-8:
+                token_impacts.append({
+                    'token': token,
+                    'impact': impact,
+                    'abs_impact': abs(impact),
+                    'position' : i
+                })
+
+        token_impacts.sort(key=lambda x:x['abs_impact'],reverse=True)
+
+        top_tokens = token_impacts[:top_n]
+
+        for token_info in top_tokens:
+            token = token_info['token']
+            impact = token_info['impact']
+
+            clean_token = token.replace('##', '')
+
+            insights['important_words'].append({
+                'word':clean_token,
+                "impact":impact
+            })
+
+            insights['all_tokens'].append(token_info)
+
+            if impact  > 0:
+                insights['positive_contributors'].append(clean_token)
+            else:
+                insights['negative_contributors'].append(clean_token)
+        print(insights)
+
+        reconstructed_words =[]
+        current_word = ''
+        current_impact = 0
+        for token_info in top_tokens:
+            token = token_info['token']
+            impact = token_info['impact']
+
+            if token.startswith('##'):
+                current_word +=token.replace('##','')
+                current_impact +=impact
+            else:
+                if current_word:
+                    reconstructed_words.append({
+                        'word':current_word,
+                        'impact':current_impact
+                    })
+                current_word = token
+                current_impact = impact
+        
+        if current_word:
+            reconstructed_words.append({
+                'word':current_word,
+                'impact':current_impact
+            })
+        
+        insights['reconstructed_words'] = reconstructed_words
+        frontend_data = prepare_shap_for_frontend(insights, title, tokenizer, values)
+        insights['frontend_display'] = frontend_data
+
+        return insights
+    
+    except Exception as e:
+        print(f"SHAP extraction error: {e}")
+        return {
+            'important_words': [],
+            'positive_contributors': [],
+            'negative_contributors': [],
+            'frontend_display': {
+                'highlighted_text': [],
+                'token_count': 0
+            }
+        }
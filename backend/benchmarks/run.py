@@ -0,0 +1,514 @@
+"""
+Benchmarks for the inference and explanation hot paths.
+
+Run from the backend directory:
+
+    python -m benchmarks.run                      # everything, JSON to stdout
+    python -m benchmarks.run --only forward shap  # a subset
+    python -m benchmarks.run --out bench.json     # save for later comparison
+
+Weights are random and every external service is stubbed, so numbers are
+comparable across machines of the same kind but say nothing about accuracy.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import torch
+
+from loadtest.fakes import install
+from sandbox import use_temp_state
+
+# before anything imports artefacts / jobs: a benchmark run must not write into uploads/
+use_temp_state('bench_state_')
+
+from benchmarks import stubs  # noqa: E402
+
+BATCH_SIZES = (1, 8, 32)
+SEQ_LENS = (16, 64, 128)
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def decorator(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return decorator
+
+
+def measure(fn, repeat=5, warmup=1, items=1):
+    """Time fn() `repeat` times after `warmup` untimed calls."""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    mean = statistics.fmean(times)
+    return {
+        'repeat': repeat,
+        'mean_ms': mean * 1000,
+        'p50_ms': times[len(times) // 2] * 1000,
+        'p95_ms': times[min(len(times) - 1, int(round(0.95 * (len(times) - 1))))] * 1000,
+        'min_ms': times[0] * 1000,
+        'items_per_sec': items / mean if mean > 0 else None,
+    }
+
+
+class Context:
+    """Lazily built shared fixtures so --only runs stay cheap."""
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self._tokenizer = None
+        self._model = None
+        self.tmpdir = tempfile.mkdtemp(prefix='bench_')
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            self._tokenizer = stubs.make_tokenizer()
+        return self._tokenizer
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = stubs.make_model(self.tokenizer)
+        return self._model
+
+
+@benchmark('forward')
+def bench_forward(ctx):
+    results = []
+    vocab = len(ctx.tokenizer)
+    for bs in BATCH_SIZES:
+        for seq in SEQ_LENS:
+            stubs.seed_everything()
+            ids = torch.randint(5, vocab, (bs, seq))
+            mask = torch.ones(bs, seq, dtype=torch.long)
+            img = torch.randn(bs, 3, 224, 224)
+
+            def run():
+                with torch.no_grad():
+                    ctx.model(ids, mask, img)
+
+            stats = measure(run, repeat=ctx.repeat, items=bs)
+            results.append({'batch_size': bs, 'seq_len': seq, **stats})
+    return results
+
+
+@benchmark('cross_attention')
+def bench_cross_attention(ctx):
+    from model import CrossAttention
+    stubs.seed_everything()
+    cross = CrossAttention(768, 768, 512).eval()
+    results = []
+    for bs in BATCH_SIZES:
+        t = torch.randn(bs, 768)
+        i = torch.randn(bs, 768)
+
+        def run():
+            with torch.no_grad():
+                cross(t, i)
+
+        stats = measure(run, repeat=max(ctx.repeat, 50), items=bs)
+        results.append({'batch_size': bs, **stats})
+    return results
+
+
+@benchmark('shap')
+def bench_shap(ctx):
+    import shap
+    from prediction import make_text_predict
+    text_predict = make_text_predict(ctx.model, ctx.tokenizer)
+    results = []
+    for n_words in (8, 16):
+        title = stubs.make_title(n_words)
+        masker = shap.maskers.Text(ctx.tokenizer)
+        calls = {'texts': 0}
+
+        def counting_predict(texts):
+            calls['texts'] += len(texts)
+            return text_predict(texts)
+
+        explainer = shap.Explainer(counting_predict, masker)
+
+        def run():
+            explainer([title])
+
+        stats = measure(run, repeat=max(1, ctx.repeat // 2), warmup=0)
+        evaluated = calls['texts'] / stats['repeat']
+        stats['texts_per_explanation'] = evaluated
+        stats['texts_per_sec'] = evaluated / (stats['mean_ms'] / 1000)
+        results.append({'n_words': n_words, **stats})
+    return results
+
+
+@benchmark('gradcam')
+def bench_gradcam(ctx):
+    from model import GradCAMViT
+    stubs.seed_everything()
+    explainer = GradCAMViT(ctx.model.image_model)
+    img = torch.randn(1, 3, 224, 224)
+    cam = explainer.generate_cam(img)
+    assert cam.max() > cam.min(), 'Grad-CAM map is flat'
+    return [measure(lambda: explainer.generate_cam(img), repeat=ctx.repeat)]
+
+
+@benchmark('rollout')
+def bench_rollout(ctx):
+    from model import VITAttentionrollout
+    stubs.seed_everything()
+    explainer = VITAttentionrollout(ctx.model.image_model)
+    img = torch.randn(1, 3, 224, 224)
+    return [measure(lambda: explainer.rollout(img), repeat=ctx.repeat)]
+
+
+@benchmark('overlays')
+def bench_overlays(ctx):
+    """
+    Grad-CAM overlays per second: overlays.render for a batch against the
+    old vit_explain called once per image. 'paths' reads the images from
+    disk as /analyze does; 'decoded' passes the PIL images batch.run already
+    has. 'identical' counts overlays whose content-addressed name (so,
+    bytes) matches the old one.
+    """
+    from PIL import Image
+    import artefacts
+    import overlays
+    from benchmarks import legacy_overlay
+
+    rng = np.random.default_rng(stubs.SEED)
+    store = artefacts.ArtefactStore(artefacts.ArtefactConfig(directory=os.path.join(ctx.tmpdir, 'overlays')))
+    saved, artefacts.store = artefacts.store, store
+    results = []
+    try:
+        paths = [stubs.make_image(os.path.join(ctx.tmpdir, f'overlay_{i}.jpg'), seed=stubs.SEED + i)
+                 for i in range(max(BATCH_SIZES))]
+        # GradCAMViT output: |input gradient| averaged over RGB, scaled to [0, 1]
+        cams = [np.abs(rng.normal(size=(224, 224))).astype(np.float32) for _ in paths]
+        cams = [c / c.max() for c in cams]
+        images = [Image.open(p).convert('RGB') for p in paths]
+        for bs in BATCH_SIZES:
+            batch_cams = cams[:bs]
+            repeat = max(ctx.repeat, 10)
+            legacy = measure(lambda: [legacy_overlay.vit_explain(p, c) for p, c in zip(paths, batch_cams)],
+                             repeat=repeat, items=bs)
+            before = [legacy_overlay.vit_explain(p, c) for p, c in zip(paths, batch_cams)]
+            for source, sources in (('paths', paths[:bs]), ('decoded', images[:bs])):
+                current = measure(lambda: overlays.render(sources, batch_cams), repeat=repeat, items=bs)
+                after = overlays.render(sources, batch_cams)
+                results.append({
+                    'batch_size': bs,
+                    'source': source,
+                    'legacy_overlays_per_sec': legacy['items_per_sec'],
+                    'overlays_per_sec': current['items_per_sec'],
+                    'speedup': legacy['mean_ms'] / current['mean_ms'],
+                    'identical': sum(a == b for a, b in zip(before, after)),
+                    **current,
+                })
+    finally:
+        artefacts.store = saved
+    return results
+
+
+@benchmark('shap_insights')
+def bench_shap_insights(ctx):
+    """Word aggregation of SHAP values on long titles: attribution.py against the old '##' merging."""
+    import attribution
+    from benchmarks import legacy_shap
+
+    class Explanation:
+        def __init__(self, values, data):
+            self.values = values
+            self.data = data
+
+    results = []
+    rng = random.Random(stubs.SEED)
+    for n_words, split in ((16, False), (64, False), (256, False), (64, True), (256, True)):
+        title = stubs.make_title(n_words)
+        if split:
+            # out-of-vocabulary words: several WordPiece pieces each, as MuRIL does with rare Kannada words
+            title = ' '.join(''.join(rng.sample(w, len(w))) for w in title.split())
+        n_tokens = len(ctx.tokenizer.encode(title))
+        # shape SHAP returns for the (B, 1) text_predict output
+        values = np.random.default_rng(stubs.SEED).normal(size=(n_tokens, 1))
+        explanation = Explanation(values, np.array([''] * n_tokens))
+        repeat = max(ctx.repeat, 50)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            legacy = measure(lambda: legacy_shap.extract_shap_insights(explanation, title, ctx.tokenizer), repeat=repeat)
+        current = measure(lambda: attribution.shap_insights(values, title, ctx.tokenizer), repeat=repeat)
+        results.append({
+            'n_words': n_words,
+            'n_tokens': n_tokens,
+            'subword_pieces': split,
+            'legacy_mean_ms': legacy['mean_ms'],
+            'speedup': legacy['mean_ms'] / current['mean_ms'],
+            **current,
+        })
+    return results
+
+
+@benchmark('tokenization')
+def bench_tokenization(ctx):
+    """
+    Tokens/sec for what /analyze tokenizes: the title for the forward pass
+    plus its offsets for SHAP, and SHAP's batches of masked variants.
+    'direct' is the tokenizer called per use, as before tokenization.py.
+    """
+    import tokenization
+
+    slow = stubs.make_slow_tokenizer(ctx.tmpdir)
+    fast = ctx.tokenizer
+    repeat = max(ctx.repeat, 50)
+    results = []
+
+    def direct(tokenizer, title):
+        tokenizer([title], padding=True, truncation=True, max_length=128, return_tensors='pt')
+        if tokenizer.is_fast:
+            tokenizer(title, add_special_tokens=True, return_offsets_mapping=True)
+        else:
+            tokenizer.tokenize(title)
+
+    def cold(title):
+        tokenization.cache_for(fast).items.clear()
+        tokenization.encode_batch(fast, [title])
+        tokenization.encode(fast, title)
+
+    def warm(title):
+        tokenization.encode_batch(fast, [title])
+        tokenization.encode(fast, title)
+
+    for n_words in (12, 64):
+        title = stubs.make_title(n_words)
+        n_tokens = 2 * len(fast.encode(title))
+        for path, fn in (('direct_slow', lambda: direct(slow, title)),
+                         ('direct_fast', lambda: direct(fast, title)),
+                         ('service_cold', lambda: cold(title)),
+                         ('service_memoized', lambda: warm(title))):
+            r = measure(fn, repeat=repeat, items=n_tokens)
+            results.append({'case': 'title', 'path': path, 'n_words': n_words,
+                            'tokens_per_sec': r['items_per_sec'], **r})
+
+    # SHAP's partition explainer scores batches of the title with words masked out
+    rng = random.Random(stubs.SEED)
+    words = stubs.make_title(24).split()
+    variants = [' '.join(w if rng.random() > 0.5 else '[MASK]' for w in words) for _ in range(64)]
+    n_tokens = sum(len(fast.encode(v)) for v in variants)
+    for path, fn in (('direct_slow', lambda: slow(variants, padding=True, truncation=True, max_length=128,
+                                                  return_tensors='pt')),
+                     ('direct_fast', lambda: fast(variants, padding=True, truncation=True, max_length=128,
+                                                  return_tensors='pt')),
+                     ('service_batch', lambda: tokenization.encode_batch(fast, variants, memo=False))):
+        r = measure(fn, repeat=max(ctx.repeat, 20), items=n_tokens)
+        results.append({'case': 'shap_batch', 'path': path, 'batch': len(variants),
+                        'tokens_per_sec': r['items_per_sec'], **r})
+    return results
+
+
+class SlowSink:
+    """stdout under back-pressure: each write blocks the writer (and holds the stream) for delay_s."""
+    def __init__(self, delay_s):
+        self.delay_s = delay_s
+        self.lock = threading.Lock()
+
+    def write(self, text):
+        with self.lock:
+            time.sleep(self.delay_s)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+@benchmark('logging')
+def bench_logging(ctx, threads=8, requests_per_thread=200):
+    """
+    Per-request cost of what /analyze and a video verification log, from
+    `threads` concurrent request threads: the old print() calls against
+    logs.py's queue. Sinks are /dev/null and a stdout whose writes block
+    for 200us (container log back-pressure). For logs.py, 'drain_s' is
+    how long the listener needs afterwards; records past LOG_QUEUE_SIZE
+    are dropped, not waited for.
+    """
+    import logging
+    import logs
+    from benchmarks import legacy_logging
+
+    title = stubs.make_title(16)
+    image_analysis = {'attention_score': 0.42, 'max_attention': 1.0, 'std_attention': 0.13,
+                      'file': 'uploads/' + 'ab' * 32 + '.jpg', 'url': '/uploads/' + 'ab' * 32 + '.jpg',
+                      'interpretation': 'Model attention concentrated on multiple areas', 'method': 'gradcam'}
+    web_sources = [{'title': stubs.make_title(10, seed=i), 'snippet': stubs.make_title(40, seed=i),
+                    'link': f'https://example.com/{i}'} for i in range(10)]
+    questions = [f'SKEPTIC: {stubs.make_title(12, seed=i)}' for i in range(6)]
+    result = {'answers': [{'question': q, 'answer': stubs.make_title(60, seed=i)} for i, q in enumerate(questions)],
+              'verdict': {'classification': 'FAKE', 'confidence': 80, 'key_reasons': questions[:3],
+                          'recommendation': stubs.make_title(20)}}
+    response_text = json.dumps(result, ensure_ascii=False, indent=2)
+    questions_text = json.dumps({'questions': questions}, ensure_ascii=False, indent=2)
+
+    def legacy_request():
+        legacy_logging.analysis_prints(title, 0.734, 'FAKE', 'politics', image_analysis, web_sources)
+        legacy_logging.verification_prints(questions, questions_text, response_text, result)
+
+    plog, vlog = logs.get('prediction'), logs.get('video')
+
+    def current_request():
+        # the statements finish_analysis and VideoVerifier.verify make now
+        plog.info('model output', extra=logs.fields(title=logs.payload(title, 120), fake_prob=0.734,
+                                                     prediction='FAKE', claim_type='politics'))
+        plog.info('image analysis', extra=logs.fields(attention_score=0.42, interpretation=image_analysis['interpretation'],
+                                                      file=image_analysis['file']))
+        plog.info('web check', extra=logs.fields(sources=len(web_sources)))
+        if plog.isEnabledFor(logging.DEBUG) and logs.sampled():
+            plog.debug('evidence', extra=logs.fields(evidence=logs.payload(image_analysis)))
+        vlog.info('video verification')
+        vlog.info('questions', extra=logs.fields(count=len(questions), questions=logs.payload(questions, 500)))
+        if vlog.isEnabledFor(logging.DEBUG) and logs.sampled():
+            vlog.debug('analysis response', extra=logs.fields(text=logs.payload(response_text)))
+        vlog.info('analysis', extra=logs.fields(result=logs.payload(result, 300)))
+        vlog.info('video verdict', extra=logs.fields(verdict=logs.payload(result['answers'], 500)))
+
+    def drive(fn):
+        per_request = []
+        lock = threading.Lock()
+
+        def worker():
+            local = []
+            for _ in range(requests_per_thread):
+                start = time.perf_counter()
+                fn()
+                local.append(time.perf_counter() - start)
+            with lock:
+                per_request.extend(local)
+
+        start = time.perf_counter()
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        wall = time.perf_counter() - start
+        per_request.sort()
+        n = len(per_request)
+        return {
+            'requests': n,
+            'threads': threads,
+            'wall_s': wall,
+            'requests_per_sec': n / wall,
+            'mean_us': statistics.fmean(per_request) * 1e6,
+            'p50_us': per_request[n // 2] * 1e6,
+            'p99_us': per_request[min(n - 1, int(0.99 * n))] * 1e6,
+        }
+
+    results = []
+    for sink_name, make_sink in (('devnull', lambda: open(os.devnull, 'w', encoding='utf-8')),
+                                 ('slow_stdout', lambda: SlowSink(200e-6))):
+        sink = make_sink()
+        with contextlib.redirect_stdout(sink):
+            results.append({'sink': sink_name, 'path': 'print', **drive(legacy_request)})
+
+        sink = make_sink()
+        dropped_before = sum(logs.DROPPED.series.values())
+        logs.setup(stream=sink, level='INFO', fmt='json')
+        try:
+            r = drive(current_request)
+            start = time.perf_counter()
+        finally:
+            logs.shutdown()
+        r['drain_s'] = time.perf_counter() - start
+        r['dropped'] = sum(logs.DROPPED.series.values()) - dropped_before
+        results.append({'sink': sink_name, 'path': 'logs_queue', **r})
+    logs.setup(stream=sys.stdout)
+    return results
+
+
+@benchmark('analyze_endpoint')
+def bench_analyze_endpoint(ctx):
+    from fastapi.testclient import TestClient
+    import server
+
+    install()
+    server.model = ctx.model
+    server.tokenizer = ctx.tokenizer
+    server.classifier = stubs.stub_classifier()
+
+    image_path = stubs.make_image(os.path.join(ctx.tmpdir, 'bench.jpg'))
+    title = stubs.make_title(12)
+    client = TestClient(server.app)   # no context manager: skip load_model()
+
+    def run():
+        with open(image_path, 'rb') as f:
+            r = client.post('/analyze', data={'title': title}, files={'image': ('bench.jpg', f, 'image/jpeg')})
+        r.raise_for_status()
+        return r.json()
+
+    # doubles as the warmup call; a flat map (max == min) has no spread
+    image_analysis = run()['image_analysis']
+    assert image_analysis.get('method') != 'gradcam' or image_analysis['std_attention'] > 0, 'Grad-CAM map is flat'
+    return [measure(run, repeat=max(1, ctx.repeat // 2), warmup=0)]
+
+
+def environment():
+    try:
+        rev = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=False
+        ).stdout.strip()
+    except OSError:
+        rev = ''
+    return {
+        'git_rev': rev,
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'torch_threads': torch.get_num_threads(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', nargs='*', choices=sorted(BENCHMARKS), help='benchmarks to run')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--threads', type=int, default=None, help='torch.set_num_threads')
+    parser.add_argument('--out', default=None, help='write JSON here instead of stdout')
+    args = parser.parse_args(argv)
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    stubs.seed_everything()
+
+    ctx = Context(repeat=args.repeat)
+    report = {'environment': environment(), 'results': {}}
+    # the code under test prints freely; keep stdout clean for the JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        for name in args.only or BENCHMARKS:
+            print(f'running {name}...')
+            report['results'][name] = BENCHMARKS[name](ctx)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Offline stand-ins for the benchmark suite: a randomly initialised
+FakeNewsModel, a small local WordPiece tokenizer and a zero-shot classifier.
+External services are faked by loadtest/fakes.py. Nothing here touches
+best_model.pth, the network or a GPU.
+"""
+import os
+import random
+
+import numpy as np
+import torch
+from PIL import Image
+from tokenizers import Tokenizer, decoders, models, normalizers, pre_tokenizers, processors
+from transformers import BertConfig, BertTokenizer, PreTrainedTokenizerFast
+
+from model import FakeNewsModel
+from prediction import CLAIM_TYPES
+
+SEED = 1234
+
+KANNADA_WORDS = [
+    'ರಾಹುಲ್', 'ಗಾಂಧಿ', 'ಪ್ರಭು', 'ಶ್ರೀರಾಮನಿದ್ದಂತೆ', 'ಶೋಷಿತರಿಗೆ', 'ನ್ಯಾಯ',
+    'ಒದಗಿಸುತ್ತಿದ್ದಾರೆ', 'ನಾನಾ', 'ಪಟೋಲೆ', 'ಸರ್ಕಾರ', 'ಚುನಾವಣೆ', 'ಬೆಂಗಳೂರು',
+    'ಮುಖ್ಯಮಂತ್ರಿ', 'ಸುದ್ದಿ', 'ಪೊಲೀಸ್', 'ಕ್ರಿಕೆಟ್', 'ಆರೋಗ್ಯ', 'ಶಾಲೆ',
+]
+
+
+def seed_everything(seed=SEED):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+def _vocab():
+    vocab = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]']
+    vocab += KANNADA_WORDS
+    pieces = set()
+    for w in KANNADA_WORDS:
+        for ch in w:
+            pieces.add(ch)
+            pieces.add('##' + ch)
+    return vocab + sorted(pieces)
+
+
+def make_tokenizer():
+    """WordPiece tokenizer over a small Kannada vocabulary, built on the fly."""
+    vocab = _vocab()
+    tk = Tokenizer(models.WordPiece(vocab={t: i for i, t in enumerate(vocab)}, unk_token='[UNK]'))
+    tk.normalizer = normalizers.BertNormalizer(lowercase=False, strip_accents=False)
+    tk.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    tk.post_processor = processors.TemplateProcessing(
+        single='[CLS] $A [SEP]',
+        pair='[CLS] $A [SEP] $B:1 [SEP]:1',
+        special_tokens=[('[CLS]', 2), ('[SEP]', 3)]
+    )
+    tk.decoder = decoders.WordPiece()
+    return PreTrainedTokenizerFast(
+        tokenizer_object=tk,
+        unk_token='[UNK]', pad_token='[PAD]', cls_token='[CLS]',
+        sep_token='[SEP]', mask_token='[MASK]'
+    )
+
+
+def make_slow_tokenizer(tmpdir):
+    """The same vocabulary as make_tokenizer() behind the pure-Python BertTokenizer."""
+    path = os.path.join(tmpdir, 'vocab.txt')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(_vocab()) + '\n')
+    return BertTokenizer(path, do_lower_case=False, strip_accents=False)
+
+
+def make_model(tokenizer):
+    """MuRIL-base shaped encoder (12 x 768) and ViT-B/16, random weights."""
+    seed_everything()
+    config = BertConfig(vocab_size=len(tokenizer))
+    model = FakeNewsModel(
+        num_claims=len(CLAIM_TYPES),
+        text_config=config,
+        pretrained=False
+    )
+    model.eval()
+    return model
+
+
+def make_title(n_words, seed=SEED):
+    rng = random.Random(seed)
+    return ' '.join(rng.choice(KANNADA_WORDS) for _ in range(n_words))
+
+
+def make_image(path, size=(640, 480), seed=SEED):
+    rng = np.random.default_rng(seed)
+    arr = rng.integers(0, 256, size=(size[1], size[0], 3), dtype=np.uint8)
+    Image.fromarray(arr).save(path, format='JPEG')
+    return path
+
+
+class StubClassifier:
+    """Zero-shot pipeline replacement returning a fixed ranking."""
+    def __call__(self, text, labels, hypothesis_template=None):
+        result = {'labels': list(labels), 'scores': [1.0 / len(labels)] * len(labels)}
+        # like the transformers pipeline: a list of sequences gets a list of results
+        return [dict(result) for _ in text] if isinstance(text, list) else result
+
+
+def stub_classifier():
+    return StubClassifier()
+
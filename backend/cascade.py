@@ -0,0 +1,67 @@
+"""
+Confidence-based cascade for /analyze.
+
+Stage 1 scores the title alone: the MuRIL CLS embedding goes through the
+fusion heads with the cached blank-image embedding, exactly as SHAP's
+text_predict does. If that probability falls outside the uncertain band
+[CASCADE_LOW, CASCADE_HIGH], the verdict is returned straight away. The
+image encoder, SHAP and Grad-CAM are skipped. Only titles inside the band
+go on to the full multimodal model and the explainers.
+
+Off by default; enable with CASCADE_ENABLED=1.
+"""
+import os
+from dataclasses import dataclass
+
+import torch
+
+
+@dataclass
+class CascadeConfig:
+    enabled: bool = False
+    low: float = 0.2
+    high: float = 0.8
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            enabled=os.getenv('CASCADE_ENABLED', '0') == '1',
+            low=float(os.getenv('CASCADE_LOW', '0.2')),
+            high=float(os.getenv('CASCADE_HIGH', '0.8')),
+        )
+
+    def resolves(self, prob):
+        """True if a stage-1 probability is confident enough to stop."""
+        return prob < self.low or prob > self.high
+
+
+def text_stage(model, text_emb):
+    """Stage-1 fake probability for a batch of CLS embeddings."""
+    with torch.no_grad():
+        blank = model.blank_image_embedding().expand(text_emb.shape[0], -1)
+        fake_out, _ = model.heads(text_emb, blank)
+    return fake_out.squeeze(-1)
+
+
+def skipped_shap_insights():
+    return {
+        'important_words': [],
+        'positive_contributors': [],
+        'negative_contributors': [],
+        'frontend_display': {
+            'highlighted_text': [],
+            'token_count': 0
+        }
+    }
+
+
+def skipped_image_analysis(reason='Skipped: text-only verdict was confident'):
+    return {
+        'attention_score': 0.0,
+        'max_attention': 0.0,
+        'std_attention': 0.0,
+        'file': '',
+        'url': '',
+        'interpretation': reason,
+        'method': 'skipped'
+    }
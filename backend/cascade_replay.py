@@ -0,0 +1,131 @@
+"""
+Offline replay for the /analyze cascade.
+
+Scores a labelled dataset once with both the text-only first stage and the
+full multimodal model, then reports each uncertain band against it. For
+each band it shows how much traffic stage 1 resolves and how the cascade's
+accuracy compares to always running the full model.
+
+    python cascade_replay.py --data replay.jsonl
+    python cascade_replay.py --data replay.jsonl --bands 0.1,0.9 0.2,0.8 0.3,0.7
+
+Each line of the data file: {"title": ..., "image": <path>, "label": "FAKE" | "REAL" | 1 | 0}.
+Image paths are relative to the data file. The checkpoint follows
+MODEL_VARIANT and VIT_TOKEN_REDUCTION is applied, as in server.py, so the
+replay scores what the server would. --random-weights runs with an
+untrained model and the benchmark tokenizer, as a smoke test.
+"""
+import argparse
+import json
+import os
+import sys
+
+import torch
+from PIL import Image
+
+import token_merging
+from cascade import text_stage
+from prediction import (img_transform, CLAIM_TYPES, MODEL_PATH, STUDENT_MODEL_PATH, MODEL_VARIANT,
+                        TEXT_MODEL, DEVICE)
+
+DEFAULT_BANDS = ['0.1,0.9', '0.2,0.8', '0.3,0.7', '0.4,0.6']
+
+
+def load_rows(path):
+    base = os.path.dirname(os.path.abspath(path))
+    rows = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            label = row['label']
+            row['label'] = int(label == 'FAKE' or label == 1 or label == '1')
+            row['image'] = os.path.join(base, row['image'])
+            rows.append(row)
+    return rows
+
+
+def load(random_weights):
+    """The model and tokenizer the server would serve, with its ViT token reduction."""
+    if random_weights:
+        from benchmarks import stubs
+        tokenizer = stubs.make_tokenizer()
+        model = stubs.make_model(tokenizer)
+    else:
+        import tokenization
+        from model import load_checkpoint
+        model_path = STUDENT_MODEL_PATH if MODEL_VARIANT == 'student' else MODEL_PATH
+        model = load_checkpoint(model_path, num_claims=len(CLAIM_TYPES), device=DEVICE)
+        tokenizer = tokenization.load(TEXT_MODEL)
+    reduction = token_merging.TokenReduction.from_env()
+    if reduction.enabled:
+        token_merging.apply(model.image_model, reduction)
+    return model, tokenizer
+
+
+def score(rows, model, tokenizer, batch_size=16):
+    """(text_prob, full_prob) for every row."""
+    text_probs, full_probs = [], []
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        enc = tokenizer(
+            [r['title'] for r in batch],
+            padding=True, truncation=True, max_length=128, return_tensors='pt'
+        ).to(DEVICE)
+        imgs = torch.stack([
+            img_transform(Image.open(r['image']).convert('RGB')) for r in batch
+        ]).to(DEVICE)
+        with torch.no_grad():
+            txt = model.encode_text(enc['input_ids'], enc['attention_mask'])
+            text_probs.extend(text_stage(model, txt).cpu().tolist())
+            fake_out, _ = model.heads(txt, model.encode_image(imgs))
+            full_probs.extend(fake_out.squeeze(-1).cpu().tolist())
+        print(f'scored {min(start + batch_size, len(rows))}/{len(rows)}', file=sys.stderr)
+    return text_probs, full_probs
+
+
+def replay(labels, text_probs, full_probs, low, high):
+    n = len(labels)
+    resolved = 0
+    correct_full = correct_cascade = agree = 0
+    for y, tp, fp in zip(labels, text_probs, full_probs):
+        early = tp < low or tp > high
+        final = tp if early else fp
+        resolved += early
+        correct_full += int((fp > 0.5) == bool(y))
+        correct_cascade += int((final > 0.5) == bool(y))
+        agree += int((final > 0.5) == (fp > 0.5))
+    return {
+        'band': [low, high],
+        'stage1_resolved': resolved / n,
+        'stage2_traffic': (n - resolved) / n,
+        'accuracy_full': correct_full / n,
+        'accuracy_cascade': correct_cascade / n,
+        'accuracy_delta': (correct_cascade - correct_full) / n,
+        'agreement_with_full': agree / n,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', required=True)
+    parser.add_argument('--bands', nargs='*', default=DEFAULT_BANDS, help='low,high pairs')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--random-weights', action='store_true')
+    args = parser.parse_args()
+
+    rows = load_rows(args.data)
+    model, tokenizer = load(args.random_weights)
+    text_probs, full_probs = score(rows, model, tokenizer, args.batch_size)
+    labels = [r['label'] for r in rows]
+
+    report = {'samples': len(rows), 'bands': []}
+    for band in args.bands:
+        low, high = (float(x) for x in band.split(','))
+        report['bands'].append(replay(labels, text_probs, full_probs, low, high))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+"""
+Near-duplicate claim index over MuRIL CLS embeddings.
+
+Reworded copies of an already-checked headline land close to it in the
+text encoder's CLS space. Each analysed title is stored here with its
+verdict, and a new title whose cosine similarity to a stored one is above
+CLAIM_MATCH_THRESHOLD reuses that claim's web sources and claim type.
+This skips SerpAPI and the zero-shot classifier.
+
+On disk (CLAIM_INDEX_DIR/<model fingerprint>/):
+    embeddings.f16   fixed-size float16 memmap, CAPACITY x dim, L2-normalised
+    records.jsonl    append-only slot records (title + verdict)
+    state.json       number of used slots, the next slot to write and the
+                     fingerprint of the model that wrote the embeddings
+
+Embeddings are only comparable within one text encoder, so each model
+(model.model_fingerprint: embedding sizes + checkpoint hash) gets its own
+directory, and an index refuses to open for a different fingerprint.
+
+Memory is bounded by CAPACITY: once full, the oldest slot is overwritten.
+Searches run on a float32 copy of the embeddings held in memory (NumPy's
+float16 matmul is over ten times slower) and outside the index lock, so
+concurrent /analyze requests do not queue behind each other's lookups.
+records.jsonl is compacted to the live slots once it holds more than
+twice CAPACITY lines; `python claim_index.py rebuild` does the same on
+demand, and with --reembed it recomputes every embedding with the current
+model.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+CLAIM_INDEX_DIR = os.getenv('CLAIM_INDEX_DIR', 'claim_index')
+CLAIM_INDEX_CAPACITY = int(os.getenv('CLAIM_INDEX_CAPACITY', '50000'))
+CLAIM_MATCH_THRESHOLD = float(os.getenv('CLAIM_MATCH_THRESHOLD', '0.95'))
+EMBED_DIM = 768
+SEARCH_CHUNK = 8192
+
+
+class ClaimIndex:
+    def __init__(self, directory=CLAIM_INDEX_DIR, capacity=CLAIM_INDEX_CAPACITY,
+                 threshold=CLAIM_MATCH_THRESHOLD, dim=EMBED_DIM, model=None):
+        self.directory = directory
+        self.capacity = capacity
+        self.threshold = threshold
+        self.dim = dim
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        self.emb_path = os.path.join(directory, 'embeddings.f16')
+        self.records_path = os.path.join(directory, 'records.jsonl')
+        self.state_path = os.path.join(directory, 'state.json')
+
+        state = {'count': 0, 'next_slot': 0, 'capacity': capacity, 'dim': dim, 'model': model}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state['dim'] != dim or (model and state.get('model') and state['model'] != model):
+                raise ValueError(
+                    f"index at {directory} holds embeddings of model {state.get('model')} (dim={state['dim']}), "
+                    f"not {model} (dim={dim}); use a separate CLAIM_INDEX_DIR or rebuild it with --reembed"
+                )
+            if state['capacity'] != capacity:
+                raise ValueError(
+                    f"index at {directory} was built with capacity={state['capacity']}; "
+                    f"run `python claim_index.py rebuild --capacity {capacity}`"
+                )
+        self.model = state.get('model') or model
+        self.count = state['count']
+        self.next_slot = state['next_slot']
+
+        mode = 'r+' if os.path.exists(self.emb_path) else 'w+'
+        self.embeddings = np.memmap(self.emb_path, dtype=np.float16, mode=mode, shape=(capacity, dim))
+        # what search() multiplies; np.zeros only commits the pages of used slots
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.vectors[:self.count] = self.embeddings[:self.count]
+
+        # slot -> record; only live slots are kept, so this is bounded too
+        self.records = {}
+        self.lines = 0
+        if os.path.exists(self.records_path):
+            with open(self.records_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        rec = json.loads(line)
+                        self.records[rec['slot']] = rec
+                        self.lines += 1
+
+    @classmethod
+    def for_model(cls, fingerprint, dim, base=CLAIM_INDEX_DIR, **kwargs):
+        """The index of one model, under base/<fingerprint>."""
+        return cls(os.path.join(base, fingerprint), dim=dim, model=fingerprint, **kwargs)
+
+    def __len__(self):
+        return self.count
+
+    @staticmethod
+    def normalise(vec):
+        vec = np.asarray(vec, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def _save_state(self):
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'count': self.count, 'next_slot': self.next_slot,
+                       'capacity': self.capacity, 'dim': self.dim, 'model': self.model}, f)
+        os.replace(tmp, self.state_path)
+
+    def search(self, vec, k=1):
+        """Return the k most similar stored claims as (similarity, record) pairs."""
+        q = self.normalise(vec)
+        with self.lock:
+            n = self.count
+        if n == 0:
+            return []
+        # Slots only ever fill up from 0 and are rewritten whole, so the
+        # first n rows are safe to scan without the lock; a row that add()
+        # replaces meanwhile is re-scored below.
+        best_sims = np.empty(0, dtype=np.float32)
+        best_slots = np.empty(0, dtype=np.int64)
+        for start in range(0, n, SEARCH_CHUNK):
+            sims = self.vectors[start:min(n, start + SEARCH_CHUNK)] @ q
+            top = np.argpartition(-sims, min(k, len(sims)) - 1)[:k]
+            best_sims = np.concatenate([best_sims, sims[top]])
+            best_slots = np.concatenate([best_slots, top + start])
+        order = np.argsort(-best_sims)[:k]
+        hits = []
+        with self.lock:
+            for i in order:
+                slot = int(best_slots[i])
+                rec = self.records.get(slot)
+                if rec is not None:
+                    hits.append((float(self.vectors[slot] @ q), rec))
+        hits.sort(key=lambda hit: -hit[0])
+        return hits
+
+    def match(self, vec):
+        """Best stored claim if it clears the threshold, else None."""
+        hits = self.search(vec, k=1)
+        if hits and hits[0][0] >= self.threshold:
+            sim, rec = hits[0]
+            return {**rec, 'similarity': sim}
+        return None
+
+    def add(self, vec, title, verdict):
+        """Store one claim; overwrites the oldest slot once the index is full."""
+        q = self.normalise(vec).astype(np.float16)
+        with self.lock:
+            slot = self.next_slot
+            self.embeddings[slot] = q
+            self.embeddings.flush()
+            self.vectors[slot] = q
+            rec = {'slot': slot, 'title': title, 'verdict': verdict, 'added_at': time.time()}
+            self.records[slot] = rec
+            with open(self.records_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(rec, ensure_ascii=False) + '\n')
+            self.lines += 1
+            self.next_slot = (slot + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+            if self.lines > 2 * self.capacity:
+                # every overwrite of a slot appended another line
+                self._compact()
+            self._save_state()
+        return slot
+
+    def _compact(self):
+        """Rewrite records.jsonl as one line per live slot, in slot order; call with self.lock held."""
+        live = [self.records[s] for s in sorted(self.records) if s < self.count]
+        tmp = self.records_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for rec in live:
+                f.write(json.dumps(rec, ensure_ascii=False) + '\n')
+        os.replace(tmp, self.records_path)
+        self.records = {rec['slot']: rec for rec in live}
+        self.lines = len(live)
+        return live
+
+    def rebuild(self, embed_fn=None):
+        """
+        Compact records.jsonl down to live slots, in slot order.
+        embed_fn(title) -> vector re-embeds every stored title, e.g. after
+        the model checkpoint changes.
+        """
+        with self.lock:
+            live = self._compact()
+            if embed_fn is not None:
+                for rec in live:
+                    q = self.normalise(embed_fn(rec['title'])).astype(np.float16)
+                    self.embeddings[rec['slot']] = q
+                    self.vectors[rec['slot']] = q
+                self.embeddings.flush()
+            self._save_state()
+        return len(live)
+
+
+def resize(directory, capacity):
+    """Copy the newest `capacity` claims into a fresh index of that size."""
+    with open(os.path.join(directory, 'state.json'), 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    old = np.memmap(os.path.join(directory, 'embeddings.f16'), dtype=np.float16, mode='r',
+                    shape=(state['capacity'], state['dim']))
+    records = {}
+    with open(os.path.join(directory, 'records.jsonl'), 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                rec = json.loads(line)
+                records[rec['slot']] = rec
+    live = sorted((r for s, r in records.items() if s < state['count']), key=lambda r: r['added_at'])
+    live = live[-capacity:]
+    vectors = [np.array(old[r['slot']], dtype=np.float32) for r in live]
+    del old
+
+    for name in ('embeddings.f16', 'records.jsonl', 'state.json'):
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            os.remove(path)
+    index = ClaimIndex(directory, capacity=capacity, dim=state['dim'], model=state.get('model'))
+    for rec, vec in zip(live, vectors):
+        index.add(vec, rec['title'], rec['verdict'])
+    return index
+
+
+def load_text_embedder():
+    """embed(title) with the model the server loads (MODEL_VARIANT), and that model's fingerprint."""
+    import torch
+    from transformers import AutoTokenizer
+    from model import load_checkpoint, model_fingerprint
+    from prediction import CLAIM_TYPES, MODEL_PATH, STUDENT_MODEL_PATH, MODEL_VARIANT, TEXT_MODEL, DEVICE
+
+    path = STUDENT_MODEL_PATH if MODEL_VARIANT == 'student' else MODEL_PATH
+    model = load_checkpoint(path, num_claims=len(CLAIM_TYPES), device=DEVICE)
+    tokenizer = AutoTokenizer.from_pretrained(TEXT_MODEL)
+
+    def embed(title):
+        enc = tokenizer(title, truncation=True, max_length=128, return_tensors='pt').to(DEVICE)
+        with torch.no_grad():
+            return model.encode_text(enc['input_ids'], enc['attention_mask'])[0].cpu().numpy()
+    return embed, model_fingerprint(model, path)
+
+
+def open_existing(directory):
+    """An index as it was written, whatever model and size it was built for."""
+    with open(os.path.join(directory, 'state.json'), 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    return ClaimIndex(directory, capacity=state['capacity'], dim=state['dim'], model=state.get('model'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the near-duplicate claim index')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    sub.add_parser('stats')
+    rb = sub.add_parser('rebuild')
+    rb.add_argument('--reembed', action='store_true', help='recompute embeddings with the current model')
+    rb.add_argument('--capacity', type=int, default=None, help='resize the index, keeping the newest claims')
+    parser.add_argument('--dir', default=CLAIM_INDEX_DIR,
+                        help='one model\'s index (CLAIM_INDEX_DIR/<fingerprint>); stats also takes the base')
+    args = parser.parse_args()
+
+    if args.cmd == 'stats':
+        dirs = [args.dir] if os.path.exists(os.path.join(args.dir, 'state.json')) else sorted(
+            os.path.join(args.dir, d) for d in os.listdir(args.dir)
+            if os.path.exists(os.path.join(args.dir, d, 'state.json')))
+        for directory in dirs:
+            index = open_existing(directory)
+            print(json.dumps({'dir': directory, 'model': index.model, 'count': len(index),
+                              'capacity': index.capacity, 'threshold': index.threshold}))
+        return
+
+    if args.capacity is not None and args.capacity != CLAIM_INDEX_CAPACITY:
+        index = resize(args.dir, args.capacity)
+        print(f"✅ Resized index to {args.capacity} slots ({len(index)} claims kept)")
+        print(f"   set CLAIM_INDEX_CAPACITY={args.capacity} for the server")
+    else:
+        index = open_existing(args.dir)
+    embed_fn, fingerprint = load_text_embedder() if args.reembed else (None, None)
+    if fingerprint is not None:
+        index.model = fingerprint
+    kept = index.rebuild(embed_fn)
+    print(f"✅ Rebuilt claim index: {kept} claims")
+    target = os.path.join(os.path.dirname(os.path.normpath(args.dir)), fingerprint or '')
+    if fingerprint and os.path.normpath(args.dir) != target and not os.path.exists(target):
+        # re-embedded for another model: move it to where that model's server looks
+        os.replace(args.dir, target)
+        print(f"   moved to {target}")
+
+
+if __name__ == '__main__':
+    main()
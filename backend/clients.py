@@ -0,0 +1,282 @@
+"""
+Shared outbound-call layer for SerpAPI, Gemini and Sarvam.
+
+Every external call goes through an OutboundClient, which gives it
+- a bounded worker pool per service, so a hanging dependency can tie up at
+  most `max_concurrency` threads instead of every request worker
+- a hard per-service timeout (queue wait included)
+- retries with full-jitter exponential backoff
+- a circuit breaker: after `failure_threshold` consecutive failures calls
+  fail fast with CircuitOpenError for `reset_timeout` seconds, then a single
+  trial call decides whether to close again
+
+The SDKs we use are synchronous, so `call` blocks the caller; `acall` is the
+same thing for async endpoints. Callers keep their existing except-paths as
+fallbacks (open_json() questions, empty web sources), which now trigger
+immediately while a breaker is open.
+
+Settings can be overridden per service with env vars, e.g. SERPAPI_TIMEOUT,
+GEMINI_RETRIES, SARVAM_MAX_CONCURRENCY.
+
+Gemini uploads and generations are billed per request and are not
+idempotent: a call that timed out on our side may still have completed, so
+retrying it can upload or generate twice. Both Gemini clients therefore
+default to no retries. wait_until_active polls get_file, which is safe to
+repeat, in its own loop.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from dataclasses import dataclass
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import Histogram, Gauge, Counter, LATENCY_BUCKETS, REGISTRY, METRICS_ENABLED
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class OutboundTimeout(TimeoutError):
+    pass
+
+
+@dataclass
+class ServiceConfig:
+    timeout: float = 30.0            # seconds, per attempt (for streams: the whole stream)
+    stream_timeout: float = 30.0     # seconds between two chunks of a stream
+    retries: int = 1                 # extra attempts after the first
+    backoff_base: float = 0.5        # seconds
+    backoff_max: float = 8.0
+    max_concurrency: int = 8
+    failure_threshold: int = 5
+    reset_timeout: float = 30.0
+
+    @classmethod
+    def from_env(cls, prefix, **defaults):
+        cfg = cls(**defaults)
+        for field in cls.__dataclass_fields__:
+            value = os.getenv(f'{prefix}_{field.upper()}')
+            if value is not None:
+                setattr(cfg, field, type(getattr(cfg, field))(value))
+        return cfg
+
+
+OUTBOUND_LATENCY = Histogram(
+    'outbound_latency_seconds',
+    'Latency of calls to external services, per attempt',
+    LATENCY_BUCKETS, ('service', 'outcome')
+)
+OUTBOUND_CALLS = Counter(
+    'outbound_calls_total',
+    'Calls to external services by outcome (ok, error, timeout, rejected)',
+    ('service', 'outcome')
+)
+BREAKER_STATE = Gauge(
+    'circuit_breaker_state',
+    'Circuit breaker state: 0 closed, 1 half-open, 2 open',
+    ('service',)
+)
+REGISTRY.extend([OUTBOUND_LATENCY, OUTBOUND_CALLS, BREAKER_STATE])
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+_STATE_VALUE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+        self._publish()
+
+    def _publish(self):
+        if METRICS_ENABLED:
+            BREAKER_STATE.set(_STATE_VALUE[self.state], service=self.name)
+
+    def allow(self):
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self.trial_in_flight = False
+                self._publish()
+            if self.state == HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.trial_in_flight = False
+            if self.state != CLOSED:
+                self.state = CLOSED
+                self._publish()
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self._publish()
+
+    def snapshot(self):
+        with self.lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+            return {'state': self.state, 'consecutive_failures': self.failures, 'retry_in_s': retry_in}
+
+
+class OutboundClient:
+    def __init__(self, name, config):
+        self.name = name
+        self.config = config
+        self.breaker = CircuitBreaker(name, config.failure_threshold, config.reset_timeout)
+        self.pool = ThreadPoolExecutor(max_workers=config.max_concurrency, thread_name_prefix=f'out-{name}')
+        self._session = None
+        self._session_lock = threading.Lock()
+        self.latency_ewma = None
+
+    @property
+    def session(self):
+        """Pooled requests.Session for services we talk to over plain HTTP."""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    s = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=self.config.max_concurrency,
+                        pool_maxsize=self.config.max_concurrency,
+                        max_retries=0
+                    )
+                    s.mount('https://', adapter)
+                    s.mount('http://', adapter)
+                    self._session = s
+        return self._session
+
+    def _record(self, outcome, elapsed):
+        if outcome == 'ok':
+            self.latency_ewma = elapsed if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * elapsed
+        if METRICS_ENABLED:
+            OUTBOUND_CALLS.inc(service=self.name, outcome=outcome)
+            if elapsed is not None:
+                OUTBOUND_LATENCY.observe(elapsed, service=self.name, outcome=outcome)
+
+    def _attempt(self, fn, args, kwargs):
+        if not self.breaker.allow():
+            self._record('rejected', None)
+            raise CircuitOpenError(f'{self.name}: circuit open')
+        start = time.perf_counter()
+        future = self.pool.submit(fn, *args, **kwargs)
+        try:
+            result = future.result(timeout=self.config.timeout)
+        except FutureTimeout:
+            future.cancel()
+            self._record('timeout', time.perf_counter() - start)
+            self.breaker.record_failure()
+            raise OutboundTimeout(f'{self.name}: no response after {self.config.timeout}s')
+        except Exception:
+            self._record('error', time.perf_counter() - start)
+            self.breaker.record_failure()
+            raise
+        self._record('ok', time.perf_counter() - start)
+        self.breaker.record_success()
+        return result
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) with timeout, retries and the breaker."""
+        attempt = 0
+        while True:
+            try:
+                return self._attempt(fn, args, kwargs)
+            except CircuitOpenError:
+                raise
+            except Exception:
+                if attempt >= self.config.retries:
+                    raise
+                delay = min(self.config.backoff_max, self.config.backoff_base * 2 ** attempt)
+                time.sleep(random.uniform(0, delay))
+                attempt += 1
+
+    def stream(self, fn, *args, **kwargs):
+        """
+        call() for an API that returns an iterator of chunks (stream=True).
+        The iterator is also consumed on the service pool: each chunk must
+        arrive within stream_timeout and the whole stream within timeout,
+        or OutboundTimeout is raised. A stalled or failed stream counts as a
+        failure on the breaker, a finished one as a success.
+        """
+        iterator = iter(self.call(fn, *args, **kwargs))
+        start = time.perf_counter()
+        deadline = time.monotonic() + self.config.timeout
+        end = object()
+        while True:
+            wait = min(self.config.stream_timeout, deadline - time.monotonic())
+            future = self.pool.submit(next, iterator, end) if wait > 0 else None
+            try:
+                if future is None:
+                    raise FutureTimeout()
+                chunk = future.result(timeout=wait)
+            except FutureTimeout:
+                if future is not None:
+                    future.cancel()
+                self._record('timeout', time.perf_counter() - start)
+                self.breaker.record_failure()
+                raise OutboundTimeout(f'{self.name}: stream stalled (chunk timeout {self.config.stream_timeout}s, '
+                                      f'total {self.config.timeout}s)')
+            except Exception:
+                self._record('error', time.perf_counter() - start)
+                self.breaker.record_failure()
+                raise
+            if chunk is end:
+                self.breaker.record_success()
+                return
+            yield chunk
+
+    async def acall(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: self.call(fn, *args, **kwargs))
+
+    def status(self):
+        return {
+            'config': {
+                'timeout_s': self.config.timeout,
+                'retries': self.config.retries,
+                'max_concurrency': self.config.max_concurrency,
+            },
+            'breaker': self.breaker.snapshot(),
+            'latency_ewma_ms': None if self.latency_ewma is None else self.latency_ewma * 1000,
+        }
+
+
+serpapi = OutboundClient('serpapi', ServiceConfig.from_env('SERPAPI', timeout=10.0, retries=1))
+gemini = OutboundClient('gemini', ServiceConfig.from_env('GEMINI', timeout=120.0, retries=0))
+gemini_upload = OutboundClient('gemini_upload', ServiceConfig.from_env('GEMINI_UPLOAD', timeout=300.0, retries=0, max_concurrency=4))
+sarvam = OutboundClient('sarvam', ServiceConfig.from_env('SARVAM', timeout=60.0, retries=2))
+
+CLIENTS = {c.name: c for c in (serpapi, gemini, gemini_upload, sarvam)}
+
+
+def register(client):
+    """Add a client created elsewhere (e.g. the encoder services) to /outbound."""
+    CLIENTS[client.name] = client
+    return client
+
+
+def status():
+    return {name: client.status() for name, client in CLIENTS.items()}
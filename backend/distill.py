@@ -0,0 +1,234 @@
+"""
+Knowledge distillation: train a compact FakeNewsModel student from the
+existing multimodal teacher.
+
+The student keeps the first --text-layers layers of the teacher's MuRIL
+encoder, copied from the teacher, and pairs them with a DeiT-Tiny shaped ViT
+(--image-arch vit_tiny). It learns from the teacher's outputs:
+    fake_out   -> binary cross-entropy against the teacher's probability
+    claim_out  -> KL divergence at temperature T
+If the dataset has labels, a hard-label BCE term is added with weight --alpha.
+
+Dataset: JSONL with {"title": ..., "image": <path>} and optionally a label
+("FAKE"/"REAL"/1/0). Image paths are relative to the file.
+
+    python distill.py --data train.jsonl --out model_multimodal/student_model.pth
+    python distill.py --smoke        # tiny synthetic run on CPU, random teacher
+
+Serve the result with MODEL_VARIANT=student (and STUDENT_MODEL_PATH if it
+is not at the default location).
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+import tempfile
+import time
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+
+from model import FakeNewsModel, load_checkpoint, save_checkpoint
+from prediction import img_transform, CLAIM_TYPES, MODEL_PATH, STUDENT_MODEL_PATH, TEXT_MODEL, DEVICE
+
+
+class TitleImageDataset(Dataset):
+    def __init__(self, path):
+        base = os.path.dirname(os.path.abspath(path))
+        self.rows = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    row['image'] = os.path.join(base, row['image'])
+                    if 'label' in row:
+                        row['label'] = float(row['label'] == 'FAKE' or row['label'] == 1 or row['label'] == '1')
+                    self.rows.append(row)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, i):
+        row = self.rows[i]
+        img = img_transform(Image.open(row['image']).convert('RGB'))
+        return row['title'], img, row.get('label', -1.0)
+
+
+def make_collate(tokenizer):
+    def collate(batch):
+        titles, imgs, labels = zip(*batch)
+        enc = tokenizer(list(titles), padding=True, truncation=True, max_length=128, return_tensors='pt')
+        return enc['input_ids'], enc['attention_mask'], torch.stack(imgs), torch.tensor(labels, dtype=torch.float32)
+    return collate
+
+
+def build_student(teacher, text_layers, image_arch):
+    """Student with the teacher's first text layers and, where shapes allow, its fusion heads."""
+    student = FakeNewsModel(
+        num_claims=teacher.config['num_claims'],
+        text_config=copy.deepcopy(teacher.text_model.config),
+        pretrained=False,
+        text_layers=text_layers,
+        image_arch=image_arch,
+    )
+    student.config['TEXT_MODEL_NAME'] = teacher.config['TEXT_MODEL_NAME']
+
+    # truncated MuRIL: copy embeddings and the first layers
+    student_sd = student.state_dict()
+    teacher_sd = teacher.state_dict()
+    copied = 0
+    for key, value in teacher_sd.items():
+        if key in student_sd and student_sd[key].shape == value.shape:
+            if key.startswith('image_model.') and image_arch != teacher.config['image_arch']:
+                continue
+            student_sd[key] = value.clone()
+            copied += 1
+    student.load_state_dict(student_sd)
+    print(f"initialised {copied}/{len(student_sd)} student tensors from the teacher", file=sys.stderr)
+    return student
+
+
+def distill_loss(s_fake, s_claim, t_fake, t_claim, labels, temperature, alpha):
+    soft_fake = F.binary_cross_entropy(s_fake.clamp(1e-6, 1 - 1e-6), t_fake)
+    soft_claim = F.kl_div(
+        F.log_softmax(s_claim / temperature, dim=-1),
+        F.softmax(t_claim / temperature, dim=-1),
+        reduction='batchmean'
+    ) * temperature ** 2
+    loss = soft_fake + soft_claim
+    has_label = labels >= 0
+    if alpha > 0 and has_label.any():
+        hard = F.binary_cross_entropy(s_fake[has_label].clamp(1e-6, 1 - 1e-6), labels[has_label])
+        loss = (1 - alpha) * loss + alpha * hard
+    return loss
+
+
+def evaluate(teacher, student, loader):
+    """Agreement and latency of student vs teacher over the loader."""
+    teacher.eval()
+    student.eval()
+    n = agree_fake = agree_claim = 0
+    abs_diff = 0.0
+    t_time = s_time = 0.0
+    with torch.no_grad():
+        for ids, mask, imgs, _ in loader:
+            ids, mask, imgs = ids.to(DEVICE), mask.to(DEVICE), imgs.to(DEVICE)
+            start = time.perf_counter()
+            t_fake, t_claim = teacher(ids, mask, imgs)
+            t_time += time.perf_counter() - start
+            start = time.perf_counter()
+            s_fake, s_claim = student(ids, mask, imgs)
+            s_time += time.perf_counter() - start
+
+            n += ids.shape[0]
+            agree_fake += ((t_fake > 0.5) == (s_fake > 0.5)).sum().item()
+            agree_claim += (t_claim.argmax(-1) == s_claim.argmax(-1)).sum().item()
+            abs_diff += (t_fake - s_fake).abs().sum().item()
+
+    def params(m):
+        return sum(p.numel() for p in m.parameters())
+
+    return {
+        'samples': n,
+        'fake_label_agreement': agree_fake / n,
+        'claim_top1_agreement': agree_claim / n,
+        'mean_abs_prob_diff': abs_diff / n,
+        'teacher_ms_per_sample': t_time / n * 1000,
+        'student_ms_per_sample': s_time / n * 1000,
+        'speedup': t_time / s_time if s_time > 0 else None,
+        'teacher_params': params(teacher),
+        'student_params': params(student),
+    }
+
+
+def train(teacher, student, loader, epochs, lr, temperature, alpha):
+    teacher.eval()
+    student.train()
+    optim = torch.optim.AdamW(student.parameters(), lr=lr, weight_decay=0.01)
+    for epoch in range(epochs):
+        total = 0.0
+        for step, (ids, mask, imgs, labels) in enumerate(loader):
+            ids, mask, imgs, labels = ids.to(DEVICE), mask.to(DEVICE), imgs.to(DEVICE), labels.to(DEVICE)
+            with torch.no_grad():
+                t_fake, t_claim = teacher(ids, mask, imgs)
+            s_fake, s_claim = student(ids, mask, imgs)
+            loss = distill_loss(s_fake, s_claim, t_fake, t_claim, labels.unsqueeze(-1), temperature, alpha)
+            optim.zero_grad()
+            loss.backward()
+            nn.utils.clip_grad_norm_(student.parameters(), 1.0)
+            optim.step()
+            total += loss.item()
+        print(f"epoch {epoch + 1}/{epochs}  loss {total / max(1, step + 1):.4f}", file=sys.stderr)
+    student.eval()
+    return student
+
+
+def make_smoke_dataset(directory, n=8):
+    from benchmarks import stubs
+    path = os.path.join(directory, 'smoke.jsonl')
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(n):
+            image = f'img_{i}.jpg'
+            stubs.make_image(os.path.join(directory, image), size=(256, 256), seed=i)
+            f.write(json.dumps({
+                'title': stubs.make_title(6 + i % 4, seed=i),
+                'image': image,
+                'label': 'FAKE' if i % 2 else 'REAL'
+            }, ensure_ascii=False) + '\n')
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', help='training JSONL')
+    parser.add_argument('--eval-data', help='held-out JSONL for the agreement report (defaults to --data)')
+    parser.add_argument('--teacher', default=MODEL_PATH)
+    parser.add_argument('--out', default=STUDENT_MODEL_PATH)
+    parser.add_argument('--text-layers', type=int, default=4)
+    parser.add_argument('--image-arch', choices=['vit_tiny', 'vit_b_16'], default='vit_tiny')
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--lr', type=float, default=5e-5)
+    parser.add_argument('--temperature', type=float, default=2.0)
+    parser.add_argument('--alpha', type=float, default=0.0, help='weight of the hard-label loss')
+    parser.add_argument('--smoke', action='store_true', help='tiny synthetic run with a random teacher')
+    args = parser.parse_args()
+
+    if args.smoke:
+        from benchmarks import stubs
+        work = tempfile.mkdtemp(prefix='distill_smoke_')
+        args.data = make_smoke_dataset(work)
+        args.out = os.path.join(work, 'student_model.pth')
+        args.epochs, args.batch_size, args.text_layers = 1, 4, 2
+        tokenizer = stubs.make_tokenizer()
+        teacher = stubs.make_model(tokenizer).to(DEVICE)
+    else:
+        if not args.data:
+            parser.error('--data is required (or use --smoke)')
+        from transformers import AutoTokenizer
+        teacher = load_checkpoint(args.teacher, num_claims=len(CLAIM_TYPES), device=DEVICE)
+        tokenizer = AutoTokenizer.from_pretrained(teacher.config['TEXT_MODEL_NAME'] or TEXT_MODEL)
+
+    collate = make_collate(tokenizer)
+    train_loader = DataLoader(TitleImageDataset(args.data), batch_size=args.batch_size, shuffle=True, collate_fn=collate)
+    eval_loader = DataLoader(TitleImageDataset(args.eval_data or args.data), batch_size=args.batch_size, collate_fn=collate)
+
+    student = build_student(teacher, args.text_layers, args.image_arch).to(DEVICE)
+    student = train(teacher, student, train_loader, args.epochs, args.lr, args.temperature, args.alpha)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    save_checkpoint(student, args.out, distilled_from=os.path.abspath(args.teacher) if not args.smoke else 'random')
+
+    # round-trip through the same loader server.load_model uses
+    reloaded = load_checkpoint(args.out, num_claims=len(CLAIM_TYPES), device=DEVICE)
+    report = evaluate(teacher, reloaded, eval_loader)
+    report['checkpoint'] = args.out
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,521 @@
+"""
+Text and image encoders as separate local worker processes.
+
+With ENCODER_MODE=remote the API process keeps only the fusion layer and
+the heads (RemoteModel). encode_text and encode_image become RPCs to
+worker services, so MuRIL and the ViT can each run as many processes as
+the traffic needs:
+
+    python encoder_service.py text  --listen 127.0.0.1:8101
+    python encoder_service.py image --listen 127.0.0.1:8102
+    python encoder_service.py image --listen unix:/tmp/vit-2.sock
+
+    # or spawn a whole set on this box and print the env for the API
+    python encoder_service.py cluster --text 1 --image 2
+
+    TEXT_ENCODER_URL=http://127.0.0.1:8101 \
+    IMAGE_ENCODER_URL=http://127.0.0.1:8102,unix:/tmp/vit-2.sock \
+    ENCODER_MODE=remote python server.py
+
+Requests are spread round-robin over the comma-separated URLs and go
+through a clients.OutboundClient ('text_encoder' / 'image_encoder'), so
+they get the usual timeouts, retries and circuit breaker (TEXT_ENCODER_TIMEOUT,
+IMAGE_ENCODER_RETRIES, ...).
+
+Wire format: plain HTTP/1.1 with keep-alive, raw little-endian buffers in
+the body and the array shape in an X-Shape header.
+    POST /encode  text:  int32 (2, B, L) input ids stacked on attention mask
+                  image: float16 (B, 3, 224, 224) normalised pixels
+                  -> float16 (B, D) embeddings
+    POST /cam     image worker only; float16 (1, 3, 224, 224) and an
+                  X-Method header (gradcam | rollout) -> float16 map
+    GET  /health  role, embedding size and batching stats as JSON
+
+Each worker micro-batches: concurrent /encode requests that arrive within
+ENCODER_MAX_WAIT_MS of each other run as one forward pass of up to
+ENCODER_MAX_BATCH rows. Text requests of different lengths are right-padded
+under the attention mask. The image worker applies VIT_TOKEN_REDUCTION
+itself, as the API does in local mode.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+import clients
+from model import FakeNewsModel, build_heads, load_checkpoint
+
+TEXT_ENCODER_URL = os.getenv('TEXT_ENCODER_URL', 'http://127.0.0.1:8101')
+IMAGE_ENCODER_URL = os.getenv('IMAGE_ENCODER_URL', 'http://127.0.0.1:8102')
+ENCODER_MAX_BATCH = int(os.getenv('ENCODER_MAX_BATCH', '32'))
+ENCODER_MAX_WAIT_MS = float(os.getenv('ENCODER_MAX_WAIT_MS', '5'))
+
+HEAD_PREFIXES = ('cross.', 'fake_head.', 'claim_head.')
+ROLES = ('text', 'image')
+
+
+class EncoderError(RuntimeError):
+    pass
+
+
+def _shape(header):
+    return tuple(int(x) for x in header.split(','))
+
+
+def _shape_header(shape):
+    return ','.join(str(x) for x in shape)
+
+
+# ---------------- worker side ----------------
+
+class MicroBatcher:
+    """
+    One thread that runs `forward(payloads) -> list of results`. submit()
+    returns a Future; requests that queue up while a batch is collecting
+    (up to max_wait_ms, max_rows rows) share one forward pass.
+    """
+    def __init__(self, forward, max_rows=ENCODER_MAX_BATCH, max_wait_ms=ENCODER_MAX_WAIT_MS):
+        self.forward = forward
+        self.max_rows = max_rows
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.rows = 0
+        self.thread = threading.Thread(target=self._loop, daemon=True, name='encoder-batcher')
+        self.thread.start()
+
+    def submit(self, payload, rows):
+        future = Future()
+        self.queue.put((payload, rows, future))
+        return future
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        rows = batch[0][1]
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_rows:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            rows += item[1]
+        return batch, rows
+
+    def _loop(self):
+        while True:
+            batch, rows = self._collect()
+            try:
+                results = self.forward([payload for payload, _, _ in batch])
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.rows += rows
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'rows': self.rows,
+            'mean_batch': round(self.rows / self.batches, 2) if self.batches else 0.0,
+            'queued': self.queue.qsize(),
+        }
+
+
+class EncoderWorker:
+    """Holds one encoder of a checkpoint; the other encoder is dropped after loading."""
+    def __init__(self, role, model, device):
+        self.role = role
+        self.model = model
+        self.device = device
+        self.cam_lock = threading.Lock()
+        if role == 'text':
+            model.image_model = None
+            self.dim = model.text_model.config.hidden_size
+        else:
+            model.text_model = None
+            self.dim = model.cross.key.in_features
+        self.batcher = MicroBatcher(self._forward_text if role == 'text' else self._forward_image)
+
+    @classmethod
+    def load(cls, role, checkpoint, num_claims, device):
+        model = load_checkpoint(checkpoint, num_claims=num_claims, device=device)
+        if role == 'image':
+            import token_merging
+            reduction = token_merging.TokenReduction.from_env()
+            if reduction.enabled:
+                token_merging.apply(model.image_model, reduction)
+        return cls(role, model, device)
+
+    def _forward_text(self, payloads):
+        length = max(ids.shape[1] for ids, _ in payloads)
+        ids = torch.cat([F.pad(ids, (0, length - ids.shape[1])) for ids, _ in payloads])
+        mask = torch.cat([F.pad(mask, (0, length - mask.shape[1])) for _, mask in payloads])
+        with torch.no_grad():
+            out = self.model.encode_text(ids.to(self.device), mask.to(self.device))
+        return torch.split(out, [p[0].shape[0] for p in payloads])
+
+    def _forward_image(self, payloads):
+        with torch.no_grad():
+            out = self.model.encode_image(torch.cat(payloads).to(self.device))
+        return torch.split(out, [p.shape[0] for p in payloads])
+
+    def encode(self, array):
+        if self.role == 'text':
+            if array.ndim != 3 or array.shape[0] != 2:
+                raise ValueError(f'text input must be (2, B, L), got {array.shape}')
+            tensor = torch.from_numpy(array.astype(np.int64))
+            payload, rows = (tensor[0], tensor[1]), array.shape[1]
+        else:
+            if array.ndim != 4 or array.shape[1:] != (3, 224, 224):
+                raise ValueError(f'image input must be (B, 3, 224, 224), got {array.shape}')
+            payload, rows = torch.from_numpy(array.astype(np.float32)), array.shape[0]
+        out = self.batcher.submit(payload, rows).result()
+        return out.cpu().numpy().astype(np.float16)
+
+    def attention_map(self, array, method):
+        if self.role != 'image':
+            raise ValueError('/cam is served by image workers')
+        from prediction import compute_attention_map
+        # Grad-CAM backpropagates through the shared ViT, so one at a time
+        with self.cam_lock:
+            cam = compute_attention_map(torch.from_numpy(array.astype(np.float32)).to(self.device), self.model, method)
+        return np.asarray(cam, dtype=np.float16)
+
+    def health(self):
+        return {'role': self.role, 'dim': self.dim, 'pid': os.getpid(), **self.batcher.stats()}
+
+
+def make_handler(worker, tcp):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # the body goes out as a second write; don't let Nagle hold it back
+        disable_nagle_algorithm = tcp
+
+        def _reply(self, status, body, content_type='application/octet-stream', shape=None):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            if shape is not None:
+                self.send_header('X-Shape', _shape_header(shape))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _error(self, status, message):
+            self._reply(status, message.encode('utf-8'), 'text/plain; charset=utf-8')
+
+        def do_GET(self):
+            if self.path != '/health':
+                return self._error(404, f'no route {self.path}')
+            self._reply(200, json.dumps(worker.health()).encode('utf-8'), 'application/json')
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if self.path not in ('/encode', '/cam'):
+                return self._error(404, f'no route {self.path}')
+            try:
+                dtype = np.int32 if worker.role == 'text' and self.path == '/encode' else np.float16
+                array = np.frombuffer(body, dtype=dtype).reshape(_shape(self.headers['X-Shape']))
+            except Exception as e:
+                return self._error(400, f'bad payload: {e}')
+            try:
+                if self.path == '/encode':
+                    out = worker.encode(array)
+                else:
+                    out = worker.attention_map(array, self.headers.get('X-Method', 'gradcam'))
+            except ValueError as e:
+                return self._error(400, str(e))
+            except Exception as e:
+                return self._error(500, f'{type(e).__name__}: {e}')
+            self._reply(200, out.tobytes(), shape=out.shape)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        super().server_bind()
+
+
+def make_server(worker, listen):
+    """listen: 'host:port' or 'unix:/path/to.sock'"""
+    if listen.startswith('unix:'):
+        return UnixHTTPServer(listen[len('unix:'):], make_handler(worker, tcp=False))
+    host, port = listen.rsplit(':', 1)
+    server = ThreadingHTTPServer((host, int(port)), make_handler(worker, tcp=True))
+    server.daemon_threads = True
+    return server
+
+
+# ---------------- API side ----------------
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def _connect(url, timeout):
+    if url.startswith('unix:'):
+        return UnixHTTPConnection(url[len('unix:'):], timeout=timeout)
+    host = url.split('://', 1)[-1].rstrip('/')
+    conn = http.client.HTTPConnection(host, timeout=timeout)
+    return conn
+
+
+class EncoderClient:
+    """Round-robin over one role's workers, one keep-alive connection per thread and worker."""
+    def __init__(self, name, urls, **defaults):
+        self.urls = [u.strip() for u in urls.split(',') if u.strip()] if isinstance(urls, str) else list(urls)
+        if not self.urls:
+            raise ValueError(f'{name}: no worker URLs')
+        self.outbound = clients.register(clients.OutboundClient(name, clients.ServiceConfig.from_env(name.upper(), **defaults)))
+        self._turn = itertools.count()
+        self._local = threading.local()
+
+    def _connection(self, url):
+        conns = getattr(self._local, 'conns', None)
+        if conns is None:
+            conns = self._local.conns = {}
+        if url not in conns:
+            conns[url] = _connect(url, self.outbound.config.timeout)
+        return conns[url]
+
+    def _request(self, method, path, body=None, headers=None):
+        url = self.urls[next(self._turn) % len(self.urls)]
+        for attempt in range(2):
+            conn = self._connection(url)
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                resp = conn.getresponse()
+                data = resp.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # the worker closed an idle keep-alive connection; reconnect once
+                conn.close()
+                self._local.conns.pop(url, None)
+                if attempt:
+                    raise
+            except Exception:
+                conn.close()
+                self._local.conns.pop(url, None)
+                raise
+        if resp.status != 200:
+            raise EncoderError(f'{self.outbound.name} {url}{path}: {resp.status} {data[:300].decode("utf-8", "replace")}')
+        return resp, data
+
+    def _post_array(self, path, array, headers):
+        headers = {'Content-Type': 'application/octet-stream', 'X-Shape': _shape_header(array.shape), **headers}
+        resp, data = self._request('POST', path, array.tobytes(), headers)
+        return np.frombuffer(data, dtype=np.float16).reshape(_shape(resp.getheader('X-Shape')))
+
+    def post(self, path, array, **headers):
+        return self.outbound.call(self._post_array, path, np.ascontiguousarray(array), headers)
+
+    def health(self):
+        report = {}
+        for url in self.urls:
+            try:
+                conn = _connect(url, 5)
+                conn.request('GET', '/health')
+                report[url] = json.loads(conn.getresponse().read())
+                conn.close()
+            except Exception as e:
+                report[url] = {'error': str(e)}
+        return report
+
+
+class RemoteModel(nn.Module):
+    """
+    Fusion and heads of a FakeNewsModel checkpoint, with the encoders behind
+    EncoderClients. Same interface as FakeNewsModel for prediction.py:
+    encode_text, encode_image, blank_image_embedding, heads, forward, plus
+    attention_map for explainers that need the ViT itself.
+    """
+    def __init__(self, state_dict, text_client, image_client, device):
+        super().__init__()
+        tdim = state_dict['cross.query.weight'].shape[1]
+        idim = state_dict['cross.key.weight'].shape[1]
+        num_claims = state_dict['claim_head.2.weight'].shape[0]
+        self.cross, self.fake_head, self.claim_head = build_heads(tdim, idim, num_claims)
+        self.load_state_dict(state_dict)
+        self.text_client = text_client
+        self.image_client = image_client
+        self.device = device
+        self._blank_image_emb = None
+        self.to(device)
+        self.eval()
+
+    @classmethod
+    def from_checkpoint(cls, path, device, text_urls=TEXT_ENCODER_URL, image_urls=IMAGE_ENCODER_URL):
+        ckpt = torch.load(path, map_location='cpu')
+        state = ckpt['state_dict'] if isinstance(ckpt, dict) and 'state_dict' in ckpt else ckpt
+        heads = {k: v for k, v in state.items() if k.startswith(HEAD_PREFIXES)}
+        del ckpt, state
+        return cls(
+            heads,
+            EncoderClient('text_encoder', text_urls, timeout=30.0, retries=1, max_concurrency=8),
+            EncoderClient('image_encoder', image_urls, timeout=60.0, retries=1, max_concurrency=8),
+            device
+        )
+
+    def _embeddings(self, array):
+        return torch.from_numpy(array.astype(np.float32)).to(self.device)
+
+    def encode_text(self, ids, mask):
+        wire = np.stack([ids.cpu().numpy(), mask.cpu().numpy()]).astype(np.int32)
+        return self._embeddings(self.text_client.post('/encode', wire))
+
+    def encode_image(self, img):
+        return self._embeddings(self.image_client.post('/encode', img.detach().cpu().numpy().astype(np.float16)))
+
+    def blank_image_embedding(self):
+        if self._blank_image_emb is None:
+            self._blank_image_emb = self.encode_image(torch.zeros(1, 3, 224, 224))
+        return self._blank_image_emb
+
+    def attention_map(self, img, method='gradcam'):
+        wire = img.detach().cpu().numpy().astype(np.float16)
+        return self.image_client.post('/cam', wire, **{'X-Method': method}).astype(np.float32)
+
+    heads = FakeNewsModel.heads
+    forward = FakeNewsModel.forward
+
+    def health(self):
+        return {'text': self.text_client.health(), 'image': self.image_client.health()}
+
+
+# ---------------- CLI ----------------
+
+def _default_checkpoint():
+    from prediction import MODEL_PATH, STUDENT_MODEL_PATH, MODEL_VARIANT
+    return STUDENT_MODEL_PATH if MODEL_VARIANT == 'student' else MODEL_PATH
+
+
+def serve(args):
+    from prediction import CLAIM_TYPES, DEVICE
+    if os.getenv('ENCODER_THREADS'):
+        torch.set_num_threads(int(os.environ['ENCODER_THREADS']))
+    worker = EncoderWorker.load(args.role, args.checkpoint or _default_checkpoint(), len(CLAIM_TYPES), DEVICE)
+    worker.batcher.max_rows = args.max_batch
+    worker.batcher.max_wait = args.max_wait_ms / 1000
+    server = make_server(worker, args.listen)
+    print(f'{args.role} encoder (dim {worker.dim}) listening on {args.listen}', flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def _wait_healthy(url, proc, timeout=600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f'worker for {url} exited with {proc.returncode}')
+        try:
+            conn = _connect(url, 2)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f'worker for {url} did not come up in {timeout}s')
+
+
+def cluster(args):
+    """Start --text and --image workers on consecutive ports and wait on them."""
+    procs, urls = [], {'text': [], 'image': []}
+    port = args.base_port
+    for role, count in (('text', args.text), ('image', args.image)):
+        for _ in range(count):
+            listen = f'{args.host}:{port}'
+            cmd = [sys.executable, os.path.abspath(__file__), role, '--listen', listen,
+                   '--max-batch', str(args.max_batch), '--max-wait-ms', str(args.max_wait_ms)]
+            if args.checkpoint:
+                cmd += ['--checkpoint', args.checkpoint]
+            procs.append(subprocess.Popen(cmd))
+            urls[role].append(f'http://{listen}')
+            port += 1
+
+    def stop(*_):
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait()
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for p, url in zip(procs, urls['text'] + urls['image']):
+            _wait_healthy(url, p)
+        print(f"ENCODER_MODE=remote TEXT_ENCODER_URL={','.join(urls['text'])} "
+              f"IMAGE_ENCODER_URL={','.join(urls['image'])}", flush=True)
+        # one worker dying takes the set down, so a supervisor can restart it whole
+        while all(p.poll() is None for p in procs):
+            time.sleep(1)
+        raise SystemExit(f'an encoder worker exited: {[p.returncode for p in procs]}')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs:
+            if p.poll() is None:
+                p.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    for role in ROLES:
+        p = sub.add_parser(role, help=f'run a {role} encoder worker')
+        p.add_argument('--listen', required=True, help="'host:port' or 'unix:/path/to.sock'")
+        p.set_defaults(func=serve, role=role)
+    p = sub.add_parser('cluster', help='spawn text and image workers on this box')
+    p.add_argument('--text', type=int, default=1)
+    p.add_argument('--image', type=int, default=1)
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--base-port', type=int, default=8101)
+    p.set_defaults(func=cluster)
+    for p in sub.choices.values():
+        p.add_argument('--checkpoint', default=None, help='defaults to the checkpoint MODEL_VARIANT selects')
+        p.add_argument('--max-batch', type=int, default=ENCODER_MAX_BATCH)
+        p.add_argument('--max-wait-ms', type=float, default=ENCODER_MAX_WAIT_MS)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+"""
+Perceptual-hash index for recycled images.
+
+Fake posts keep reusing the same photo, resized or re-encoded, which
+changes its bytes but barely changes its pHash/dHash. For every analysed
+image we store both 64-bit hashes, the ViT image embedding and the Grad-CAM
+map. A later lookup within IMAGE_MATCH_DISTANCE bits skips the ViT forward
+and the Grad-CAM backward pass entirely.
+
+On disk (IMAGE_INDEX_DIR/<model fingerprint>/):
+    records.jsonl      append-only: one line per image (hashes, source,
+                       verdicts), later lines update or evict an entry
+    entries/<id>.npz   embedding (image dim, fp16) and Grad-CAM map (224x224, fp16)
+    model.json         fingerprint of the model that wrote the embeddings
+
+A stored embedding is fed straight into model.heads, so it must come from
+the same image encoder: each model (model.model_fingerprint) gets its own
+directory, and an index refuses to open for a different fingerprint.
+
+Only the hashes are kept in memory, so lookups are a vectorised XOR +
+popcount over two uint64 arrays. An entry stored without a Grad-CAM map
+(the request did not ask for an explanation) gets one from the first
+later request that computes it.
+
+Memory and disk are bounded by IMAGE_INDEX_CAPACITY: once full, the oldest
+entry is evicted, and records.jsonl is compacted to the live entries when
+it grows past twice the capacity.
+
+    python image_index.py load /path/to/archive      # bulk-load a folder
+    python image_index.py stats
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+
+import cv2
+import numpy as np
+from PIL import Image
+
+IMAGE_INDEX_DIR = os.getenv('IMAGE_INDEX_DIR', 'image_index')
+IMAGE_MATCH_DISTANCE = int(os.getenv('IMAGE_MATCH_DISTANCE', '6'))
+IMAGE_INDEX_CAPACITY = int(os.getenv('IMAGE_INDEX_CAPACITY', '20000'))
+MAX_VERDICTS = 10
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif'}
+
+if hasattr(np, 'bitwise_count'):
+    def popcount64(x):
+        return np.bitwise_count(x)
+else:
+    _POPCOUNT8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def popcount64(x):
+        return _POPCOUNT8[x.view(np.uint8).reshape(-1, 8)].sum(axis=1)
+
+
+def _bits_to_int(bits):
+    value = 0
+    for b in bits.reshape(-1):
+        value = (value << 1) | int(b)
+    return value
+
+
+def _gray(img):
+    if isinstance(img, Image.Image):
+        return np.asarray(img.convert('L'), dtype=np.float32)
+    arr = np.asarray(img)
+    if arr.ndim == 3:
+        arr = cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY)
+    return arr.astype(np.float32)
+
+
+def phash(img):
+    """64-bit DCT hash: low 8x8 frequencies of a 32x32 greyscale thumbnail vs their median."""
+    small = cv2.resize(_gray(img), (32, 32), interpolation=cv2.INTER_AREA)
+    low = cv2.dct(small)[:8, :8]
+    return _bits_to_int(low > np.median(low.reshape(-1)[1:]))
+
+
+def dhash(img):
+    """64-bit gradient hash: sign of horizontal differences on a 9x8 thumbnail."""
+    small = cv2.resize(_gray(img), (9, 8), interpolation=cv2.INTER_AREA)
+    return _bits_to_int(small[:, 1:] > small[:, :-1])
+
+
+class ImageIndex:
+    def __init__(self, directory=IMAGE_INDEX_DIR, max_distance=IMAGE_MATCH_DISTANCE, model=None,
+                 capacity=IMAGE_INDEX_CAPACITY):
+        self.directory = directory
+        self.max_distance = max_distance
+        self.capacity = capacity
+        self.entries_dir = os.path.join(directory, 'entries')
+        self.records_path = os.path.join(directory, 'records.jsonl')
+        os.makedirs(self.entries_dir, exist_ok=True)
+        self.lock = threading.Lock()
+
+        model_path = os.path.join(directory, 'model.json')
+        stored = None
+        if os.path.exists(model_path):
+            with open(model_path, 'r', encoding='utf-8') as f:
+                stored = json.load(f).get('model')
+        if model and stored and stored != model:
+            raise ValueError(f"image index at {directory} holds embeddings of model {stored}, not {model}")
+        if model and not stored:
+            with open(model_path, 'w', encoding='utf-8') as f:
+                json.dump({'model': model}, f)
+        self.model = stored or model
+
+        self.records = {}
+        order = []
+        self.lines = 0
+        if os.path.exists(self.records_path):
+            with open(self.records_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    self.lines += 1
+                    rec = json.loads(line)
+                    if rec.get('evicted'):
+                        self.records.pop(rec['id'], None)
+                        continue
+                    if rec['id'] not in self.records:
+                        order.append(rec['id'])
+                    # later lines are verdict updates for an existing entry
+                    self.records[rec['id']] = rec
+        self.ids = [i for i in order if i in self.records]
+        self.phashes = np.array([int(self.records[i]['phash'], 16) for i in self.ids], dtype=np.uint64)
+        self.dhashes = np.array([int(self.records[i]['dhash'], 16) for i in self.ids], dtype=np.uint64)
+        with self.lock:
+            # opened with a smaller capacity than it was filled to
+            while len(self.ids) > self.capacity:
+                self._evict_oldest()
+            self._maybe_compact()
+
+    @classmethod
+    def for_model(cls, fingerprint, base=IMAGE_INDEX_DIR, **kwargs):
+        """The index of one model, under base/<fingerprint>."""
+        return cls(os.path.join(base, fingerprint), model=fingerprint, **kwargs)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _entry_path(self, entry_id):
+        return os.path.join(self.entries_dir, entry_id + '.npz')
+
+    def _append_record(self, rec):
+        with open(self.records_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(rec, ensure_ascii=False) + '\n')
+        self.lines += 1
+
+    def _evict_oldest(self):
+        entry_id = self.ids.pop(0)
+        self.phashes = self.phashes[1:]
+        self.dhashes = self.dhashes[1:]
+        del self.records[entry_id]
+        self._append_record({'id': entry_id, 'evicted': True})
+        try:
+            os.remove(self._entry_path(entry_id))
+        except FileNotFoundError:
+            pass
+
+    def _maybe_compact(self):
+        """Rewrite records.jsonl as one line per live entry once it is mostly stale."""
+        if self.lines <= 2 * max(self.capacity, len(self.ids)):
+            return
+        tmp = self.records_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for entry_id in self.ids:
+                f.write(json.dumps(self.records[entry_id], ensure_ascii=False) + '\n')
+        os.replace(tmp, self.records_path)
+        self.lines = len(self.ids)
+
+    @staticmethod
+    def _save_entry(path, embedding, cam):
+        arrays = {'embedding': np.asarray(embedding, dtype=np.float16).reshape(-1)}
+        if cam is not None:
+            arrays['cam'] = np.asarray(cam, dtype=np.float16)
+        tmp = path[:-len('.npz')] + f'.{uuid.uuid4().hex[:8]}.tmp.npz'
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    def lookup(self, img):
+        """
+        Nearest stored image within max_distance bits of pHash (and 2x that
+        of dHash), or None. The hit carries its embedding and Grad-CAM map.
+        """
+        ph = np.uint64(phash(img))
+        dh = np.uint64(dhash(img))
+        with self.lock:
+            if len(self.ids) == 0:
+                return None
+            pd = popcount64(self.phashes ^ ph)
+            dd = popcount64(self.dhashes ^ dh)
+            ok = (pd <= self.max_distance) & (dd <= 2 * self.max_distance)
+            if not ok.any():
+                return None
+            score = np.where(ok, pd.astype(np.int32) + dd.astype(np.int32), 1 << 20)
+            i = int(np.argmin(score))
+            entry_id = self.ids[i]
+            rec = self.records[entry_id]
+            distance = int(pd[i])
+        try:
+            data = np.load(self._entry_path(entry_id))
+        except FileNotFoundError:
+            # evicted since the hashes were compared
+            return None
+        return {
+            'id': entry_id,
+            'distance': distance,
+            'source': rec.get('source'),
+            'verdicts': rec.get('verdicts', []),
+            'embedding': data['embedding'].astype(np.float32),
+            'cam': data['cam'].astype(np.float32) if 'cam' in data.files else None,
+        }
+
+    def add(self, img, embedding, cam=None, source=None, verdict=None):
+        entry_id = uuid.uuid4().hex
+        self._save_entry(self._entry_path(entry_id), embedding, cam)
+
+        ph, dh = phash(img), dhash(img)
+        rec = {
+            'id': entry_id,
+            'phash': f'{ph:016x}',
+            'dhash': f'{dh:016x}',
+            'source': source,
+            'verdicts': [verdict] if verdict else [],
+            'added_at': time.time(),
+        }
+        with self.lock:
+            while len(self.ids) >= self.capacity:
+                self._evict_oldest()
+            self._append_record(rec)
+            self.records[entry_id] = rec
+            self.ids.append(entry_id)
+            self.phashes = np.append(self.phashes, np.uint64(ph))
+            self.dhashes = np.append(self.dhashes, np.uint64(dh))
+            self._maybe_compact()
+        return entry_id
+
+    def add_verdict(self, entry_id, verdict):
+        with self.lock:
+            rec = self.records.get(entry_id)
+            if rec is None:
+                return
+            rec['verdicts'] = (rec.get('verdicts', []) + [verdict])[-MAX_VERDICTS:]
+            self._append_record(rec)
+            self._maybe_compact()
+
+    def set_cam(self, entry_id, cam):
+        """Store the Grad-CAM map of an entry that was added without one."""
+        with self.lock:
+            if entry_id not in self.records:
+                return False
+            path = self._entry_path(entry_id)
+            with np.load(path) as data:
+                if 'cam' in data.files:
+                    return False
+                embedding = data['embedding']
+            self._save_entry(path, embedding, cam)
+        return True
+
+
+def bulk_load(index, folder, model, verdicts=None):
+    """Index every image under `folder`; `verdicts` maps file name -> verdict dict."""
+    import torch
+    from prediction import img_transform, compute_attention_map, DEVICE
+
+    verdicts = verdicts or {}
+    added = skipped = 0
+    for root, _, files in os.walk(folder):
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            try:
+                img = Image.open(path).convert('RGB')
+            except Exception as e:
+                print(f"⚠️ Skipping {path}: {e}")
+                skipped += 1
+                continue
+            if index.lookup(img) is not None:
+                skipped += 1
+                continue
+            img_tensor = img_transform(img).unsqueeze(0).to(DEVICE)
+            with torch.no_grad():
+                embedding = model.encode_image(img_tensor)[0].cpu().numpy()
+            cam = compute_attention_map(img_tensor, model)
+            index.add(img, embedding, cam, source=path, verdict=verdicts.get(name))
+            added += 1
+    return added, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the perceptual-hash image index')
+    parser.add_argument('--dir', default=IMAGE_INDEX_DIR, help='base directory; one subdirectory per model')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    sub.add_parser('stats')
+    load = sub.add_parser('load')
+    load.add_argument('folder')
+    load.add_argument('--verdicts', default=None, help='JSON file mapping image file name -> verdict')
+    args = parser.parse_args()
+
+    if args.cmd == 'stats':
+        os.makedirs(args.dir, exist_ok=True)
+        for name in sorted(os.listdir(args.dir)):
+            if os.path.isdir(os.path.join(args.dir, name, 'entries')):
+                index = ImageIndex(os.path.join(args.dir, name))
+                print(json.dumps({'model': index.model, 'images': len(index), 'capacity': index.capacity,
+                                  'max_distance': index.max_distance}))
+        return
+
+    from model import load_checkpoint, model_fingerprint
+    from prediction import CLAIM_TYPES, MODEL_PATH, STUDENT_MODEL_PATH, MODEL_VARIANT, DEVICE
+
+    # the model the server loads, so the index lands in the directory it reads
+    path = STUDENT_MODEL_PATH if MODEL_VARIANT == 'student' else MODEL_PATH
+    model = load_checkpoint(path, num_claims=len(CLAIM_TYPES), device=DEVICE)
+    index = ImageIndex.for_model(model_fingerprint(model, path), base=args.dir)
+
+    verdicts = None
+    if args.verdicts:
+        with open(args.verdicts, 'r', encoding='utf-8') as f:
+            verdicts = json.load(f)
+    added, skipped = bulk_load(index, args.folder, model, verdicts)
+    print(f"✅ Indexed {added} images ({skipped} skipped or already present)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""
+Background jobs for long-running video verification.
+
+POST /video_verify stores the upload, creates (or reuses) a job keyed by the
+SHA-256 of the video bytes and returns immediately. A bounded worker pool
+runs the pipeline and records per-phase progress:
+
+    queued -> audio -> transcription (chunk i, at position_s of duration_s)
+           -> upload -> questions -> analysis -> done | failed
+
+The transcription phase reports `fraction`, the share of the video's
+duration transcribed so far (null when the duration cannot be probed).
+A job's uploaded video is deleted once the job is done or failed, unless
+another job still running needs the same file.
+
+Jobs live in a small SQLite file so they survive restarts: anything still
+queued or running when the process died is resubmitted on startup.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import logs
+
+JOBS_DB = os.getenv('JOBS_DB', 'jobs.db')
+VIDEO_WORKERS = int(os.getenv('VIDEO_WORKERS', '2'))
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+PHASES = ['audio', 'transcription', 'upload', 'questions', 'analysis']
+
+log = logs.get('jobs')
+
+
+class JobStore:
+    def __init__(self, path=JOBS_DB):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    video_path TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    phase TEXT,
+                    progress TEXT,
+                    result TEXT,
+                    error TEXT,
+                    version INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self.conn.execute('CREATE INDEX IF NOT EXISTS jobs_hash ON jobs(content_hash)')
+
+    def _row(self, row):
+        if row is None:
+            return None
+        job = dict(row)
+        job['progress'] = json.loads(job['progress']) if job['progress'] else {}
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def create(self, content_hash, video_path):
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT INTO jobs (id, content_hash, video_path, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, content_hash, video_path, QUEUED, now, now)
+            )
+        return job_id
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._row(row)
+
+    def find_by_hash(self, content_hash):
+        """Most recent job for this content that has not failed."""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT * FROM jobs WHERE content_hash = ? AND status != ? ORDER BY created_at DESC LIMIT 1',
+                (content_hash, FAILED)
+            ).fetchone()
+        return self._row(row)
+
+    def unfinished(self):
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY created_at', (QUEUED, RUNNING)
+            ).fetchall()
+        return [self._row(r) for r in rows]
+
+    def update(self, job_id, **fields):
+        for key in ('progress', 'result'):
+            if key in fields and fields[key] is not None:
+                fields[key] = json.dumps(fields[key], ensure_ascii=False)
+        fields['updated_at'] = time.time()
+        cols = ', '.join(f'{k} = ?' for k in fields)
+        with self.lock, self.conn:
+            self.conn.execute(
+                f'UPDATE jobs SET {cols}, version = version + 1 WHERE id = ?',
+                (*fields.values(), job_id)
+            )
+
+
+def public_view(job):
+    view = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'phase': job['phase'],
+        'progress': job['progress'],
+        'version': job['version'],
+        'created_at': job['created_at'],
+        'updated_at': job['updated_at'],
+    }
+    if job['status'] == DONE:
+        view['result'] = job['result']
+    if job['status'] == FAILED:
+        view['error'] = job['error']
+    return view
+
+
+class JobManager:
+    """
+    runner(video_path, progress) -> result dict. `progress(phase, **info)`
+    is how the pipeline reports where it is. `pool` may be an
+    admission.RequestClass, whose check() then gates new (not resumed) jobs.
+    """
+    def __init__(self, runner, store=None, workers=VIDEO_WORKERS, pool=None):
+        self.runner = runner
+        self.store = store or JobStore()
+        self.pool = pool or ThreadPoolExecutor(max_workers=workers, thread_name_prefix='video-job')
+        self.inflight = {}               # job id -> video path
+        self.lock = threading.Lock()
+
+    def submit(self, video_path, content_hash, force=False):
+        """Return (job_id, deduplicated). force=True always starts a new job."""
+        with self.lock:
+            existing = None if force else self.store.find_by_hash(content_hash)
+            if existing is not None:
+                self._release(video_path)
+                return existing['id'], True
+            if hasattr(self.pool, 'check'):
+                try:
+                    self.pool.check()
+                except Exception:
+                    self._release(video_path)
+                    raise
+            job_id = self.store.create(content_hash, video_path)
+            self._schedule(job_id, video_path)
+        return job_id, False
+
+    def _schedule(self, job_id, video_path):
+        """Call with self.lock held."""
+        self.inflight[job_id] = video_path
+        if hasattr(self.pool, 'check'):
+            # past the class deadline the job never starts; fail it instead of leaving it queued
+            self.pool.submit(self._run, job_id, video_path, on_expired=lambda: self._shed(job_id, video_path))
+        else:
+            self.pool.submit(self._run, job_id, video_path)
+
+    def _shed(self, job_id, video_path):
+        log.warning('video job shed', extra=logs.fields(job=job_id))
+        self.store.update(job_id, status=FAILED, error='shed: queued too long')
+        with self.lock:
+            self.inflight.pop(job_id, None)
+            self._release(video_path)
+
+    def _release(self, video_path):
+        """Delete an uploaded video no queued or running job needs; call with self.lock held."""
+        if video_path in self.inflight.values():
+            return
+        try:
+            os.remove(video_path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            log.warning('could not remove video upload', extra=logs.fields(path=video_path), exc_info=True)
+
+    def resume(self):
+        """Resubmit jobs left queued/running by a previous process."""
+        resumed = 0
+        with self.lock:
+            for job in self.store.unfinished():
+                if job['id'] in self.inflight:
+                    continue
+                if not os.path.exists(job['video_path']):
+                    self.store.update(job['id'], status=FAILED, error='video file missing after restart')
+                    continue
+                self.store.update(job['id'], status=QUEUED, phase=None)
+                self._schedule(job['id'], job['video_path'])
+                resumed += 1
+        return resumed
+
+    def _run(self, job_id, video_path):
+        self.store.update(job_id, status=RUNNING)
+
+        def progress(phase, **info):
+            self.store.update(job_id, phase=phase, progress={'phase': phase, **info})
+
+        # the job id is the correlation id for everything the pipeline logs
+        logs.request_id.set(job_id)
+        try:
+            result = self.runner(video_path, progress)
+            self.store.update(job_id, status=DONE, phase='done', progress={'phase': 'done'}, result=result)
+        except Exception as e:
+            log.error('video job failed', exc_info=True)
+            self.store.update(job_id, status=FAILED, error=str(e))
+        finally:
+            with self.lock:
+                self.inflight.pop(job_id, None)
+                self._release(video_path)
+
+    def get(self, job_id):
+        job = self.store.get(job_id)
+        return None if job is None else public_view(job)
@@ -0,0 +1,253 @@
+"""
+Local stand-ins for the paid services used by /analyze and /video_verify:
+
+    SerpAPI   -> FakeGoogleSearch         (replaces prediction.GoogleSearch)
+    Gemini    -> FakeGenAI                (replaces genai.GenerativeModel /
+                                           upload_file / get_file)
+    Sarvam    -> FakeSarvamServer         (local HTTP server, points
+                                           video_repr.SARVAM_STT_URL at it)
+
+Each fake takes a Faults object for latency and error injection. These
+are the only stand-ins for external services; benchmarks/stubs.py holds
+the local ones (random-weight model, tokenizer, zero-shot classifier).
+"""
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+@dataclass
+class Faults:
+    latency_ms: float = 0.0     # mean added latency per call
+    jitter_ms: float = 0.0      # uniform +/- jitter around latency_ms
+    error_rate: float = 0.0     # probability a call fails
+    hang_rate: float = 0.0      # probability a call sleeps for hang_ms
+    hang_ms: float = 30000.0
+
+    @classmethod
+    def parse(cls, spec):
+        """'latency_ms=200,error_rate=0.05' -> Faults"""
+        kwargs = {}
+        for part in filter(None, (spec or '').split(',')):
+            key, value = part.split('=')
+            kwargs[key.strip()] = float(value)
+        return cls(**kwargs)
+
+    def apply(self, rng=random):
+        """Sleep for the configured latency, then return True if this call should fail."""
+        if self.hang_rate and rng.random() < self.hang_rate:
+            time.sleep(self.hang_ms / 1000)
+        delay = self.latency_ms + rng.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        return self.error_rate > 0 and rng.random() < self.error_rate
+
+
+class InjectedFault(RuntimeError):
+    pass
+
+
+# ---------------- SerpAPI ----------------
+
+def make_fake_google_search(faults):
+    class FakeGoogleSearch:
+        def __init__(self, params):
+            self.params = params
+
+        def get_dict(self):
+            if faults.apply():
+                raise InjectedFault('serpapi: injected error')
+            q = self.params.get('q', '')
+            return {
+                'organic_results': [
+                    {'title': f'Fake result {i}', 'snippet': q[:80], 'link': f'https://example.org/{i}'}
+                    for i in range(self.params.get('num', 5))
+                ]
+            }
+    return FakeGoogleSearch
+
+
+# ---------------- Gemini ----------------
+
+QUESTIONS_RESPONSE = {
+    'questions': (
+        [f'SKEPTIC: stub question {i}' for i in range(5)]
+        + [f'DEFENDER: stub question {i}' for i in range(5)]
+        + [f'NEUTRAL: stub question {i}' for i in range(5)]
+    )
+}
+
+ANALYSIS_RESPONSE = {
+    'answers': [
+        {'question': q, 'answer': 'stub answer', 'confidence': 50, 'supports_fake': False}
+        for q in QUESTIONS_RESPONSE['questions']
+    ],
+    'verdict': {
+        'classification': 'UNCERTAIN',
+        'confidence': 50,
+        'key_reasons': ['stub'],
+        'recommendation': 'verify'
+    }
+}
+
+FAKE_SUMMARY = (
+    '### 1. EXECUTIVE SUMMARY\nFake summary for load testing.\n\n'
+    '### 2. TEXT ANALYSIS\nThe headline was scored by a local stub, not by Gemini.\n\n'
+    '### 3. RECOMMENDATION\nNothing here reflects a real model.'
+)
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+
+class _State:
+    def __init__(self, name):
+        self.name = name
+
+
+class _File:
+    def __init__(self, name, state):
+        self.name = name
+        self.state = _State(state)
+
+
+class FakeGenAI:
+    """
+    Drop-in for the parts of google.generativeai the backend uses.
+    `upload` faults apply to upload_file, `generate` faults to generate_content;
+    uploaded files stay PROCESSING for `processing_ms`. With stream=True,
+    generate_content yields the reply word by word, `stream_chunk_ms` apart.
+    """
+    def __init__(self, generate=None, upload=None, processing_ms=0.0, stream_chunk_ms=20.0):
+        self.generate_faults = generate or Faults()
+        self.upload_faults = upload or Faults()
+        self.processing_ms = processing_ms
+        self.stream_chunk_ms = stream_chunk_ms
+        self.files = {}
+        self.lock = threading.Lock()
+        self.counter = 0
+        fake = self
+
+        class GenerativeModel:
+            def __init__(self, model_name=None, **kwargs):
+                self.model_name = model_name
+
+            def generate_content(self, contents, stream=False, **kwargs):
+                response = fake.generate_content(contents)
+                return fake.stream(response.text) if stream else response
+
+        self.GenerativeModel = GenerativeModel
+
+    def configure(self, **kwargs):
+        pass
+
+    def upload_file(self, path, **kwargs):
+        if self.upload_faults.apply():
+            raise InjectedFault('gemini upload: injected error')
+        with self.lock:
+            self.counter += 1
+            name = f'files/fake-{self.counter}'
+            self.files[name] = time.monotonic() + self.processing_ms / 1000
+        return self.get_file(name)
+
+    def get_file(self, name):
+        ready_at = self.files.get(name, 0)
+        state = 'ACTIVE' if time.monotonic() >= ready_at else 'PROCESSING'
+        return _File(name, state)
+
+    def stream(self, text):
+        for word in re.findall(r'\S+\s*', text):
+            time.sleep(self.stream_chunk_ms / 1000)
+            yield _Response(word)
+
+    def generate_content(self, contents):
+        if self.generate_faults.apply():
+            raise InjectedFault('gemini generate: injected error')
+        prompt = contents[0] if isinstance(contents, (list, tuple)) else contents
+        if 'VERIFICATION QUESTIONS' in prompt:
+            return _Response(json.dumps(ANALYSIS_RESPONSE))
+        if 'Generate verification questions' in prompt:
+            return _Response(json.dumps(QUESTIONS_RESPONSE))
+        return _Response(FAKE_SUMMARY)
+
+
+# ---------------- Sarvam STT ----------------
+
+class FakeSarvamServer:
+    """
+    Threaded HTTP server answering POST /speech-to-text like Sarvam does.
+
+        with FakeSarvamServer(Faults(latency_ms=300)) as srv:
+            video_repr.SARVAM_STT_URL = srv.url
+    """
+    def __init__(self, faults=None, host='127.0.0.1', port=0):
+        self.faults = faults or Faults()
+        faults_ref = self.faults
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                self.rfile.read(length)
+                if faults_ref.apply():
+                    body = b'{"error": "injected"}'
+                    self.send_response(500)
+                else:
+                    body = json.dumps({'transcript': 'ಇದು ಪರೀಕ್ಷಾ ಪ್ರತಿಲೇಖನ'}).encode('utf-8')
+                    self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/speech-to-text'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+def install(serp=None, gemini=None, upload=None, sarvam_url=None, processing_ms=0.0):
+    """
+    Point the backend modules at the fakes. Returns the FakeGenAI instance.
+    Must be called after importing prediction / video_repr.
+    """
+    import prediction
+    import video_repr
+
+    prediction.GoogleSearch = make_fake_google_search(serp or Faults())
+
+    fake_genai = FakeGenAI(generate=gemini, upload=upload, processing_ms=processing_ms)
+    for module in (prediction, video_repr):
+        module.genai = fake_genai
+
+    if sarvam_url:
+        video_repr.SARVAM_STT_URL = sarvam_url
+    return fake_genai
@@ -0,0 +1,273 @@
+"""
+Open-loop load generator for /analyze and /video_verify.
+
+Run from the backend directory. In-process (random-weight model, all
+external services faked):
+
+    python -m loadtest.run --endpoint analyze --rps 2 --duration 30
+    python -m loadtest.run --endpoint video_verify --video sample.mp4 \\
+        --rps 0.5 --gemini latency_ms=2000,error_rate=0.1 --sarvam latency_ms=400
+
+Against a running server (start it with the fakes yourself, or let it call
+the real services if you mean to):
+
+    python -m loadtest.run --url http://localhost:8000 --endpoint analyze --rps 5
+
+Requests are fired on a fixed schedule regardless of how long earlier ones
+take, so queueing shows up as latency instead of a lower send rate. The
+per-stage breakdown is the delta of stage_latency_seconds on /metrics over
+the run.
+"""
+import argparse
+import contextlib
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from loadtest.fakes import Faults, FakeSarvamServer, install
+from sandbox import use_temp_state
+
+METRIC_RE = re.compile(r'^stage_latency_seconds_(sum|count)\{endpoint="([^"]*)",stage="([^"]*)"\} (\S+)$')
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    idx = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+
+def parse_stage_metrics(text):
+    stages = {}
+    for line in text.splitlines():
+        m = METRIC_RE.match(line)
+        if m:
+            kind, endpoint, stage, value = m.groups()
+            stages.setdefault((endpoint, stage), {'sum': 0.0, 'count': 0.0})[kind] = float(value)
+    return stages
+
+
+class Target:
+    """Wraps either an in-process TestClient or a remote base URL."""
+    def __init__(self, url=None):
+        if url:
+            import requests
+            self.session = requests.Session()
+            self.base = url.rstrip('/')
+            self.client = None
+        else:
+            from fastapi.testclient import TestClient
+            import server
+            self.client = TestClient(server.app)
+            self.session = None
+            self.base = ''
+
+    def post(self, path, **kwargs):
+        if self.client is not None:
+            return self.client.post(path, **kwargs)
+        return self.session.post(self.base + path, **kwargs)
+
+    def get(self, path):
+        if self.client is not None:
+            return self.client.get(path)
+        return self.session.get(self.base + path)
+
+
+def make_request(endpoint, args):
+    if endpoint == 'analyze':
+        with open(args.image, 'rb') as f:
+            image_bytes = f.read()
+
+        def send(target):
+            return target.post(
+                '/analyze',
+                data={'title': args.title},
+                files={'image': (os.path.basename(args.image), image_bytes, 'image/jpeg')}
+            )
+        return send
+
+    if endpoint == 'video_verify':
+        if not args.video:
+            raise SystemExit('--video is required for video_verify')
+        with open(args.video, 'rb') as f:
+            video_bytes = f.read()
+
+        def send(target):
+            # force=true so identical uploads are not collapsed into one job
+            r = target.post(
+                '/video_verify',
+                data={'force': 'true'},
+                files={'video': (os.path.basename(args.video), video_bytes, 'video/mp4')}
+            )
+            if r.status_code >= 400:
+                return r
+            status_url = r.json()['status_url']
+            while True:
+                r = target.get(status_url)
+                if r.status_code >= 400 or r.json()['status'] in ('done', 'failed'):
+                    break
+                time.sleep(args.poll_interval)
+            if r.status_code < 400 and r.json()['status'] == 'failed':
+                r.status_code = 500
+            return r
+        return send
+
+    raise SystemExit(f'unknown endpoint {endpoint}')
+
+
+def setup_in_process(args):
+    """Random-weight model, stub tokenizer/classifier, fakes for every service."""
+    use_temp_state('loadtest_state_')
+    from benchmarks import stubs
+    import server
+
+    sarvam = FakeSarvamServer(Faults.parse(args.sarvam)).start()
+    install(
+        serp=Faults.parse(args.serp),
+        gemini=Faults.parse(args.gemini),
+        upload=Faults.parse(args.upload),
+        sarvam_url=sarvam.url,
+        processing_ms=args.processing_ms,
+    )
+    tokenizer = stubs.make_tokenizer()
+    server.model = stubs.make_model(tokenizer)
+    server.tokenizer = tokenizer
+    server.classifier = stubs.stub_classifier()
+
+    if not args.image:
+        args.image = stubs.make_image(os.path.join(tempfile.mkdtemp(prefix='loadtest_'), 'load.jpg'))
+    if not args.title:
+        args.title = stubs.make_title(12)
+    return sarvam
+
+
+def run(args):
+    sarvam = None
+    if not args.url:
+        sarvam = setup_in_process(args)
+    elif args.endpoint == 'analyze' and not args.image:
+        raise SystemExit('--image is required with --url for analyze')
+    args.title = args.title or 'ಸುದ್ದಿ ಪರೀಕ್ಷೆ'
+
+    target = Target(args.url)
+    send = make_request(args.endpoint, args)
+
+    before = parse_stage_metrics(target.get('/metrics').text)
+
+    results = []
+    lock = threading.Lock()
+
+    def fire(scheduled):
+        start = time.perf_counter()
+        try:
+            r = send(target)
+            status = r.status_code
+            error = None if status < 400 else f'http {status}'
+        except Exception as e:
+            status, error = None, type(e).__name__
+        end = time.perf_counter()
+        with lock:
+            results.append({
+                'latency': end - start,
+                'lag': start - scheduled,
+                'status': status,
+                'error': error,
+            })
+
+    interval = 1.0 / args.rps
+    total = int(args.rps * args.duration)
+    print(f'sending {total} requests to /{args.endpoint} at {args.rps} rps', file=sys.stderr)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for i in range(total):
+            scheduled = t0 + i * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(fire, scheduled)
+    wall = time.perf_counter() - t0
+
+    after = parse_stage_metrics(target.get('/metrics').text)
+    if sarvam is not None:
+        sarvam.stop()
+
+    return report(args, results, wall, before, after)
+
+
+def report(args, results, wall, before, after):
+    latencies = sorted(r['latency'] for r in results)
+    errors = {}
+    for r in results:
+        if r['error']:
+            errors[r['error']] = errors.get(r['error'], 0) + 1
+    n = len(results)
+    ok = n - sum(errors.values())
+
+    stages = {}
+    for key, cur in after.items():
+        prev = before.get(key, {'sum': 0.0, 'count': 0.0})
+        count = cur['count'] - prev['count']
+        if count <= 0:
+            continue
+        endpoint, stage = key
+        stages.setdefault(endpoint, {})[stage] = {
+            'count': int(count),
+            'mean_ms': (cur['sum'] - prev['sum']) / count * 1000,
+        }
+
+    return {
+        'endpoint': args.endpoint,
+        'target_rps': args.rps,
+        'duration_s': wall,
+        'requests': n,
+        'throughput_rps': ok / wall if wall > 0 else 0.0,
+        'error_rate': (n - ok) / n if n else 0.0,
+        'errors': errors,
+        'latency_ms': {
+            'p50': (percentile(latencies, 0.50) or 0) * 1000,
+            'p95': (percentile(latencies, 0.95) or 0) * 1000,
+            'p99': (percentile(latencies, 0.99) or 0) * 1000,
+            'max': (latencies[-1] if latencies else 0) * 1000,
+        },
+        'max_send_lag_ms': max((r['lag'] for r in results), default=0) * 1000,
+        'stages': stages,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--endpoint', choices=['analyze', 'video_verify'], default='analyze')
+    parser.add_argument('--rps', type=float, default=1.0)
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds')
+    parser.add_argument('--concurrency', type=int, default=64, help='max in-flight requests')
+    parser.add_argument('--url', default=None, help='base URL of a running server; omit for in-process')
+    parser.add_argument('--title', default=None)
+    parser.add_argument('--image', default=None)
+    parser.add_argument('--video', default=None)
+    parser.add_argument('--serp', default='latency_ms=300', help='fault spec for SerpAPI')
+    parser.add_argument('--gemini', default='latency_ms=1500', help='fault spec for Gemini generate_content')
+    parser.add_argument('--upload', default='latency_ms=500', help='fault spec for Gemini upload_file')
+    parser.add_argument('--sarvam', default='latency_ms=400', help='fault spec for Sarvam STT')
+    parser.add_argument('--processing-ms', type=float, default=2000.0, help='time an uploaded video stays PROCESSING')
+    parser.add_argument('--poll-interval', type=float, default=0.25, help='job status poll interval for video_verify')
+    parser.add_argument('--out', default=None)
+    args = parser.parse_args(argv)
+
+    # the backend prints freely; keep stdout for the report
+    with contextlib.redirect_stdout(sys.stderr):
+        result = run(args)
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
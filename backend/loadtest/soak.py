@@ -0,0 +1,141 @@
+"""
+Soak test: run thousands of /analyze requests in-process and check that
+memory stays flat.
+
+    python -m loadtest.soak                          # 2000 analyses, small model
+    python -m loadtest.soak --iterations 5000 --model base --max-growth-mb 64
+
+Titles vary per request, so the tokenizer and summary caches fill up and
+then have to evict. Every request runs SHAP and Grad-CAM. Every
+--rollout-every requests, an attention rollout also runs on the same image,
+so both explainers' hooks and graphs are exercised. External services are
+the loadtest fakes.
+
+After --warmup requests (allocator pools and caches settle), RSS is
+sampled every --sample-every requests, after a gc.collect(). The run fails
+if any of these hold at the end:
+    - RSS grew more than --max-growth-mb over the measured window
+    - parameters hold .grad tensors
+    - more hooks are registered than at the start
+The report (JSON, stdout) includes the samples, a linear fit in MB per
+1000 requests and the final /debug/memory body.
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from loadtest.fakes import Faults, install
+from sandbox import use_temp_state
+
+
+def small_model(tokenizer):
+    """2-layer text encoder + ViT-Tiny: same code paths, minutes instead of hours for thousands of runs."""
+    from transformers import BertConfig
+    from model import FakeNewsModel
+    from prediction import CLAIM_TYPES
+    from benchmarks import stubs
+
+    stubs.seed_everything()
+    config = BertConfig(vocab_size=len(tokenizer), hidden_size=256, num_hidden_layers=2,
+                        num_attention_heads=4, intermediate_size=512)
+    return FakeNewsModel(num_claims=len(CLAIM_TYPES), text_config=config, pretrained=False,
+                         image_arch='vit_tiny').eval()
+
+
+def linear_fit(xs, ys):
+    n = len(xs)
+    if n < 2:
+        return 0.0
+    mx, my = sum(xs) / n, sum(ys) / n
+    var = sum((x - mx) ** 2 for x in xs)
+    return sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / var if var else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--warmup', type=int, default=100)
+    parser.add_argument('--sample-every', type=int, default=50)
+    parser.add_argument('--rollout-every', type=int, default=10, help='0 = never')
+    parser.add_argument('--max-growth-mb', type=float, default=32.0)
+    parser.add_argument('--model', choices=('small', 'base'), default='small')
+    args = parser.parse_args(argv)
+
+    use_temp_state('soak_state_')
+    with contextlib.redirect_stdout(sys.stderr):
+        from fastapi.testclient import TestClient
+        from PIL import Image
+        from benchmarks import stubs
+        import memory_debug
+        import prediction
+        import server
+
+        install(serp=Faults(), gemini=Faults())
+        tokenizer = stubs.make_tokenizer()
+        server.tokenizer = tokenizer
+        server.model = small_model(tokenizer) if args.model == 'small' else stubs.make_model(tokenizer)
+        server.classifier = stubs.stub_classifier()
+        # for the final /debug/memory report
+        server.DEBUG_ENDPOINTS = True
+        server.app.router.on_startup.clear()
+        client = TestClient(server.app)
+
+        image_path = stubs.make_image(os.path.join(tempfile.mkdtemp(prefix='soak_'), 'soak.jpg'))
+        with open(image_path, 'rb') as f:
+            image_bytes = f.read()
+        image_tensor = prediction.img_transform(Image.open(image_path).convert('RGB')).unsqueeze(0)
+        rng = random.Random(stubs.SEED)
+
+        start_hooks = memory_debug.hook_counts(server.model)
+        samples = []
+        failures = 0
+        t0 = time.perf_counter()
+        for i in range(1, args.iterations + 1):
+            title = stubs.make_title(rng.randint(4, 24), seed=rng.randrange(1 << 30))
+            r = client.post('/analyze', data={'title': title},
+                            files={'image': ('soak.jpg', image_bytes, 'image/jpeg')})
+            failures += r.status_code != 200
+            if args.rollout_every and i % args.rollout_every == 0:
+                prediction.compute_attention_map(image_tensor, server.model, method='rollout')
+            if i >= args.warmup and (i - args.warmup) % args.sample_every == 0:
+                gc.collect()
+                rss = memory_debug.rss()['rss_bytes']
+                samples.append({'iteration': i, 'rss_mb': round(rss / (1 << 20), 1),
+                                'elapsed_s': round(time.perf_counter() - t0, 1)})
+                print(f"soak {i}/{args.iterations}: rss {samples[-1]['rss_mb']} MB", file=sys.stderr)
+
+        final = client.get('/debug/memory', params={'limit': 10}).json()
+
+    growth = samples[-1]['rss_mb'] - samples[0]['rss_mb'] if samples else 0.0
+    slope = linear_fit([s['iteration'] for s in samples], [s['rss_mb'] for s in samples]) * 1000
+    end_hooks = final['hooks']['fake_news']
+    problems = []
+    if growth > args.max_growth_mb:
+        problems.append(f'RSS grew {growth:.1f} MB (limit {args.max_growth_mb} MB)')
+    if final['tensors']['param_grads']['count']:
+        problems.append(f"{final['tensors']['param_grads']['count']} tensors hold .grad")
+    if any(end_hooks.get(k, 0) > v for k, v in start_hooks.items()):
+        problems.append(f'hooks leaked: {start_hooks} -> {end_hooks}')
+    if failures:
+        problems.append(f'{failures} requests failed')
+
+    print(json.dumps({
+        'iterations': args.iterations,
+        'model': args.model,
+        'rss_growth_mb': round(growth, 1),
+        'rss_mb_per_1000': round(slope, 2),
+        'samples': samples,
+        'problems': problems,
+        'memory': final,
+    }, indent=2))
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
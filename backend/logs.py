@@ -0,0 +1,173 @@
+"""
+Structured, non-blocking logging for the request path.
+
+Request threads never write the log themselves. A record is put on a
+bounded queue (LOG_QUEUE_SIZE) and one listener thread formats it and
+writes it to stderr. If the sink is slow (container log back-pressure)
+and the queue fills, new records are dropped and counted in
+log_records_dropped_total instead of stalling requests. stdout is left to
+the CLI tools, whose reports (benchmarks.run, loadtest) must stay valid
+JSON.
+
+Every record carries the request's correlation id. server.py takes it
+from the X-Request-ID header, or generates one, and returns it on the
+response. Video jobs use their job id. The id lives in a contextvar, so it
+follows work onto the admission and batch pools, which copy the context.
+
+    LOG_LEVEL     DEBUG | INFO (default) | WARNING | ERROR
+    LOG_FORMAT    text (default) | json (one object per line)
+
+Payloads (evidence dicts, LLM responses, SHAP insights) go through
+payload(). It renders them once and cuts them to LOG_PAYLOAD_CHARS. Full
+payloads are logged at DEBUG for a LOG_PAYLOAD_SAMPLE_RATE fraction of
+requests only.
+
+    log = logs.get(__name__)
+    log.info('model output', extra=logs.fields(prediction='FAKE', fake_prob=0.91))
+"""
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+from metrics import Counter, REGISTRY, METRICS_ENABLED
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+LOG_PAYLOAD_CHARS = int(os.getenv('LOG_PAYLOAD_CHARS', '2000'))
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', '0.01'))
+
+ROOT = 'fakenews'
+
+DROPPED = Counter(
+    'log_records_dropped_total',
+    'Log records dropped because the log queue was full',
+    ('level',)
+)
+REGISTRY.append(DROPPED)
+
+request_id = contextvars.ContextVar('request_id', default='-')
+
+
+def get(name):
+    return logging.getLogger(f'{ROOT}.{name}')
+
+
+def fields(**kv):
+    """extra= for a structured record: fields are kept as data, not formatted into the message."""
+    return {'fields': kv}
+
+
+def sampled():
+    """Whether this request's full payloads should be logged (at DEBUG)."""
+    return LOG_PAYLOAD_SAMPLE_RATE > 0 and random.random() < LOG_PAYLOAD_SAMPLE_RATE
+
+
+def payload(obj, limit=LOG_PAYLOAD_CHARS):
+    """obj as compact JSON (or str), cut to `limit` characters."""
+    if isinstance(obj, str):
+        text = obj
+    else:
+        try:
+            text = json.dumps(obj, ensure_ascii=False, default=str, separators=(',', ':'))
+        except (TypeError, ValueError):
+            text = repr(obj)
+    if limit and len(text) > limit:
+        return f'{text[:limit]}…(+{len(text) - limit} chars)'
+    return text
+
+
+class CorrelationFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks and defers formatting to the listener thread."""
+    def prepare(self, record):
+        # this handler is the only one on the fakenews logger, so the record can be handed over as is
+        if record.exc_info:
+            # tracebacks must be rendered while the frames are still meaningful
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if METRICS_ENABLED:
+                DROPPED.inc(level=record.levelname)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', '-'),
+            'msg': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = (f"{time.strftime('%H:%M:%S', time.localtime(record.created))} {record.levelname:<5} "
+                f"[{getattr(record, 'request_id', '-')}] {record.name.removeprefix(ROOT + '.')}: {record.getMessage()}")
+        extra = getattr(record, 'fields', None)
+        if extra:
+            line += ' ' + ' '.join(f'{k}={v}' for k, v in extra.items())
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return line
+
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def setup(stream=None, level=LOG_LEVEL, fmt=LOG_FORMAT, queue_size=LOG_QUEUE_SIZE):
+    """Route the fakenews.* loggers through the queue; idempotent unless called with a new stream."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            if stream is None:
+                return _listener
+            shutdown()
+        sink = logging.StreamHandler(stream or sys.stderr)
+        sink.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+        q = queue.Queue(maxsize=queue_size)
+        handler = DroppingQueueHandler(q)
+        handler.addFilter(CorrelationFilter())
+
+        root = logging.getLogger(ROOT)
+        root.handlers[:] = [handler]
+        root.setLevel(level)
+        root.propagate = False
+        _listener = logging.handlers.QueueListener(q, sink, respect_handler_level=False)
+        _listener.start()
+        return _listener
+
+
+def shutdown():
+    """Flush what is queued and stop the listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+setup()
@@ -0,0 +1,152 @@
+"""
+Memory diagnostics for long-running workers, served at GET /debug/memory
+when the server runs with DEBUG_ENDPOINTS=1.
+
+    rss          resident and peak set size of the process (from /proc)
+    tensors      live torch tensors found by the garbage collector, grouped by
+                 device and dtype, plus two leak signatures: tensors still
+                 attached to an autograd graph (grad_fn set) and parameters
+                 holding a .grad
+    hooks        forward/backward hooks registered on each loaded model,
+                 and the global module hooks
+    caches       entry counts of the in-process caches
+    tracemalloc  top Python allocation sites; with ?diff=1 the growth since
+                 the previous call that took a snapshot
+
+tracemalloc costs a few percent of CPU time, so it is off unless the
+process starts with TRACEMALLOC_FRAMES > 0 (frames kept per allocation) or
+a request passes ?tracemalloc=start. The tensor scan walks every object
+the GC tracks and holds the GIL while it does, so this is a debug
+endpoint, not something to scrape.
+
+loadtest/soak.py drives thousands of analyses and checks RSS through the
+same functions.
+"""
+import gc
+import os
+import threading
+import tracemalloc
+from collections import defaultdict
+
+import torch
+from torch.nn.modules import module as nn_module
+
+TRACEMALLOC_FRAMES = int(os.getenv('TRACEMALLOC_FRAMES', '0'))
+
+_baseline = None
+_baseline_lock = threading.Lock()
+
+
+def _snapshot():
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+
+
+def start_tracemalloc(frames=None):
+    global _baseline
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames or TRACEMALLOC_FRAMES or 1)
+    with _baseline_lock:
+        _baseline = _snapshot()
+
+
+if TRACEMALLOC_FRAMES > 0:
+    start_tracemalloc()
+
+
+def rss():
+    """Current and peak resident set size in bytes (Linux); None elsewhere."""
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+    except OSError:
+        return {'rss_bytes': None, 'peak_rss_bytes': None}
+
+    def kb(name):
+        value = fields.get(name)
+        return int(value.split()[0]) * 1024 if value else None
+    return {'rss_bytes': kb('VmRSS'), 'peak_rss_bytes': kb('VmHWM')}
+
+
+def tensors():
+    """Live tensors by device/dtype, and the ones that usually mean a leak."""
+    groups = defaultdict(lambda: {'count': 0, 'bytes': 0})
+    with_graph = 0
+    grads = {'count': 0, 'bytes': 0}
+    seen, seen_grads = set(), set()
+    for obj in gc.get_objects():
+        # type(), not isinstance(): lazy-import proxies answer __class__ by importing
+        if not issubclass(type(obj), torch.Tensor):
+            continue
+        if obj.grad_fn is not None:
+            with_graph += 1
+        grad = obj.grad if obj.is_leaf and obj.requires_grad else None
+        if grad is not None and id(grad) not in seen_grads:
+            seen_grads.add(id(grad))
+            grads['count'] += 1
+            grads['bytes'] += grad.nelement() * grad.element_size()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        group = groups[f'{obj.device}/{str(obj.dtype).replace("torch.", "")}']
+        group['count'] += 1
+        group['bytes'] += obj.nelement() * obj.element_size()
+    return {
+        'by_device_dtype': dict(sorted(groups.items(), key=lambda kv: -kv[1]['bytes'])),
+        'count': sum(g['count'] for g in groups.values()),
+        'bytes': sum(g['bytes'] for g in groups.values()),
+        'attached_to_graph': with_graph,
+        'param_grads': grads,
+    }
+
+
+def hook_counts(module):
+    counts = defaultdict(int)
+    for sub in module.modules():
+        counts['forward'] += len(sub._forward_hooks)
+        counts['forward_pre'] += len(sub._forward_pre_hooks)
+        counts['backward'] += len(sub._backward_hooks) + len(getattr(sub, '_backward_pre_hooks', ()))
+    return dict(counts)
+
+
+def global_hook_counts():
+    return {
+        'forward': len(nn_module._global_forward_hooks),
+        'forward_pre': len(nn_module._global_forward_pre_hooks),
+        'backward': len(nn_module._global_backward_hooks),
+    }
+
+
+def top_allocations(limit=25, diff=False):
+    if not tracemalloc.is_tracing():
+        return {'tracing': False}
+    global _baseline
+    snapshot = _snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    report = {'tracing': True, 'traced_bytes': current, 'traced_peak_bytes': peak}
+    if diff:
+        with _baseline_lock:
+            baseline, _baseline = _baseline, snapshot
+        if baseline is not None:
+            stats = snapshot.compare_to(baseline, 'lineno')[:limit]
+            report['growth'] = [{'site': str(s.traceback), 'size_diff': s.size_diff, 'count_diff': s.count_diff,
+                                 'size': s.size} for s in stats]
+            return report
+    report['top'] = [{'site': str(s.traceback), 'size': s.size, 'count': s.count}
+                     for s in snapshot.statistics('lineno')[:limit]]
+    return report
+
+
+def report(models=None, caches=None, limit=25, diff=False, scan_tensors=True):
+    """The /debug/memory body. `models`: name -> nn.Module; `caches`: name -> entry count."""
+    gc.collect()
+    body = {'rss': rss(), 'gc_objects': len(gc.get_objects())}
+    if scan_tensors:
+        body['tensors'] = tensors()
+    body['hooks'] = {name: hook_counts(m) for name, m in (models or {}).items() if m is not None}
+    body['hooks']['global'] = global_hook_counts()
+    body['caches'] = caches or {}
+    body['tracemalloc'] = top_allocations(limit, diff)
+    return body
@@ -0,0 +1,214 @@
+import os
+import time
+import threading
+import contextvars
+import functools
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') != '0'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+MEMORY_BUCKETS = tuple(2 ** p for p in range(20, 36))   # 1 MiB .. 32 GiB
+
+# endpoint label for everything observed while a request is being served
+current_endpoint = contextvars.ContextVar('current_endpoint', default='none')
+
+
+def _label_str(labels):
+    if not labels:
+        return ''
+    inner = ','.join(f'{k}="{v}"' for k, v in labels)
+    return '{' + inner + '}'
+
+
+class Histogram:
+    def __init__(self, name, doc, buckets, labelnames):
+        self.name = name
+        self.doc = doc
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, '') for n in self.labelnames)
+        with self.lock:
+            s = self.series.get(key)
+            if s is None:
+                s = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            for key, (counts, total, n) in sorted(self.series.items()):
+                base = list(zip(self.labelnames, key))
+                for b, c in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{_label_str(base + [("le", repr(float(b)))])} {c}')
+                lines.append(f'{self.name}_bucket{_label_str(base + [("le", "+Inf")])} {n}')
+                lines.append(f'{self.name}_sum{_label_str(base)} {total}')
+                lines.append(f'{self.name}_count{_label_str(base)} {n}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, doc, labelnames):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, '') for n in self.labelnames)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} counter']
+        with self.lock:
+            for key, v in sorted(self.series.items()):
+                lines.append(f'{self.name}{_label_str(list(zip(self.labelnames, key)))} {v}')
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value, **labels):
+        key = tuple(labels.get(n, '') for n in self.labelnames)
+        with self.lock:
+            self.series[key] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f'# TYPE {self.name} gauge'
+        return lines
+
+
+STAGE_LATENCY = Histogram(
+    'stage_latency_seconds',
+    'Wall time spent in each pipeline stage',
+    LATENCY_BUCKETS, ('endpoint', 'stage')
+)
+BATCH_SIZE = Histogram(
+    'batch_size',
+    'Number of items per model forward pass',
+    BATCH_BUCKETS, ('endpoint', 'stage')
+)
+MODEL_MEMORY = Histogram(
+    'model_memory_bytes',
+    'Parameter and buffer memory of loaded models, sampled at load time',
+    MEMORY_BUCKETS, ('endpoint', 'component')
+)
+CACHE_LOOKUPS = Counter(
+    'cache_lookups_total',
+    'Cache lookups by outcome',
+    ('endpoint', 'cache', 'result')
+)
+CACHE_HIT_RATIO = Gauge(
+    'cache_hit_ratio',
+    'Fraction of cache lookups that were hits',
+    ('endpoint', 'cache')
+)
+
+REGISTRY = [STAGE_LATENCY, BATCH_SIZE, MODEL_MEMORY, CACHE_LOOKUPS, CACHE_HIT_RATIO]
+
+
+class _Stage:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGE_LATENCY.observe(
+            time.perf_counter() - self.start,
+            endpoint=current_endpoint.get(), stage=self.name
+        )
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name):
+    """
+    Time a block of code as a pipeline stage:
+
+        with stage('serp_check'):
+            ...
+
+    Returns a shared no-op context manager when metrics are disabled.
+    """
+    if not METRICS_ENABLED:
+        return _NULL_STAGE
+    return _Stage(name)
+
+
+def timed(name):
+    """Decorator form of `stage`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe_batch(name, size):
+    if METRICS_ENABLED:
+        BATCH_SIZE.observe(size, endpoint=current_endpoint.get(), stage=name)
+
+
+def record_cache(cache, hit):
+    if not METRICS_ENABLED:
+        return
+    endpoint = current_endpoint.get()
+    key = (endpoint, cache, 'hit' if hit else 'miss')
+    series = CACHE_LOOKUPS.series
+    # count and read both outcomes under one lock, so concurrent lookups
+    # cannot publish a ratio from half-updated counts
+    with CACHE_LOOKUPS.lock:
+        series[key] = series.get(key, 0) + 1
+        hits = series.get((endpoint, cache, 'hit'), 0)
+        misses = series.get((endpoint, cache, 'miss'), 0)
+        CACHE_HIT_RATIO.set(hits / (hits + misses), endpoint=endpoint, cache=cache)
+
+
+def module_memory_bytes(module):
+    params = sum(p.numel() * p.element_size() for p in module.parameters())
+    buffers = sum(b.numel() * b.element_size() for b in module.buffers())
+    return params + buffers
+
+
+def record_model_memory(component, module):
+    if METRICS_ENABLED:
+        MODEL_MEMORY.observe(
+            module_memory_bytes(module),
+            endpoint=current_endpoint.get(), component=component
+        )
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
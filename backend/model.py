@@ -1,14 +1,21 @@
 # model.py
 
+import hashlib
 import math
+import os
 import torch
 import torch.nn as nn
 
-from transformers import AutoModel
+from transformers import AutoConfig, AutoModel
 from torchvision.models import vit_b_16
+from torchvision.models.vision_transformer import VisionTransformer
 import numpy as np
 import cv2
 
+import logs
+
+log = logs.get('model')
+
 
 class CrossAttention(nn.Module):
     def __init__(self, tdim, idim, fdim):
@@ -43,47 +50,111 @@ class CrossAttention(nn.Module):
         return torch.cat([t.squeeze(1), out], dim=-1)
 
 
+def build_image_encoder(image_arch, pretrained):
+    """ViT backbone with the classifier removed; returns (module, embedding dim)."""
+    if image_arch == 'vit_b_16':
+        vit = vit_b_16(weights="DEFAULT" if pretrained else None)
+    elif image_arch == 'vit_tiny':
+        # DeiT-Tiny shape; no torchvision weights, trained by distillation
+        vit = VisionTransformer(
+            image_size=224, patch_size=16, num_layers=12,
+            num_heads=3, hidden_dim=192, mlp_dim=768
+        )
+    else:
+        raise ValueError(f"Unknown image_arch: {image_arch}")
+    vit.heads = nn.Identity()   # Remove ViT classifier
+    return vit, vit.hidden_dim
+
+
+def build_heads(tdim, idim, num_claims):
+    """Cross-attention fusion plus the fake/real and claim-type heads."""
+    cross = CrossAttention(tdim, idim, 512)
+
+    FUSED_DIM = tdim + 512
+
+    # ---- FAKE / REAL HEAD ----
+    fake_head = nn.Sequential(
+        nn.Linear(FUSED_DIM, 256),
+        nn.ReLU(),
+        nn.Linear(256, 1),
+        nn.Sigmoid()
+    )
+
+    # ---- CLAIM TYPE HEAD ----
+    claim_head = nn.Sequential(
+        nn.Linear(FUSED_DIM, 256),
+        nn.ReLU(),
+        nn.Linear(256, num_claims)
+    )
+    return cross, fake_head, claim_head
+
+
 class FakeNewsModel(nn.Module):
-    def __init__(self, num_claims, TEXT_MODEL_NAME="google/muril-base-cased"):
+    def __init__(self, num_claims, TEXT_MODEL_NAME="google/muril-base-cased", text_config=None, pretrained=True,
+                 text_layers=None, image_arch='vit_b_16'):
+        """
+        text_config : optional transformers config; when given the text encoder is
+                      built from it with random weights instead of downloading
+                      TEXT_MODEL_NAME (used by benchmarks and offline tooling)
+        pretrained  : load ImageNet weights for the ViT
+        text_layers : keep only the first N transformer layers of the text encoder
+        image_arch  : 'vit_b_16' (default) or 'vit_tiny' for distilled students
+        """
         super().__init__()
 
         # ---- TEXT ENCODER ----
-        self.text_model = AutoModel.from_pretrained(TEXT_MODEL_NAME)
+        if text_config is not None:
+            self.text_model = AutoModel.from_config(text_config)
+        else:
+            self.text_model = AutoModel.from_pretrained(TEXT_MODEL_NAME)
+        if text_layers is not None:
+            self.text_model.encoder.layer = self.text_model.encoder.layer[:text_layers]
+            self.text_model.config.num_hidden_layers = text_layers
+        tdim = self.text_model.config.hidden_size
 
         # ---- IMAGE ENCODER ----
-        self.image_model = vit_b_16(weights="DEFAULT")
-        self.image_model.heads = nn.Identity()   # Remove ViT classifier
+        self.image_model, idim = build_image_encoder(image_arch, pretrained)
 
-        # ---- FUSION ----
-        self.cross = CrossAttention(768, 768, 512)
+        self.config = {
+            'num_claims': num_claims,
+            'TEXT_MODEL_NAME': TEXT_MODEL_NAME,
+            'text_layers': text_layers,
+            'image_arch': image_arch,
+        }
 
-        FUSED_DIM = 768 + 512
-
-        # ---- FAKE / REAL HEAD ----
-        self.fake_head = nn.Sequential(
-            nn.Linear(FUSED_DIM, 256),
-            nn.ReLU(),
-            nn.Linear(256, 1),
-            nn.Sigmoid()
-        )
+        # ---- FUSION + HEADS ----
+        self.cross, self.fake_head, self.claim_head = build_heads(tdim, idim, num_claims)
 
-        # ---- CLAIM TYPE HEAD ----
-        self.claim_head = nn.Sequential(
-            nn.Linear(FUSED_DIM, 256),
-            nn.ReLU(),
-            nn.Linear(256, num_claims)
-        )
-
-    def forward(self, ids, mask, img):
+    def encode_text(self, ids, mask):
         # Text CLS embedding
-        txt = self.text_model(
+        return self.text_model(
             ids,
             attention_mask=mask
         ).last_hidden_state[:, 0, :]
 
+    def encode_image(self, img):
         # Image embedding
-        img = self.image_model(img)  # (B,768)
+        return self.image_model(img)  # (B,768)
+
+    def blank_image_embedding(self):
+        """
+        ViT embedding of an all-zero image, computed once. Text-only scoring
+        (SHAP, the cascade's first stage) fuses against this instead of
+        running the image encoder on a blank batch every time.
+        """
+        cached = getattr(self, '_blank_image_emb', None)
+        p = next(self.image_model.parameters())
+        if cached is None or cached.device != p.device or cached.dtype != p.dtype:
+            with torch.no_grad():
+                cached = self.encode_image(torch.zeros(1, 3, 224, 224, device=p.device, dtype=p.dtype))
+            self._blank_image_emb = cached
+        return cached
+
+    def load_state_dict(self, *args, **kwargs):
+        self._blank_image_emb = None
+        return super().load_state_dict(*args, **kwargs)
 
+    def heads(self, txt, img):
         # Cross-attention fusion
         fused = self.cross(txt, img)
 
@@ -91,6 +162,71 @@ class FakeNewsModel(nn.Module):
         claim_out = self.claim_head(fused)
 
         return fake_out, claim_out
+
+    def forward(self, ids, mask, img):
+        txt = self.encode_text(ids, mask)
+        img = self.encode_image(img)
+        return self.heads(txt, img)
+    
+def save_checkpoint(model, path, **extra):
+    """Self-describing checkpoint: architecture config plus weights."""
+    torch.save({
+        'config': model.config,
+        'text_config': model.text_model.config.to_dict(),
+        'state_dict': model.state_dict(),
+        **extra
+    }, path)
+
+
+def load_checkpoint(path, num_claims, device):
+    """
+    Load either the original bare state_dict (best_model.pth) or a checkpoint
+    written by save_checkpoint, such as a distilled student.
+    """
+    ckpt = torch.load(path, map_location=device)
+    if isinstance(ckpt, dict) and 'config' in ckpt and 'state_dict' in ckpt:
+        text_config = dict(ckpt['text_config'])
+        model_type = text_config.pop('model_type')
+        config = dict(ckpt['config'])
+        config.pop('num_claims', None)
+        model = FakeNewsModel(
+            num_claims=num_claims,
+            text_config=AutoConfig.for_model(model_type, **text_config),
+            pretrained=False,
+            **config
+        )
+        # text_layers already applied through text_config.num_hidden_layers
+        model.load_state_dict(ckpt['state_dict'])
+    else:
+        model = FakeNewsModel(num_claims=num_claims)
+        model.load_state_dict(ckpt)
+    model.to(device)
+    model.eval()
+    return model
+
+
+def model_fingerprint(model, checkpoint_path=None):
+    """
+    Short id of the encoders whose embeddings the claim and image indexes
+    store: text and image embedding sizes (from the fusion layer, so it works
+    for RemoteModel too) plus a hash of the checkpoint file. Indexes are kept
+    in a directory per fingerprint, so a student never reads a teacher's
+    768-dim vectors.
+    """
+    tdim = model.cross.query.weight.shape[1]
+    idim = model.cross.key.weight.shape[1]
+    h = hashlib.sha256()
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        with open(checkpoint_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    else:
+        # no file (random weights, tests): hash the weights themselves
+        for name, tensor in sorted(model.state_dict().items()):
+            h.update(name.encode())
+            h.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return f't{tdim}-i{idim}-{h.hexdigest()[:16]}'
+
     
 class GradCAMViT:
     """
@@ -126,17 +262,14 @@ class GradCAMViT:
         if features.dim() > 2:
             features = features.reshape(features.size(0), -1)
         
-        # Backward pass
-        self.model.zero_grad()
-        if img_tensor.grad is not None:
-            img_tensor.grad.zero_()
-        
-        # Target: sum of all features
-        target = features.sum()
-        target.backward()
+        # Target: the strongest feature, as Grad-CAM targets the top class.
+        # The sum of all features is constant under the final LayerNorm when
+        # its gain is uniform (as at init), so its gradient vanishes.
+        target = features.max(dim=1).values.sum()
         
-        # Get gradients w.r.t input
-        gradients = img_tensor.grad.data
+        # Gradients w.r.t. the input only. backward() would also fill .grad on
+        # every ViT parameter (~340 MB for ViT-B/16) and keep it between calls.
+        gradients, = torch.autograd.grad(target, img_tensor)
         
         # Generate CAM
         cam = gradients.squeeze(0).cpu().numpy()  # (3, 224, 224)
@@ -162,6 +295,11 @@ class VITAttentionrollout:
         self.hooks = []
         self.attention_maps = []
     
+    def need_weights_hook(self, module, args, kwargs):
+        kwargs['need_weights'] = True
+        kwargs['average_attn_weights'] = False
+        return args, kwargs
+
     def get_attention_hook(self, module, input, output):
         """
         Hook for PyTorch MultiheadAttention
@@ -183,24 +321,32 @@ class VITAttentionrollout:
         # Register hooks on all self_attention modules
         for name, module in self.model.named_modules():
             if 'self_attention' in name:
+                if isinstance(module, nn.MultiheadAttention):
+                    # torchvision's EncoderBlock calls attention with
+                    # need_weights=False, so force the weights out
+                    pre = module.register_forward_pre_hook(self.need_weights_hook, with_kwargs=True)
+                    self.hooks.append(pre)
                 hook = module.register_forward_hook(self.get_attention_hook)
                 self.hooks.append(hook)
         
-        # Forward pass with attention output
-        with torch.no_grad():
-            _ = self.model(img_tensor)
-        
-        # Clean up hooks
-        self.clear_hooks()
+        # Forward pass with attention output; hooks come off even if it fails,
+        # otherwise every later forward would keep appending attention maps
+        try:
+            with torch.no_grad():
+                _ = self.model(img_tensor)
+            attention_maps = self.attention_maps
+        finally:
+            # Clean up hooks (this also resets self.attention_maps)
+            self.clear_hooks()
         
-        if len(self.attention_maps) == 0:
+        if len(attention_maps) == 0:
             raise ValueError("No attention maps captured. Check if model returns attention weights.")
         
-        print(f"Captured {len(self.attention_maps)} attention layers")
+        log.debug('attention rollout', extra=logs.fields(layers=len(attention_maps)))
         
         # Process attention maps
         processed_attns = []
-        for attn in self.attention_maps:
+        for attn in attention_maps:
             # Handle different attention formats
             if attn.dim() == 4:
                 # (B, num_heads, T, T) -> (B, T, T)
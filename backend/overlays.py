@@ -0,0 +1,198 @@
+"""
+Grad-CAM / rollout overlays for many images at once.
+
+render() draws what prediction.vit_explain draws, one overlay per
+(image, attention map) pair, but batch-wise:
+    1. images are read and resized to 224x224 on OVERLAY_WORKERS threads
+       (cv2 releases the GIL while decoding)
+    2. the maps are stacked into one tensor, upsampled with a single
+       bilinear F.interpolate when they are not 224x224 already, and
+       min-max normalized per image in one op
+    3. colour-mapped and blended with one cv2.applyColorMap and one
+       cv2.addWeighted over the whole batch, stacked into a single
+       (N*224, 224) image
+    4. encoded and stored in the artefact store on the same threads
+For Grad-CAM maps, which are 224x224 already, the pixels and so the
+content-addressed file names are the same as drawing each pair on its own
+with cv2. Maps that need upsampling (rollout's 14x14 grid) can land one
+grey level apart at a few pixels, because torch and cv2 round bilinear
+weights differently in the last bit. attention_score, max_attention and
+std_attention are still computed on each original map, so the numbers and
+prediction.interpret_attention's text do not change.
+
+OverlayBatch collects overlays from concurrent finish_analysis calls
+(batch.run) and draws them with one render() call.
+"""
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image
+
+import artefacts
+from metrics import observe_batch, stage
+
+OVERLAY_WORKERS = int(os.getenv('OVERLAY_WORKERS', '4'))
+SIZE = 224
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=OVERLAY_WORKERS, thread_name_prefix='overlay')
+        return _pool
+
+
+def load_image(source):
+    """
+    A path (read with cv2, as vit_explain does), a PIL image or a BGR
+    array, resized to 224x224 BGR.
+    """
+    if isinstance(source, Image.Image):
+        img = cv2.cvtColor(np.asarray(source.convert('RGB')), cv2.COLOR_RGB2BGR)
+    elif isinstance(source, (str, os.PathLike)):
+        img = cv2.imread(source)
+    else:
+        img = source
+    if img is None:
+        raise ValueError(f"Could not load image from {source}")
+    return cv2.resize(img, (SIZE, SIZE))
+
+
+def _upsample(stacked):
+    if stacked.shape[1:] == (SIZE, SIZE):
+        return stacked
+    # cv2.resize(INTER_LINEAR) samples at pixel centres, as align_corners=False does
+    return F.interpolate(stacked[:, None], size=(SIZE, SIZE), mode='bilinear', align_corners=False)[:, 0]
+
+
+def normalize(attention_maps):
+    """The maps as one (N, 224, 224) uint8 array, each scaled to 0-255 on its own min/max."""
+    maps = [np.asarray(m) for m in attention_maps]
+    dtype = np.result_type(*maps)
+    by_shape = defaultdict(list)
+    for i, m in enumerate(maps):
+        by_shape[m.shape].append(i)
+    # np.stack copies, so everything below may work in place
+    if len(by_shape) == 1:
+        heat = _upsample(torch.from_numpy(np.stack(maps).astype(dtype, copy=False)))
+    else:
+        heat = torch.empty((len(maps), SIZE, SIZE), dtype=torch.from_numpy(np.empty(0, dtype)).dtype)
+        for rows in by_shape.values():
+            heat[rows] = _upsample(torch.from_numpy(np.stack([maps[i] for i in rows]).astype(dtype, copy=False)))
+    lo = heat.amin(dim=(1, 2), keepdim=True)
+    hi = heat.amax(dim=(1, 2), keepdim=True)
+    heat.sub_(lo).div_(hi.sub_(lo).add_(1e-8)).mul_(255)
+    # truncates like np.uint8() in vit_explain; NumPy's cast is several times faster than torch's here
+    return heat.numpy().astype(np.uint8)
+
+
+def describe(attention_map):
+    """The statistics vit_explain reports, from the map as the explainer returned it."""
+    return {
+        "attention_score": float(attention_map.mean()),
+        "max_attention": float(attention_map.max()),
+        "std_attention": float(attention_map.std()),
+    }
+
+
+def render(sources, attention_maps, alpha=0.4, colormap=cv2.COLORMAP_JET, store=None, pool=None):
+    """
+    One overlay per (source, attention map); sources are image paths or BGR
+    arrays. Returns vit_explain's dict for each, in order.
+    """
+    store = store or artefacts.store
+    n = len(sources)
+    if n != len(attention_maps):
+        raise ValueError(f'{n} images for {len(attention_maps)} attention maps')
+    if n == 0:
+        return []
+    # a single overlay is cheaper drawn inline than handed to the pool
+    run = map if n == 1 else (pool or get_pool()).map
+
+    observe_batch('overlay_render', n)
+    with stage('overlay_render'):
+        images = np.stack(list(run(load_image, sources)))
+        heat = normalize(attention_maps)
+        colored = cv2.applyColorMap(heat.reshape(n * SIZE, SIZE), colormap)
+        overlays = cv2.addWeighted(images.reshape(n * SIZE, SIZE, 3), 1 - alpha,
+                                   colored, alpha, 0).reshape(n, SIZE, SIZE, 3)
+        # content-addressed: concurrent requests never overwrite each other's overlay
+        paths = list(run(lambda overlay: store.put_image(overlay, heatmap=True), overlays))
+
+    results = []
+    for attention_map, path in zip(attention_maps, paths):
+        result = describe(attention_map)
+        result["file"] = path
+        result["url"] = f"/uploads/{os.path.basename(path)}"
+        results.append(result)
+    return results
+
+
+class OverlayBatch:
+    """
+    Overlays requested by concurrent finish_analysis calls, drawn together.
+    add() returns the result dict straight away, with the statistics filled
+    in and "file"/"url" empty; flush() draws everything added so far and
+    fills those in.
+    `images` maps an image path to the image already decoded in memory
+    (batch.run has a PIL image for every item), so it is not read back from
+    disk. For a JPEG without an EXIF orientation the pixels are the same
+    as cv2.imread's; with one, the overlay is drawn on the image as the
+    model saw it, unrotated.
+    """
+    def __init__(self, store=None, images=None, alpha=0.4, colormap=cv2.COLORMAP_JET):
+        self.store = store
+        self.images = images if images is not None else {}
+        self.alpha = alpha
+        self.colormap = colormap
+        self.lock = threading.Lock()
+        self.pending = []
+
+    def __len__(self):
+        with self.lock:
+            return len(self.pending)
+
+    def add(self, source, attention_map):
+        result = describe(attention_map)
+        result["file"] = result["url"] = None
+        with self.lock:
+            self.pending.append((source, attention_map, result))
+        return result
+
+    def is_pending(self, result):
+        with self.lock:
+            return any(r is result for _, _, r in self.pending)
+
+    def flush(self):
+        """Draw every pending overlay; returns (result, error) for those that could not be drawn."""
+        with self.lock:
+            pending, self.pending = self.pending, []
+        return self._draw(pending)
+
+    def _draw(self, pending):
+        if not pending:
+            return []
+        try:
+            drawn = render([self.images.get(s, s) for s, _, _ in pending], [m for _, m, _ in pending],
+                           self.alpha, self.colormap, self.store)
+        except Exception as e:
+            if len(pending) == 1:
+                return [(pending[0][2], e)]
+            # one unreadable image must not cost the rest their overlays
+            failed = []
+            for entry in pending:
+                failed.extend(self._draw([entry]))
+            return failed
+        for (_, _, result), done in zip(pending, drawn):
+            result.update(file=done["file"], url=done["url"])
+        return []
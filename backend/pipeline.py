@@ -0,0 +1,110 @@
+"""
+Small dependency-graph runner for multi-stage pipelines.
+
+Each stage is a function of its dependencies' results. A stage starts as
+soon as every stage it depends on has finished, so independent branches
+run concurrently. In the video pipeline, for example, the transcription
+branch and the upload branch run side by side.
+
+    graph = StageGraph()
+    graph.add('audio', extract_audio)
+    graph.add('transcription', transcribe, deps=['audio'])
+    graph.add('upload', upload)
+    graph.add('questions', ask, deps=['transcription', 'upload'])
+    results, timings = graph.run()
+
+`timings` records when each stage started and finished relative to the
+run, and which dependency it waited on last. It also lists the critical
+path, the chain of stages that determined the wall time.
+"""
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class StageGraph:
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, name, fn, deps=()):
+        """fn(**{dep: result}) -> result"""
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"stage {name!r} depends on unknown stage {dep!r}")
+        self.stages[name] = (fn, tuple(deps))
+        return self
+
+    def run(self, max_workers=None):
+        """
+        Run every stage; returns (results, timings). The first stage to
+        raise cancels stages that have not started and re-raises at once,
+        without waiting for stages still running on other branches.
+        """
+        results, spans = {}, {}
+        pending = dict(self.stages)
+        running = {}
+        t0 = time.perf_counter()
+
+        def call(name, fn, kwargs):
+            start = time.perf_counter() - t0
+            try:
+                return fn(**kwargs)
+            finally:
+                spans[name] = (start, time.perf_counter() - t0)
+
+        # not a `with` block: its exit would wait for sibling stages before the error surfaces
+        pool = ThreadPoolExecutor(max_workers=max_workers or len(self.stages) or 1, thread_name_prefix='stage')
+        try:
+            while pending or running:
+                for name, (fn, deps) in list(pending.items()):
+                    if all(d in results for d in deps):
+                        del pending[name]
+                        kwargs = {d: results[d] for d in deps}
+                        # each stage sees the caller's context (e.g. the metrics endpoint label)
+                        ctx = contextvars.copy_context()
+                        running[pool.submit(ctx.run, call, name, fn, kwargs)] = name
+                if not running:
+                    raise RuntimeError(f"stages never became ready: {sorted(pending)}")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        raise error
+                    results[name] = future.result()
+        except BaseException:
+            # stages already running finish in the background; nothing waits for them
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        pool.shutdown()
+
+        return results, self._timings(spans, time.perf_counter() - t0)
+
+    def _timings(self, spans, wall):
+        stages = {}
+        for name, (start, end) in spans.items():
+            deps = self.stages[name][1]
+            stages[name] = {
+                'start_s': round(start, 4),
+                'end_s': round(end, 4),
+                'duration_s': round(end - start, 4),
+                'waited_on': max(deps, key=lambda d: spans[d][1]) if deps else None,
+            }
+
+        # walk back from the last stage to finish through whichever dependency finished last
+        path = []
+        name = max(spans, key=lambda n: spans[n][1]) if spans else None
+        while name is not None:
+            path.append(name)
+            name = stages[name]['waited_on']
+        path.reverse()
+
+        serial = sum(s['duration_s'] for s in stages.values())
+        return {
+            'wall_s': round(wall, 4),
+            'serial_s': round(serial, 4),
+            'overlap_saved_s': round(max(serial - wall, 0.0), 4),
+            'critical_path': path,
+            'critical_path_s': {n: stages[n]['duration_s'] for n in path},
+            'stages': stages,
+        }
@@ -8,16 +8,38 @@ from serpapi import GoogleSearch
 from dotenv import load_dotenv
 import os
 from model import FakeNewsModel,VITAttentionrollout,GradCAMViT
+from metrics import stage, timed, observe_batch, record_cache
+import clients
+from cascade import text_stage, skipped_shap_insights, skipped_image_analysis
+import token_merging
+import attribution
+import logs
+import overlays
+import tokenization
 import cv2
 import google.generativeai as genai
 import base64
 import json
+import hashlib
+import threading
+from collections import OrderedDict
+import logging
 load_dotenv()
 
+log = logs.get('prediction')
+
 MODEL_PATH  = 'model_multimodal/best_model.pth'
+STUDENT_MODEL_PATH = os.getenv('STUDENT_MODEL_PATH', 'model_multimodal/student_model.pth')
+# 'teacher' loads best_model.pth, 'student' the distilled checkpoint from distill.py
+MODEL_VARIANT = os.getenv('MODEL_VARIANT', 'teacher')
 TEXT_MODEL = "google/muril-base-cased"
 DEVICE = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 genai.configure(api_key=os.getenv('gemini_api_key2'))
+SUMMARY_MODEL = 'gemini-2.5-flash'
+SUMMARY_CACHE_SIZE = int(os.getenv('SUMMARY_CACHE_SIZE', '256'))
+# explainers /analyze runs, in the order they are dropped under load
+EXPLAINERS = ('shap', 'gradcam')
+SHED_REASON = 'Skipped: server under load'
 
 
 
@@ -57,6 +79,7 @@ img_transform = transforms.Compose([
 ])
 
 
+@timed('serp_check')
 def serp_check(query):
     try:
         params ={
@@ -67,7 +90,7 @@ def serp_check(query):
         }
 
         search = GoogleSearch(params)
-        results = search.get_dict()
+        results = clients.serpapi.call(search.get_dict)
 
         snippets = []
         for r in results.get('organic_results',[]):
@@ -85,166 +108,15 @@ def serp_check(query):
             'link':''
         })
         return snippets
-def prepare_shap_for_frontend(shap_insights,title,tokenizer,values):
-    try:
-        token_ids = tokenizer.encode(title,add_special_tokens = True)
-        token_words = tokenizer.convert_ids_to_tokens(token_ids)
-
-        highlighted_segments = []
-        min_len = min(len(values),len(token_words))
-
-        current_word = ''
-        current_impact = 0
 
-        for i in range(min_len):
-            token = token_words[i]
-            impact =float(values[i])
 
-            if token in ['[CLS]', '[SEP]', '[PAD]']:
-                continue
-            if token.startswith('##'):
-                # Continuation of previous word
-                current_word += token.replace('##', '')
-                current_impact += impact
-            else:
-                if current_word and abs(current_impact) > 1e-8:
-                    highlighted_segments.append({
-                        'text': current_word,
-                        'impact': current_impact,
-                        'color_intensity': min(abs(current_impact) * 10, 1.0),
-                        'type': 'fake' if current_impact > 0 else 'real'
-                    })
-                current_word = token
-                current_impact = impact
-        
-        if current_word and abs(current_impact) > 1e-8:
-            highlighted_segments.append({
-                'text': current_word,
-                'impact': current_impact,
-                'color_intensity': min(abs(current_impact) * 10, 1.0),
-                'type': 'fake' if current_impact > 0 else 'real'
-            })
-
-        frontend_data = {
-            'highlighted_text': highlighted_segments,
-            'token_count': len([t for t in token_words if t not in ['[CLS]', '[SEP]', '[PAD]']])
-            
-        }
-        return frontend_data
-    
-    except Exception as e:
-        print(f"Frontend prep error: {e}")
-        return {
-            'highlighted_text': [],
-            'token_count': 0,
-            'overall_sentiment': 'neutral'
-        }
-    
-
-def extract_shap_insights(shap_values,title,tokenizer,top_n=5):
+def extract_shap_insights(shap_values,title,tokenizer,top_n=5,encoding=None):
     try:
-        values = shap_values.values
-        data = shap_values.data
-
-        print(f"\nDEBUG SHAP:")
-        print(f"Values shape: {values.shape if hasattr(values, 'shape') else type(values)}")
-        print(f"Data shape: {data.shape if hasattr(data, 'shape') else type(data)}")
-
-        tokens = tokenizer.tokenize(title)
-        token_ids = tokenizer.encode(title,add_special_tokens = True)
-        token_words = tokenizer.convert_ids_to_tokens(token_ids)
-
-        insights = {
-            'important_words' : [],
-            'positive_contributors':[],
-            'negative_contributors':[],
-            'all_tokens': []
-        }
-
-        if len(values) == 0 or len(token_words) == 0:
-            print("Warning: No SHAP values or tokens found")
-            return insights
-        
-        min_len = min(len(values),len(token_words))
+        return attribution.shap_insights(shap_values.values, title, tokenizer, top_n, encoding)
+    except Exception:
+        log.warning('SHAP extraction failed', exc_info=True)
+        return skipped_shap_insights()
 
-        token_impacts= []
-        for i in range(min_len):
-            token = token_words[i]
-            impact = float(values[i])
-
-            if token not in ['[CLS]', '[SEP]', '[PAD]'] and abs(impact) > 1e-8:
-                token_impacts.append({
-                    'token': token,
-                    'impact': impact,
-                    'abs_impact': abs(impact),
-                    'position' : i
-                })
-
-        token_impacts.sort(key=lambda x:x['abs_impact'],reverse=True)
-
-        top_tokens = token_impacts[:top_n]
-
-        for token_info in top_tokens:
-            token = token_info['token']
-            impact = token_info['impact']
-
-            clean_token = token.replace('##', '')
-
-            insights['important_words'].append({
-                'word':clean_token,
-                "impact":impact
-            })
-
-            insights['all_tokens'].append(token_info)
-
-            if impact  > 0:
-                insights['positive_contributors'].append(clean_token)
-            else:
-                insights['negative_contributors'].append(clean_token)
-        print(insights)
-
-        reconstructed_words =[]
-        current_word = ''
-        current_impact = 0
-        for token_info in top_tokens:
-            token = token_info['token']
-            impact = token_info['impact']
-
-            if token.startswith('##'):
-                current_word +=token.replace('##','')
-                current_impact +=impact
-            else:
-                if current_word:
-                    reconstructed_words.append({
-                        'word':current_word,
-                        'impact':current_impact
-                    })
-                current_word = token
-                current_impact = impact
-        
-        if current_word:
-            reconstructed_words.append({
-                'word':current_word,
-                'impact':current_impact
-            })
-        
-        insights['reconstructed_words'] = reconstructed_words
-        frontend_data = prepare_shap_for_frontend(insights, title, tokenizer, values)
-        insights['frontend_display'] = frontend_data
-
-        return insights
-    
-    except Exception as e:
-        print(f"SHAP extraction error: {e}")
-        return {
-            'important_words': [],
-            'positive_contributors': [],
-            'negative_contributors': [],
-            'frontend_display': {
-                'highlighted_text': [],
-                'token_count': 0
-            }
-        }
 
 def encode_image_to_base64(image_path):
     with open(image_path,'rb') as img_file:
@@ -356,10 +228,51 @@ def create_comprehenseive_prompt(evidence):
         """
     return prompt
 
-def generate_explanation_with_gemini(evidence):
+class SummaryCache:
+    """LRU of finished AI summaries keyed by a hash of the evidence dict."""
+    def __init__(self, capacity=SUMMARY_CACHE_SIZE):
+        self.capacity = capacity
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(evidence):
+        blob = json.dumps(evidence, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            text = self.items.get(key)
+            if text is not None:
+                self.items.move_to_end(key)
+        record_cache('ai_summary', text is not None)
+        return text
+
+    def put(self, key, text):
+        with self.lock:
+            self.items[key] = text
+            self.items.move_to_end(key)
+            while len(self.items) > self.capacity:
+                self.items.popitem(last=False)
+
+
+summary_cache = SummaryCache()
+_summary_model = None
+
+
+def get_summary_model():
+    """One GenerativeModel for every summary; SUMMARY_STUB=1 swaps in the local fake."""
+    global _summary_model
+    if _summary_model is None:
+        if os.getenv('SUMMARY_STUB', '0') == '1':
+            from loadtest.fakes import FakeGenAI
+            _summary_model = FakeGenAI().GenerativeModel(SUMMARY_MODEL)
+        else:
+            _summary_model = genai.GenerativeModel(SUMMARY_MODEL)
+    return _summary_model
 
-    model = genai.GenerativeModel('gemini-2.5-flash')
 
+def summary_contents(evidence):
     prompt = create_comprehenseive_prompt(evidence)
 
     images_content = []
@@ -368,17 +281,49 @@ def generate_explanation_with_gemini(evidence):
     #         images_content.append(original_img)
         
         # Add heatmap visualization
-    if os.path.exists(evidence['image_analysis']['file']):
-        heatmap_img = Image.open(evidence['image_analysis']['file'])
-        images_content.append(heatmap_img)
+    heatmap_path = evidence.get('image_analysis', {}).get('file', '')
+    if heatmap_path and os.path.exists(heatmap_path):
+        with Image.open(heatmap_path) as heatmap_img:
+            heatmap_img.load()
+            images_content.append(heatmap_img.copy())
     
-    # Generate response with images
-    if images_content:
-        response = model.generate_content([prompt] + images_content)
-    else:
-        response = model.generate_content(prompt)
-    return response.text
+    return [prompt] + images_content if images_content else prompt
+
+
+def stream_explanation_with_gemini(evidence):
+    """
+    Yield the summary as it is generated. A cached summary comes back as a
+    single chunk; a fresh one is cached only after it has fully streamed.
+    """
+    key = SummaryCache.key(evidence)
+    cached = summary_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    model = get_summary_model()
+    # chunk and total deadlines; a stalled stream fails instead of holding this worker
+    response = clients.gemini.stream(model.generate_content, summary_contents(evidence), stream=True)
+    parts = []
+    with stage('ai_summary_stream'):
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # chunk without text parts (e.g. a safety block); nothing to stream
+                continue
+            if text:
+                parts.append(text)
+                yield text
+    if parts:
+        # nothing streamed (every chunk blocked): try again next time rather than cache ''
+        summary_cache.put(key, ''.join(parts))
 
+
+def generate_explanation_with_gemini(evidence):
+    return ''.join(stream_explanation_with_gemini(evidence))
+
+@timed('classify_claim')
 def classify_claim(title,classifier):
     if not isinstance(title, str) or len(title.strip()) < 3:
         return "unknown"
@@ -389,13 +334,16 @@ def classify_claim(title,classifier):
             hypothesis_template="ಈ ಸುದ್ದಿ {} ಕುರಿತು ಇದೆ."
         )
         return result["labels"][0]
-    except Exception as e:
-        print(e)
+    except Exception:
+        log.warning('claim classification failed', exc_info=True)
         return "unknown"
 
 
-def analyze(title,image_path,model,tokenizer,classifier):
-
+def make_text_predict(model,tokenizer):
+    """
+    Build the SHAP prediction function: list of texts -> fake probabilities,
+    scored against a blank image so only the text drives the output.
+    """
     def text_predict(texts):
         cleaned_text =[]
         for t in texts:
@@ -403,168 +351,230 @@ def analyze(title,image_path,model,tokenizer,classifier):
                 cleaned_text.append(' '.join(map(str,t)))
             else:
                 cleaned_text.append(str(t))
-        enc = tokenizer(
-            cleaned_text,
-            padding=True,
-            truncation=True,
-            max_length=128,
-            return_tensors='pt'
-        ).to(DEVICE)
-    
-   
+        # masked variants are all different: one batched call, kept out of the title cache
+        enc, _ = tokenization.encode_batch(tokenizer, cleaned_text, memo=False, device=DEVICE)
 
-        dummy_img = torch.zeros(len(cleaned_text), 3, 224, 224).to(DEVICE)
-
-        with torch.no_grad():
-            fake_out, _ = model(
-                enc['input_ids'],
-                enc['attention_mask'],
-                dummy_img
-            )
+        observe_batch('text_predict', len(cleaned_text))
+        with stage('text_predict'), torch.no_grad():
+            txt = model.encode_text(enc['input_ids'], enc['attention_mask'])
+            blank = model.blank_image_embedding().expand(len(cleaned_text), -1)
+            fake_out, _ = model.heads(txt, blank)
 
         return fake_out.cpu().numpy()
-    
-    def vit_explain(image_path, attention_map, output_path='explanation.jpg', alpha=0.4, colormap=cv2.COLORMAP_JET):
-        img = cv2.imread(image_path)
-        if img is None:
-            raise ValueError(f"Could not load image from {image_path}")
-        img = cv2.resize(img, (224, 224))
-        
-        # Resize attention map to match image
-        heatmap = cv2.resize(attention_map, (224, 224))
-        
-        # Normalize to 0-255
-        heatmap = (heatmap - heatmap.min()) / (heatmap.max() - heatmap.min() + 1e-8)
-        heatmap = np.uint8(255 * heatmap)
-        
-        # Apply colormap
-        heatmap_color = cv2.applyColorMap(heatmap, colormap)
-        
-        # Blend with original image
-        overlay = cv2.addWeighted(img, 1-alpha, heatmap_color, alpha, 0)
-        
-        cv2.imwrite(output_path, overlay)
-        
-        return {
-            "attention_score": float(attention_map.mean()),
-            "max_attention": float(attention_map.max()),
-            "std_attention": float(attention_map.std()),
-            "file": output_path
-        }
-    
+    return text_predict
 
-    
-    def vit_explain_improved(image_tensor, image_path, model, method='gradcam'):
-        vit = model.image_model
-        vit.eval()
-        
-        if method == 'gradcam':
-            print("Using Grad-CAM (input gradient method)...")
-            explainer = GradCAMViT(vit)
-            attention_map = explainer.generate_cam(image_tensor)
-            output_file = f'{image_path}_gradcam_explanation.jpg'
-            
-        elif method == 'rollout':
-            print("Using Attention Rollout...")
-            
-            # PyTorch MultiheadAttention needs special handling
-            # We need to enable attention weights output
-            original_need_weights = []
-            for name, module in vit.named_modules():
-                if isinstance(module, torch.nn.MultiheadAttention):
-                    # Store original setting
-                    original_need_weights.append(module.need_weights)
-                    # Enable attention weight output
-                    module.need_weights = True
-            
-            try:
-                explainer = VITAttentionrollout(vit)
-                attention_map = explainer.rollout(image_tensor)
-                output_file = 'rollout_explanation.jpg'
-            finally:
-                # Restore original settings
-                idx = 0
-                for name, module in vit.named_modules():
-                    if isinstance(module, torch.nn.MultiheadAttention):
-                        module.need_weights = original_need_weights[idx]
-                        idx += 1
-        
-        else:
-            raise ValueError(f"Unknown method: {method}")
-        
-        # Create visualization
-        result = vit_explain(image_path, attention_map, output_file)
-        
-        # Interpret the results
-        score = result["attention_score"]
-        max_attn = result["max_attention"]
-        std_attn = result["std_attention"]
-
-        if max_attn > 0.8 and std_attn > 0.15:
-            interpretation = "Model strongly focuses on specific suspicious regions"
-        elif max_attn > 0.7:
-            interpretation = "Model identifies key regions with high confidence"
-        elif std_attn > 0.12:
-            interpretation = "Model attention concentrated on multiple areas"
-        elif score > 0.4:
-            interpretation = "Model moderately focuses on distributed features"
-        else:
-            interpretation = "Model attention broadly distributed (contextual)"
-        
-        result["interpretation"] = interpretation
-        result['method'] = method
-        return result
 
-    img = Image.open(image_path).convert('RGB')
-    img_tensor = img_transform(img).unsqueeze(0).to(DEVICE)
-
-    enc = tokenizer(
-        title,
-        truncation=True,
-        max_length = 128,
-        return_tensors = 'pt'
-    ).to(DEVICE)
-
-    with torch.no_grad():
-        fake_out,claim_out = model(
-            enc['input_ids'],
-            enc['attention_mask'],
-            img_tensor
-        )
+def vit_explain(image_path, attention_map, alpha=0.4, colormap=cv2.COLORMAP_JET):
+    # same renderer batch.run uses for many overlays at once
+    return overlays.render([image_path], [attention_map], alpha, colormap)[0]
 
-    fake_prob = fake_out.item()
-    fake_label = 'FAKE' if fake_prob > 0.5 else 'REAL'
-    print("Title:", title)
-    print("Fake Probability:", round(fake_prob,3))
-    print("Prediction:", fake_label)
 
-    claim_type = classify_claim(title,classifier)
 
-    print("\n===== MODEL OUTPUT =====")
-    print("Title:", title)
-    print("Fake Probability:", round(fake_prob,3))
-    print("Prediction:", fake_label)
-    print("Claim Type:", claim_type)
+def compute_attention_map(image_tensor, model, method='gradcam'):
+    if hasattr(model, 'attention_map'):
+        # encoders in worker processes: the image worker owns the ViT
+        return model.attention_map(image_tensor, method)
+    vit = model.image_model
+    vit.eval()
+    
+    # explainers need every patch, even when the verdict path runs with token reduction
+    with token_merging.full_tokens():
+        return _attention_map(image_tensor, vit, method)
 
-    masker = shap.maskers.Text(tokenizer)
-    explainer = shap.Explainer(text_predict,masker)
-    shap_values = explainer([title])
 
-    
+def _attention_map(image_tensor, vit, method):
+    if method == 'gradcam':
+        log.debug('attention map', extra=logs.fields(method='gradcam'))
+        explainer = GradCAMViT(vit)
+        attention_map = explainer.generate_cam(image_tensor)
         
-    shap_insights = extract_shap_insights(shap_values[0], title,tokenizer)
+    elif method == 'rollout':
+        log.debug('attention map', extra=logs.fields(method='rollout'))
+        explainer = VITAttentionrollout(vit)
+        attention_map = explainer.rollout(image_tensor)
+    
+    else:
+        raise ValueError(f"Unknown method: {method}")
+    return attention_map
+
+
+def interpret_attention(result):
+    score = result["attention_score"]
+    max_attn = result["max_attention"]
+    std_attn = result["std_attention"]
+
+    if max_attn > 0.8 and std_attn > 0.15:
+        return "Model strongly focuses on specific suspicious regions"
+    elif max_attn > 0.7:
+        return "Model identifies key regions with high confidence"
+    elif std_attn > 0.12:
+        return "Model attention concentrated on multiple areas"
+    elif score > 0.4:
+        return "Model moderately focuses on distributed features"
+    else:
+        return "Model attention broadly distributed (contextual)"
 
+
+def render_explanation(image_path, attention_map, method='gradcam', overlay_batch=None):
+    # Create visualization; with an overlay_batch it is drawn later, together with the batch's others
+    if overlay_batch is not None:
+        result = overlay_batch.add(image_path, attention_map)
+    else:
+        result = vit_explain(image_path, attention_map)
     
-    image_analysis = vit_explain_improved(img_tensor, image_path, model)
-    print(f"Attention Score: {image_analysis['attention_score']:.3f}")
-    print(f"Interpretation: {image_analysis['interpretation']}")
-    print(f"Saved to: {image_analysis['file']}")
-    print(image_analysis)
+    # Interpret the results
+    result["interpretation"] = interpret_attention(result)
+    result['method'] = method
+    return result
+
+
+@timed('vit_explain_improved')
+def vit_explain_improved(image_tensor, image_path, model, method='gradcam', overlay_batch=None):
+    attention_map = compute_attention_map(image_tensor, model, method)
+    result = render_explanation(image_path, attention_map, method, overlay_batch)
+    return result, attention_map
+
+
+def score_batch(titles,imgs,model,tokenizer,image_index=None,cascade=None):
+    """
+    Model half of /analyze for a batch of (title, PIL image) pairs: one
+    padded MuRIL pass, one ViT pass over the images the image index has not
+    seen, one pass through the heads. Returns one dict per item for
+    finish_analysis().
+    """
+    n = len(titles)
+    items = [{'img': img, 'img_tensor': img_transform(img).unsqueeze(0).to(DEVICE), 'seen_image': None,
+              'text_prob': None, 'resolved_early': False, 'image_emb': None} for img in imgs]
+
+    if image_index is not None:
+        for item in items:
+            with stage('image_index_lookup'):
+                item['seen_image'] = image_index.lookup(item['img'])
+            record_cache('image_index', item['seen_image'] is not None)
+
+    enc, encodings = tokenization.encode_batch(tokenizer, titles, device=DEVICE)
+
+    observe_batch('model_forward', n)
+    with stage('model_forward'), torch.no_grad():
+        text_emb = model.encode_text(enc['input_ids'], enc['attention_mask'])
+
+        # cascade: a confident text-only score skips the image encoder and explainers
+        if cascade is not None and cascade.enabled:
+            text_probs = text_stage(model, text_emb).tolist()
+            for item, prob in zip(items, text_probs):
+                item['text_prob'] = prob
+                item['resolved_early'] = cascade.resolves(prob)
+
+        full = [i for i, item in enumerate(items) if not item['resolved_early']]
+        unseen = [i for i in full if items[i]['seen_image'] is None]
+        if unseen:
+            encoded = model.encode_image(torch.cat([items[i]['img_tensor'] for i in unseen]))
+            for row, i in enumerate(unseen):
+                items[i]['image_emb'] = encoded[row:row + 1]
+        for i in full:
+            if items[i]['seen_image'] is not None:
+                items[i]['image_emb'] = torch.from_numpy(items[i]['seen_image']['embedding']).unsqueeze(0).to(DEVICE)
+        if full:
+            fake_out, _ = model.heads(text_emb[full], torch.cat([items[i]['image_emb'] for i in full]))
+            for row, i in enumerate(full):
+                items[i]['fake_prob'] = fake_out[row].item()
+
+    for i, item in enumerate(items):
+        item['text_emb'] = text_emb[i:i + 1]
+        item['encoding'] = encodings[i]
+        if item['resolved_early']:
+            item['fake_prob'] = item['text_prob']
+    return items
+
+
+def match_prior_claim(scored,claim_index):
+    if claim_index is None:
+        return None
+    with stage('claim_index_lookup'):
+        prior = claim_index.match(scored['text_emb'][0].cpu().numpy())
+    record_cache('claim_index', prior is not None)
+    return prior
+
+
+def finish_analysis(title,image_path,scored,model,tokenizer,classifier,claim_index=None,image_index=None,
+                    cascade=None,explain=True,prior=None,claim_type=None,explainers=EXPLAINERS,
+                    overlay_batch=None):
+    """
+    Everything after the forward pass for one item: claim type, explainers,
+    web check, index updates. `explain=False` skips SHAP and Grad-CAM.
+    `explainers` narrows an explanation to a subset of EXPLAINERS; the
+    admission controller drops them under load and evidence['degraded']
+    lists what was skipped.
+    `prior` / `claim_type` may be passed in when the caller already
+    looked them up, e.g. for a whole batch at once.
+    With an `overlay_batch` (overlays.OverlayBatch) the Grad-CAM overlay is
+    only queued: image_analysis has its statistics and interpretation, and
+    "file"/"url" are filled in when the caller flushes the batch.
+    """
+    img = scored['img']
+    img_tensor = scored['img_tensor']
+    seen_image = scored['seen_image']
+    text_emb = scored['text_emb']
+    text_prob = scored['text_prob']
+    resolved_early = scored['resolved_early']
+    image_emb = scored['image_emb']
+    fake_prob = scored['fake_prob']
+
+    if prior is None:
+        prior = match_prior_claim(scored, claim_index)
 
+    fake_label = 'FAKE' if fake_prob > 0.5 else 'REAL'
 
-    print('\n===== GOOGLE CHECK ======')
-    web_sources = serp_check(title)
-    print(f"✓ Found {len(web_sources)} related sources")
+    if prior is not None:
+        log.info('matched prior claim', extra=logs.fields(
+            similarity=round(prior['similarity'], 3), prior_title=logs.payload(prior['title'], 120)))
+        claim_type = prior['verdict']['claim_type']
+    elif claim_type is None:
+        claim_type = classify_claim(title,classifier)
+
+    log.info('model output', extra=logs.fields(
+        title=logs.payload(title, 120), fake_prob=round(fake_prob, 3),
+        prediction=fake_label, claim_type=claim_type))
+
+    attention_map = None
+    if resolved_early:
+        log.info('cascade resolved on text', extra=logs.fields(text_prob=round(text_prob, 3)))
+        shap_insights = skipped_shap_insights()
+        image_analysis = skipped_image_analysis()
+    elif not explain:
+        shap_insights = skipped_shap_insights()
+        image_analysis = skipped_image_analysis('Skipped: explanation not requested')
+    else:
+        if 'shap' in explainers:
+            with stage('shap'):
+                masker = shap.maskers.Text(tokenizer)
+                explainer = shap.Explainer(make_text_predict(model,tokenizer),masker)
+                shap_values = explainer([title])
+
+                shap_insights = extract_shap_insights(shap_values[0], title,tokenizer,
+                                                      encoding=scored.get('encoding'))
+        else:
+            shap_insights = skipped_shap_insights()
+
+        if 'gradcam' not in explainers:
+            image_analysis = skipped_image_analysis(SHED_REASON)
+        elif seen_image is not None and seen_image['cam'] is not None:
+            # same picture seen before: reuse its Grad-CAM, only redraw the overlay
+            attention_map = seen_image['cam']
+            image_analysis = render_explanation(image_path, attention_map, overlay_batch=overlay_batch)
+        else:
+            image_analysis, attention_map = vit_explain_improved(img_tensor, image_path, model,
+                                                                 overlay_batch=overlay_batch)
+        if attention_map is not None:
+            log.info('image analysis', extra=logs.fields(
+                attention_score=round(image_analysis['attention_score'], 3),
+                interpretation=image_analysis['interpretation'], file=image_analysis['file']))
+
+    if prior is not None:
+        web_sources = prior['verdict']['web_sources']
+    else:
+        web_sources = serp_check(title)
+        log.info('web check', extra=logs.fields(sources=len(web_sources)))
 
     evidence = {
         'title': title,
@@ -577,14 +587,61 @@ def analyze(title,image_path,model,tokenizer,classifier):
         'web_sources': web_sources
     }
 
-    print("\n===== MODEL OUTPUT =====")
-    print("Title:", title)
-    print("Fake Probability:", round(fake_prob,3))
-    print("Prediction:", fake_label)
-    print("Claim Type:", claim_type)
+    skipped = [e for e in EXPLAINERS if e not in explainers]
+    if explain and not resolved_early and skipped:
+        evidence['degraded'] = {'skipped': skipped, 'reason': SHED_REASON}
+
+    if cascade is not None and cascade.enabled:
+        evidence['cascade'] = {
+            'stage': 'text' if resolved_early else 'full',
+            'text_probability': text_prob,
+            'band': [cascade.low, cascade.high],
+        }
+
+    if image_index is not None and not resolved_early:
+        image_verdict = {'title': title, 'prediction': fake_label, 'confidence': evidence['confidence']}
+        if seen_image is not None:
+            evidence['matched_prior_image'] = {
+                'distance': seen_image['distance'],
+                'previous_verdicts': seen_image['verdicts'],
+            }
+            image_index.add_verdict(seen_image['id'], image_verdict)
+            if seen_image['cam'] is None and attention_map is not None:
+                # first explanation of an image stored without one
+                image_index.set_cam(seen_image['id'], attention_map)
+        else:
+            image_index.add(img, image_emb[0].cpu().numpy(), attention_map, source=image_path, verdict=image_verdict)
+
+    if prior is not None:
+        evidence['matched_prior_claim'] = {
+            'title': prior['title'],
+            'similarity': prior['similarity'],
+            'prediction': prior['verdict']['prediction'],
+            'confidence': prior['verdict']['confidence'],
+        }
+    elif claim_index is not None and any(s.get('link') for s in web_sources):
+        # only remember claims whose web check actually returned something
+        claim_index.add(text_emb[0].cpu().numpy(), title, {
+            'prediction': fake_label,
+            'confidence': evidence['confidence'],
+            'claim_type': claim_type,
+            'web_sources': web_sources,
+        })
 
+    if log.isEnabledFor(logging.DEBUG) and logs.sampled():
+        log.debug('evidence', extra=logs.fields(evidence=logs.payload(evidence)))
     return evidence
 
+
+@timed('analyze')
+def analyze(title,image_path,model,tokenizer,classifier,claim_index=None,image_index=None,cascade=None,
+            explain=True,explainers=EXPLAINERS):
+
+    img = Image.open(image_path).convert('RGB')
+    scored = score_batch([title], [img], model, tokenizer, image_index, cascade)[0]
+    return finish_analysis(title, image_path, scored, model, tokenizer, classifier,
+                           claim_index, image_index, cascade, explain=explain, explainers=explainers)
+
 def main():
     model = FakeNewsModel(num_claims=len(CLAIM_TYPES))
     model.load_state_dict(torch.load(MODEL_PATH,map_location=DEVICE))
@@ -0,0 +1,183 @@
+"""
+Opt-in per-request profiling for the inference path.
+
+A request is profiled when
+    - PROFILE_HEADER=1 and it carries `X-Profile: 1`, or
+    - PROFILE_SAMPLE_RATE > 0 and it is picked at that rate.
+With both off (the default) the middleware is not installed and wrap()
+returns the function unchanged, so requests pay nothing.
+
+A profiled request runs its model work under torch.profiler and a Python
+stack sampler on the same thread. Each capture writes into PROFILE_DIR:
+    <id>.trace.json    Chrome trace (chrome://tracing, Perfetto)
+    <id>.folded.txt    collapsed stacks (flamegraph.pl, speedscope)
+    <id>.summary.txt   torch op table, slowest first
+The directory keeps the newest PROFILE_MAX_CAPTURES captures. The response
+carries X-Profile-Id; GET /admin/profiles lists captures and
+GET /admin/profiles/{file} downloads one. Those two routes only exist while
+profiling is enabled or the server runs with DEBUG_ENDPOINTS=1.
+
+torch.profiler is process-wide, so one capture runs at a time. A request
+picked while another is being profiled runs unprofiled.
+"""
+import contextlib
+import contextvars
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+import torch
+
+import logs
+
+log = logs.get('profiling')
+PROFILE_HEADER = os.getenv('PROFILE_HEADER', '0') == '1'
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_MAX_CAPTURES = int(os.getenv('PROFILE_MAX_CAPTURES', '20'))
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+
+ENABLED = PROFILE_HEADER or PROFILE_SAMPLE_RATE > 0
+SUFFIXES = ('.trace.json', '.folded.txt', '.summary.txt')
+
+# set by the middleware for requests picked for profiling
+requested = contextvars.ContextVar('profile_requested', default=None)
+_busy = threading.Lock()
+
+
+class Capture:
+    def __init__(self, endpoint):
+        self.id = f"{time.strftime('%Y%m%dT%H%M%S')}_{endpoint.strip('/').replace('/', '_') or 'root'}_{uuid.uuid4().hex[:8]}"
+        self.ran = False
+
+
+def should_profile(headers):
+    if PROFILE_HEADER and headers.get('x-profile') == '1':
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+class StackSampler:
+    """Samples one thread's Python stack every interval_ms into collapsed-stack counts."""
+    def __init__(self, thread_id, interval_ms=PROFILE_INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name='stack-sampler')
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def _activities():
+    activities = [torch.profiler.ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(torch.profiler.ProfilerActivity.CUDA)
+    return activities
+
+
+@contextlib.contextmanager
+def capture(capture_id):
+    """Profile the enclosed block on this thread and write the capture files."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    start = time.perf_counter()
+    prof = sampler = None
+    try:
+        with torch.profiler.profile(activities=_activities(), record_shapes=True) as prof, \
+                StackSampler(threading.get_ident()) as sampler:
+            yield
+    finally:
+        # written even when the request failed: those are often the interesting ones.
+        # Nothing to write if the profiler or sampler failed to start, and a failed
+        # export must not replace the request's own outcome.
+        if prof is not None and sampler is not None:
+            try:
+                _write(capture_id, prof, sampler, (time.perf_counter() - start) * 1000)
+            except Exception:
+                log.warning('could not write profile', extra=logs.fields(capture=capture_id), exc_info=True)
+
+
+def _write(capture_id, prof, sampler, wall_ms):
+    base = os.path.join(PROFILE_DIR, capture_id)
+    prof.export_chrome_trace(base + '.trace.json')
+    with open(base + '.folded.txt', 'w', encoding='utf-8') as f:
+        f.write(sampler.folded())
+    sort_by = 'cuda_time_total' if torch.cuda.is_available() else 'cpu_time_total'
+    with open(base + '.summary.txt', 'w', encoding='utf-8') as f:
+        f.write(f'wall {wall_ms:.1f} ms, {sum(sampler.stacks.values())} stack samples\n\n')
+        f.write(prof.key_averages().table(sort_by=sort_by, row_limit=40))
+    prune()
+
+
+def wrap(fn):
+    """fn itself unless this request was picked for profiling; then fn under capture()."""
+    request = requested.get()
+    if request is None:
+        return fn
+
+    def profiled(*args, **kwargs):
+        if not _busy.acquire(blocking=False):
+            return fn(*args, **kwargs)
+        try:
+            request.ran = True
+            with capture(request.id):
+                return fn(*args, **kwargs)
+        finally:
+            _busy.release()
+    return profiled
+
+
+def captures():
+    """Captures on disk, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    by_id = {}
+    for name in os.listdir(PROFILE_DIR):
+        for suffix in SUFFIXES:
+            if name.endswith(suffix):
+                path = os.path.join(PROFILE_DIR, name)
+                entry = by_id.setdefault(name[:-len(suffix)], {'files': [], 'bytes': 0, 'created': 0.0})
+                entry['files'].append(name)
+                entry['bytes'] += os.path.getsize(path)
+                entry['created'] = max(entry['created'], os.path.getmtime(path))
+    return sorted(({'id': k, **v} for k, v in by_id.items()), key=lambda c: c['created'], reverse=True)
+
+
+def prune(keep=PROFILE_MAX_CAPTURES):
+    for old in captures()[keep:]:
+        for name in old['files']:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(PROFILE_DIR, name))
+
+
+def file_path(name):
+    """Path of a capture file by its listed name, or None (no path traversal)."""
+    if os.path.basename(name) != name or not name.endswith(SUFFIXES):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
@@ -0,0 +1,25 @@
+"""
+Throwaway on-disk state for tests, benchmarks and load tests.
+
+use_temp_state() keeps a run's artefacts, indexes, video uploads, profiles
+and job database out of the working tree.
+"""
+import os
+import tempfile
+
+STATE_DIRS = ('ARTEFACT_DIR', 'CLAIM_INDEX_DIR', 'IMAGE_INDEX_DIR', 'VIDEO_UPLOAD_DIR', 'PROFILE_DIR')
+
+
+def use_temp_state(prefix='backend_'):
+    """
+    Point every on-disk store the backend writes to (uploads/, the claim and
+    image indexes, video_uploads/, profiles/, jobs.db) at a fresh temporary
+    directory, unless the environment already chose one. The paths are read
+    at import time, so call this before importing server, prediction or
+    benchmarks.stubs. Returns the directory.
+    """
+    root = tempfile.mkdtemp(prefix=prefix)
+    for name in STATE_DIRS:
+        os.environ.setdefault(name, os.path.join(root, name.lower()))
+    os.environ.setdefault('JOBS_DB', os.path.join(root, 'jobs.db'))
+    return root
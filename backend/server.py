@@ -1,27 +1,56 @@
-from fastapi import FastAPI , UploadFile,File,Form,HTTPException
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI , UploadFile,File,Form,HTTPException,Request,Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse,PlainTextResponse,StreamingResponse,FileResponse
+from starlette.routing import Match
+from starlette.concurrency import run_in_threadpool
 import os
-import shutil
+import json
+import asyncio
+import hashlib
+import tempfile
+import threading
+import uuid
 import torch
-from transformers import AutoTokenizer , AutoModelForSequenceClassification,pipeline
+from transformers import AutoModelForSequenceClassification,pipeline
 from pydantic import BaseModel
-from video_repr import VideoVerifier,get_transcript
+from typing import List, Optional
+from video_repr import VideoVerifier,build_video_graph
+from video_transcode import TranscodeConfig
 
-from model import FakeNewsModel
+from model import load_checkpoint, model_fingerprint
+import metrics
+import clients
+import jobs
+import batch
+import admission
+import profiling
+import artefacts
+import memory_debug
+import logs
+import warmup
+import tokenization
+from claim_index import ClaimIndex
+from image_index import ImageIndex
+from cascade import CascadeConfig
+import token_merging
+from encoder_service import RemoteModel
 from prediction import (
     analyze,
-    generate_explanation_with_gemini,
+    stream_explanation_with_gemini,
     CLAIM_TYPES,
     MODEL_PATH,
+    STUDENT_MODEL_PATH,
+    MODEL_VARIANT,
     TEXT_MODEL,
-    DEVICE
+    DEVICE,
+    EXPLAINERS,
+    summary_cache
 )
 
 MODEL_NAME ="joeddav/xlm-roberta-large-xnli"
 
 app = FastAPI(title='Fake News Detection')
+log = logs.get('server')
 
 
 app.add_middleware(
@@ -33,27 +62,101 @@ app.add_middleware(
 )
 
 
-UPLOAD_DIR = 'uploads'
-os.makedirs(UPLOAD_DIR,exist_ok=True)
+@app.middleware('http')
+async def endpoint_label(request: Request, call_next):
+    # label metrics with the route template, not the raw path
+    endpoint = 'other'
+    for route in app.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            endpoint = getattr(route, 'path', 'other')
+            break
+    token = metrics.current_endpoint.set(endpoint)
+    try:
+        return await call_next(request)
+    finally:
+        metrics.current_endpoint.reset(token)
+
+
+@app.middleware('http')
+async def correlation_id(request: Request, call_next):
+    # one id per request on every log line it produces, echoed back to the client
+    rid = request.headers.get('x-request-id') or uuid.uuid4().hex[:16]
+    token = logs.request_id.set(rid[:64])
+    try:
+        response = await call_next(request)
+    finally:
+        logs.request_id.reset(token)
+    response.headers['X-Request-ID'] = rid[:64]
+    return response
+
+
+async def profile_switch(request: Request, call_next):
+    if not profiling.should_profile(request.headers):
+        return await call_next(request)
+    capture = profiling.Capture(request.url.path)
+    token = profiling.requested.set(capture)
+    try:
+        response = await call_next(request)
+    finally:
+        profiling.requested.reset(token)
+    if capture.ran:
+        response.headers['X-Profile-Id'] = capture.id
+    return response
+
+# not installed at all unless PROFILE_HEADER or PROFILE_SAMPLE_RATE is set
+if profiling.ENABLED:
+    app.middleware('http')(profile_switch)
+
+# /debug/memory and /admin/profiles* expose internals and can turn tracemalloc
+# on, so they answer 404 unless asked for
+DEBUG_ENDPOINTS = os.getenv('DEBUG_ENDPOINTS', '0') == '1'
+
+def debug_only():
+    if not DEBUG_ENDPOINTS:
+        raise HTTPException(status_code=404, detail='Not Found')
+
+def profiles_only():
+    if not (profiling.ENABLED or DEBUG_ENDPOINTS):
+        raise HTTPException(status_code=404, detail='Not Found')
+
+
+# uploads and heatmaps, content-addressed and garbage-collected; served at /uploads
+store = artefacts.store
+
+claim_index = None
+image_index = None
+cascade = CascadeConfig.from_env()
+vit_reduction = token_merging.TokenReduction.from_env()
+transcode_config = TranscodeConfig.from_env()
+# 'remote': text/image encoders run as encoder_service.py workers
+ENCODER_MODE = os.getenv('ENCODER_MODE', 'local')
+# tuned by warmup.py at startup unless ANALYZE_BATCH_CHUNK is set
+analyze_batch_chunk = batch.ANALYZE_BATCH_CHUNK
 
-VIDEO_UPLOAD_DIR  = 'video_uploads'
+VIDEO_UPLOAD_DIR  = os.getenv('VIDEO_UPLOAD_DIR', 'video_uploads')
 os.makedirs(VIDEO_UPLOAD_DIR,exist_ok=True)
 
 @app.on_event('startup')
 def load_model():
-    global model , tokenizer ,  classifier
+    global model , tokenizer ,  classifier , claim_index , image_index
 
-    model = FakeNewsModel(num_claims=len(CLAIM_TYPES))
-    model.load_state_dict(torch.load(MODEL_PATH,map_location=DEVICE))
-    model.to(DEVICE)
-    model.eval()
+    model_path = STUDENT_MODEL_PATH if MODEL_VARIANT == 'student' else MODEL_PATH
+    if ENCODER_MODE == 'remote':
+        # encoders run in encoder_service.py workers; this process keeps fusion + heads
+        model = RemoteModel.from_checkpoint(model_path, device=DEVICE)
+        print(f"✅ Loaded {MODEL_VARIANT} heads from {model_path}; encoders: {json.dumps(model.health())}")
+    else:
+        model = load_checkpoint(model_path, num_claims=len(CLAIM_TYPES), device=DEVICE)
+        print(f"✅ Loaded {MODEL_VARIANT} model from {model_path}")
+    if vit_reduction.enabled and ENCODER_MODE != 'remote':
+        token_merging.apply(model.image_model, vit_reduction)
+        print(f"✅ ViT token reduction: {vit_reduction.mode} (ratio {vit_reduction.ratio})")
 
-    tokenizer = AutoTokenizer.from_pretrained(TEXT_MODEL)
+    # Rust tokenizers for both models; the XLM-R one is converted from sentencepiece if needed
+    tokenizer = tokenization.load(TEXT_MODEL)
 
-    tokenizer2 = AutoTokenizer.from_pretrained(
-        MODEL_NAME,
-        use_fast = False
-    )
+    tokenizer2 = tokenization.load(MODEL_NAME)
 
     model2 = AutoModelForSequenceClassification.from_pretrained(
         MODEL_NAME
@@ -65,12 +168,89 @@ def load_model():
     tokenizer=tokenizer2
     )
 
+    # cached embeddings are only valid for the encoders that produced them
+    fingerprint = model_fingerprint(model, model_path)
+    text_dim = model.cross.query.weight.shape[1]
+    claim_index = ClaimIndex.for_model(fingerprint, text_dim) if os.getenv('CLAIM_INDEX', '1') != '0' else None
+    image_index = ImageIndex.for_model(fingerprint) if os.getenv('IMAGE_INDEX', '1') != '0' else None
+    print(f"✅ Claim/image indexes for model {fingerprint}")
+
+    token = metrics.current_endpoint.set('startup')
+    if ENCODER_MODE != 'remote':
+        metrics.record_model_memory('text_model', model.text_model)
+        metrics.record_model_memory('image_model', model.image_model)
+    metrics.record_model_memory('fusion_heads', torch.nn.ModuleList([model.cross, model.fake_head, model.claim_head]))
+    metrics.record_model_memory('zero_shot', model2)
+    metrics.current_endpoint.reset(token)
+
     print("✅ Model & tokenizer loaded")
 
+    # warm-up, compile and (opt-in) autotuning run off the startup path; /ready reports when done
+    warmup.state.set('warming')
+    threading.Thread(target=run_warmup, daemon=True, name='warmup').start()
+
+def run_warmup():
+    global analyze_batch_chunk
+    chunk = warmup.run(model, tokenizer, classifier, remote=ENCODER_MODE == 'remote')
+    if chunk:
+        analyze_batch_chunk = chunk
+    print(f"✅ Warm-up done: {json.dumps(warmup.state.snapshot().get('timings', {}))}")
+
+@app.exception_handler(admission.Overloaded)
+async def overloaded(request: Request, exc: admission.Overloaded):
+    return JSONResponse(status_code=503, content={'detail': str(exc), 'request_class': exc.request_class},
+                        headers={'Retry-After': str(exc.retry_after)})
+
 @app.get('/')
 def home():
     return {'message':'server is running'}
 
+@app.get('/ready')
+def ready():
+    status = warmup.state.snapshot()
+    return JSONResponse(status_code=200 if status['ready'] else 503, content=status)
+
+@app.get('/metrics')
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
+
+@app.get('/outbound')
+def outbound_status():
+    return clients.status()
+
+@app.get('/admission')
+def admission_status():
+    return admission.status()
+
+@app.get('/debug/memory', dependencies=[Depends(debug_only)])
+def debug_memory(limit: int = 25, diff: bool = False, tensors: bool = True, tracemalloc: Optional[str] = None):
+    if tracemalloc == 'start':
+        memory_debug.start_tracemalloc()
+    models = {'fake_news': model, 'zero_shot': getattr(classifier, 'model', None)}
+    caches = {
+        'ai_summary': len(summary_cache.items),
+        'tokenizer': {name: len(tokenization.cache_for(t).items) for name, t in
+                      (('text', tokenizer), ('zero_shot', getattr(classifier, 'tokenizer', None))) if t is not None},
+        'video_verify': len(_video_verifier.cache) if _video_verifier is not None else 0,
+        'video_jobs_inflight': len(job_manager.inflight),
+    }
+    return memory_debug.report(models, caches, limit=limit, diff=diff, scan_tensors=tensors)
+
+@app.get('/admin/artefacts')
+def artefact_status():
+    return store.status()
+
+@app.get('/admin/profiles', dependencies=[Depends(profiles_only)])
+def list_profiles():
+    return {'enabled': profiling.ENABLED, 'captures': profiling.captures()}
+
+@app.get('/admin/profiles/{name}', dependencies=[Depends(profiles_only)])
+def download_profile(name: str):
+    path = profiling.file_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail='no such profile file')
+    return FileResponse(path, filename=name)
+
 
 
 @app.post('/analyze')
@@ -79,68 +259,214 @@ async def news_analyse(
     image : UploadFile = File(...)
 ):
     try:
-        image_path = os.path.join(UPLOAD_DIR,image.filename)
-        with open(image_path,'wb') as buffer:
-            shutil.copyfileobj(image.file,buffer)
+        # hashing and writing the upload is blocking work
+        image_path = await run_in_threadpool(store.put_file, image.file, artefacts.safe_ext(image.filename))
         
-        evidence = analyze(
-            title=title,
-            image_path=image_path,
-            model=model,
-            tokenizer=tokenizer,
-            classifier = classifier
-        )
+        def run(explainers):
+            return analyze(
+                title=title,
+                image_path=image_path,
+                model=model,
+                tokenizer=tokenizer,
+                classifier = classifier,
+                claim_index = claim_index,
+                image_index = image_index,
+                cascade = cascade,
+                explainers = explainers
+            )
+
+        # off the event loop, in the explain or verdict class depending on load
+        evidence = await admission.run_explained(profiling.wrap(run), EXPLAINERS)
 
         return JSONResponse(content=evidence)
     
+    except admission.Overloaded:
+        raise
     except Exception as e:
-        print(str(e))
+        log.error('analyze failed', exc_info=True)
         raise HTTPException(status_code=500,detail=str(e))
     
 
+@app.post('/analyze_batch')
+async def news_analyse_batch(
+    images : List[UploadFile] = File(None),
+    titles : List[str] = Form(None),
+    manifest : Optional[str] = Form(None),
+    archive : Optional[UploadFile] = File(None),
+    explain : bool = Form(False)
+):
+    """
+    Many (title, image) pairs in one request, as multipart images + titles
+    (or + a JSON manifest), or as a tar archive. Streams NDJSON results in
+    completion order; see batch.py for the formats.
+    """
+    try:
+        if archive is not None:
+            # reading and decompressing the archive is blocking work
+            items = await run_in_threadpool(batch.items_from_tar, archive.file, explain=explain)
+        else:
+            images = images or []
+            batch.check_size(len(images))
+            batch.check_bytes(sum(image.size or 0 for image in images))
+            uploads = [(image.filename, await image.read()) for image in images]
+            items = batch.items_from_fields(uploads, titles=titles, manifest=manifest, explain=explain)
+    except batch.BatchError as e:
+        raise HTTPException(status_code=e.status_code,detail=str(e))
+
+    # admitted while verdicts have room; explanations are dropped first
+    admission.verdict.check()
+    if admission.explain.full():
+        for item in items:
+            item.explain = False
+
+    # the model work itself runs on the verdict and explain pools, next to /analyze's
+    lines = batch.run(items, model, tokenizer, classifier, claim_index, image_index, cascade, store=store,
+                      chunk_size=analyze_batch_chunk,
+                      verdict_class=admission.verdict, explain_class=admission.explain)
+    return StreamingResponse(lines, media_type='application/x-ndjson')
+
+
 class EvidenceRequest(BaseModel):
     evidence :dict
 
 @app.post('/ai_summrise')
 def ai_summarise(data:EvidenceRequest):
+    """
+    Streams the summary as plain text while Gemini generates it. Failures
+    before the first chunk are still a 500; later ones end the stream
+    with a notice.
+    """
+    chunks = stream_explanation_with_gemini(evidence=data.evidence)
     try:
-        explanation = generate_explanation_with_gemini(
-            evidence=data.evidence
-        )
-
-        return {
-            'summary':explanation
-        }
+        first = next(chunks, '')
     except Exception as e:
         raise HTTPException(status_code=500,detail=str(e))
+
+    def body():
+        yield first
+        try:
+            yield from chunks
+        except Exception as e:
+            log.warning('summary stream interrupted', extra=logs.fields(error=str(e)))
+            yield '\n\n⚠️ Summary generation was interrupted.'
+
+    return StreamingResponse(body(), media_type='text/plain; charset=utf-8',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
     
-@app.post('/video_verify')
+_video_verifier = None
+_video_verifier_lock = threading.Lock()
+
+def get_video_verifier():
+    """One VideoVerifier for every job, so its verdict cache is actually shared (and bounded)."""
+    global _video_verifier
+    with _video_verifier_lock:
+        if _video_verifier is None:
+            _video_verifier = VideoVerifier()
+        return _video_verifier
+
+def run_video_pipeline(video_path, progress):
+    # runs on a job worker thread, outside any request context
+    metrics.current_endpoint.set('/video_verify')
+    verifier = get_video_verifier()
+    results, timings = build_video_graph(video_path, verifier, progress, transcode_config).run()
+    result = results['verify']
+    log.info('video pipeline', extra=logs.fields(wall_s=timings['wall_s'],
+                                                   critical_path=' -> '.join(timings['critical_path'])))
+
+    verdict = result['analysis']['answers']
+    log.info('video verdict', extra=logs.fields(verdict=logs.payload(verdict, 500)))
+    return {
+        'success' : True,
+        'questions' : result['questions'],
+        'verdict' : verdict,
+        'timings' : timings,
+        'transcode' : results['transcode'][1]
+    }
+
+job_manager = jobs.JobManager(run_video_pipeline, pool=admission.video)
+JOB_POLL_INTERVAL = 0.5
+
+@app.on_event('startup')
+def resume_jobs():
+    resumed = job_manager.resume()
+    if resumed:
+        print(f"✅ Resumed {resumed} unfinished video jobs")
+
+@app.on_event('startup')
+def start_artefact_gc():
+    store.start()
+    print(f"✅ Artefact store: {json.dumps(store.last_gc)}")
+
+def save_upload_hashed(upload, directory):
+    """Stream an upload to disk, naming it by the SHA-256 of its bytes."""
+    h = hashlib.sha256()
+    ext = os.path.splitext(upload.filename or '')[1]
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    with os.fdopen(fd,'wb') as buffer:
+        for block in iter(lambda: upload.file.read(1 << 20), b''):
+            h.update(block)
+            buffer.write(block)
+    content_hash = h.hexdigest()
+    final_path = os.path.join(directory, content_hash + ext)
+    os.replace(tmp_path, final_path)
+    return final_path, content_hash
+
+@app.post('/video_verify', status_code=202)
 async def verify_video(
-        video : UploadFile = File(...)
+        video : UploadFile = File(...),
+        force : bool = Form(False)
 ):
+    """
+    Queue a verification job and return its id. Uploading the same video
+    again returns the existing job unless force=true.
+    """
     try:
-        video_path = os.path.join(VIDEO_UPLOAD_DIR,video.filename)
-        with open(video_path,'wb') as buffer:
-            shutil.copyfileobj(video.file , buffer)
-        
-        transcript = get_transcript(video_path)
+        # hashing and copying the upload, and the jobs db, are blocking work
+        video_path, content_hash = await run_in_threadpool(save_upload_hashed, video, VIDEO_UPLOAD_DIR)
+        job_id, deduplicated = await run_in_threadpool(job_manager.submit, video_path, content_hash, force=force)
 
-        verifier = VideoVerifier()
-        result = verifier.verify(video_path=video_path,transcript=transcript)
-        
-        verdict = result['analysis']['answers']
-        print('verdict:\n',verdict)
-        return JSONResponse(content={
-            'success' : True,
-            'questions' : result['questions'],
-            'verdict' : verdict
+        job = await run_in_threadpool(job_manager.get, job_id)
+        return JSONResponse(status_code=202, content={
+            'job_id' : job_id,
+            'status' : job['status'],
+            'deduplicated' : deduplicated,
+            'status_url' : f'/jobs/{job_id}',
+            'events_url' : f'/jobs/{job_id}/events'
         })
+    except admission.Overloaded:
+        raise
     except Exception as e:
-        print("❌ Video verification error:", str(e))
+        log.error('video upload failed', exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get('/jobs/{job_id}')
+def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail='job not found')
+    return job
+
+@app.get('/jobs/{job_id}/events')
+async def job_events(job_id: str):
+    # the job store is SQLite: keep its reads off the event loop
+    if await run_in_threadpool(job_manager.get, job_id) is None:
+        raise HTTPException(status_code=404, detail='job not found')
+
+    async def stream():
+        last_version = -1
+        while True:
+            job = await run_in_threadpool(job_manager.get, job_id)
+            if job['version'] != last_version:
+                last_version = job['version']
+                yield f"event: {job['status']}\ndata: {json.dumps(job, ensure_ascii=False)}\n\n"
+            if job['status'] in (jobs.DONE, jobs.FAILED):
+                break
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    return StreamingResponse(stream(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
     
-app.mount('/uploads' , StaticFiles(directory = 'uploads'),name = 'uploads')
+app.mount('/uploads' , artefacts.ArtefactFiles(store),name = 'uploads')
     
     
     
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# the backend modules import each other as top-level modules (run from backend/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sandbox import use_temp_state  # noqa: E402
+
+# keep test artefacts, indexes and jobs.db out of the working tree
+use_temp_state('test_state_')
@@ -0,0 +1,43 @@
+import os
+import stat
+
+import artefacts
+
+
+def make_store(tmp_path):
+    return artefacts.ArtefactStore(artefacts.ArtefactConfig(directory=str(tmp_path)))
+
+
+def test_put_uses_umask_mode(tmp_path):
+    store = make_store(tmp_path)
+    path = store.put_bytes(b'image bytes')
+    assert stat.S_IMODE(os.stat(path).st_mode) == artefacts.FILE_MODE
+    with open(path + '.x', 'wb'):
+        pass
+    assert artefacts.FILE_MODE == stat.S_IMODE(os.stat(path + '.x').st_mode)
+
+
+def test_put_same_bytes_replaces_and_leaves_no_part_files(tmp_path):
+    store = make_store(tmp_path)
+    first = store.put_bytes(b'same')
+    os.utime(first, (0, 0))
+    second = store.put_bytes(b'same')
+    assert first == second
+    assert os.path.getmtime(second) > 0
+    assert sorted(os.listdir(tmp_path)) == [os.path.basename(first)]
+
+
+def test_put_survives_concurrent_removal(tmp_path, monkeypatch):
+    store = make_store(tmp_path)
+    path = store.put_bytes(b'collected')
+    real_chmod = os.chmod
+
+    def chmod_then_collect(p, mode):
+        # the collector removes the old copy between the two steps
+        real_chmod(p, mode)
+        if os.path.exists(path):
+            os.remove(path)
+    monkeypatch.setattr(artefacts.os, 'chmod', chmod_then_collect)
+    assert store.put_bytes(b'collected') == path
+    with open(path, 'rb') as f:
+        assert f.read() == b'collected'
@@ -0,0 +1,33 @@
+import numpy as np
+
+import attribution
+import tokenization
+from benchmarks import stubs
+
+ZWJ, ZWNJ = '‍', '‌'
+TITLE = f'ರಾಹುಲ್{ZWJ} ಗಾಂಧಿ, "ಸುದ್ದಿ"! ಸರ್ಕಾರ{ZWNJ}ದ (ಚುನಾವಣೆ).'
+
+
+def test_kannada_words_are_whole_slices_of_the_title():
+    tokenizer = stubs.make_tokenizer()
+    ids, offsets = tokenization.encode(tokenizer, TITLE, memo=False)
+    insights = attribution.shap_insights(np.ones(len(ids)), TITLE, tokenizer, top_n=10)
+
+    highlighted = insights['frontend_display']['highlighted_text']
+    assert [h['text'] for h in highlighted] == TITLE.split()
+    assert all(TITLE[h['start']:h['end']] == h['text'] for h in highlighted)
+    assert {w['word'] for w in insights['important_words']} == set(TITLE.split())
+
+
+def test_encoding_without_offsets_falls_back_to_merged_pieces(caplog):
+    # a slow tokenizer's encoding, as tokenization.encode builds it: every span (0, 0)
+    tokenizer = stubs.make_tokenizer()
+    title = 'ರಾಹುಲ್ ಗಾಂಧಿ ಸುದ್ದಿ'
+    ids, offsets = tokenization.encode(tokenizer, title, memo=False)
+    encoding = (ids, np.zeros_like(offsets))
+
+    with caplog.at_level('WARNING'):
+        insights = attribution.shap_insights(np.ones(len(ids)), title, tokenizer, top_n=10, encoding=encoding)
+
+    assert [h['text'] for h in insights['frontend_display']['highlighted_text']] == title.split()
+    assert 'no offsets' in caplog.text
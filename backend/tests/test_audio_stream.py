@@ -0,0 +1,89 @@
+import random
+import struct
+
+import pytest
+
+from audio_stream import VadChunker
+
+FRAME_MS = 30
+
+
+class ScriptedVad:
+    """Speech or not per frame, decided by the test; frames carry their own index."""
+    def __init__(self, speech):
+        self.speech = speech
+
+    def is_speech(self, frame, sample_rate):
+        return self.speech[decode(frame)[0]]
+
+
+def decode(pcm):
+    return list(struct.unpack(f'<{len(pcm) // 4}I', pcm))
+
+
+def run(speech, **kwargs):
+    chunker = VadChunker(ScriptedVad(speech), frame_ms=FRAME_MS, **kwargs)
+    chunks = []
+    for i in range(len(speech)):
+        chunks.extend(chunker.feed(struct.pack('<I', i)))
+    chunks.extend(chunker.flush())
+    return chunker, [(start, decode(pcm)) for start, pcm in chunks]
+
+
+def random_speech(rng, n):
+    speech = []
+    while len(speech) < n:
+        talking = rng.random() < 0.5
+        speech.extend([talking] * rng.randint(1, 40))
+    return speech[:n]
+
+
+def check(speech, chunks, max_chunk_s):
+    frame_s = FRAME_MS / 1000
+    sent = [i for _, indices in chunks for i in indices]
+    # frame order within and across chunks, and so no frame twice
+    assert sent == sorted(sent)
+    assert len(sent) == len(set(sent))
+    # every speech frame is sent
+    assert {i for i, s in enumerate(speech) if s} <= set(sent)
+    for start, indices in chunks:
+        assert indices
+        assert start == pytest.approx(indices[0] * frame_s)
+        assert len(indices) <= int(max_chunk_s * 1000 / FRAME_MS)
+
+
+def test_pause_splits_and_drops_silence():
+    speech = [False] * 20 + [True] * 150 + [False] * 30 + [True] * 150 + [False] * 20
+    chunker, chunks = run(speech, max_chunk_s=25, min_chunk_s=3, min_pause_ms=400, pad_ms=210)
+    check(speech, chunks, 25)
+    assert len(chunks) == 2
+    # 7 frames of pre-roll and trailing pad around each utterance
+    assert chunks[0][1][0] == 20 - 7 and chunks[1][1][0] == 200 - 7
+    assert chunker.stats()['sent_seconds'] < chunker.stats()['audio_seconds']
+
+
+def test_speech_right_after_emit_is_not_given_emitted_pad():
+    # pause long enough to emit, then speech again immediately
+    speech = [True] * 120 + [False] * 14 + [True] * 120
+    _, chunks = run(speech, max_chunk_s=25, min_chunk_s=3, min_pause_ms=400, pad_ms=210)
+    check(speech, chunks, 25)
+    assert len(chunks) == 2
+
+
+def test_max_chunk_cap_on_continuous_speech():
+    speech = [True] * 2000
+    _, chunks = run(speech, max_chunk_s=6, min_chunk_s=1, min_pause_ms=400, pad_ms=210)
+    check(speech, chunks, 6)
+    assert sum(len(indices) for _, indices in chunks) == 2000
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_random_speech_patterns(seed):
+    rng = random.Random(seed)
+    for _ in range(500):
+        speech = random_speech(rng, rng.randint(1, 1500))
+        max_chunk_s = rng.choice((2, 5, 25))
+        kwargs = dict(max_chunk_s=max_chunk_s, min_chunk_s=rng.choice((0, 1, 3)),
+                      min_pause_ms=rng.choice((90, 400, 900)), pad_ms=rng.choice((0, 90, 210)))
+        _, chunks = run(speech, **kwargs)
+        check(speech, chunks, max_chunk_s)
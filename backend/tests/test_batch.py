@@ -0,0 +1,111 @@
+import io
+import json
+import tarfile
+import threading
+
+from PIL import Image
+
+import admission
+import artefacts
+import batch
+
+
+def jpeg():
+    buf = io.BytesIO()
+    Image.new('RGB', (8, 8), 'red').save(buf, 'JPEG')
+    return buf.getvalue()
+
+
+def test_model_work_runs_on_admission_pools(tmp_path, monkeypatch):
+    threads = {}
+
+    def score_batch(titles, images, *args):
+        threads['score'] = threading.current_thread().name
+        return [{'resolved_early': False} for _ in titles]
+
+    def classify(titles, labels, **kwargs):
+        threads['classify'] = threading.current_thread().name
+        return [{'labels': ['politics']} for _ in titles]
+
+    def finish_analysis(title, image_path, s, *args, explain, **kwargs):
+        threads[title] = (threading.current_thread().name, explain)
+        return {'image_analysis': {}}
+
+    monkeypatch.setattr(batch, 'score_batch', score_batch)
+    monkeypatch.setattr(batch, 'finish_analysis', finish_analysis)
+    monkeypatch.setattr(batch, 'match_prior_claim', lambda s, index: None)
+
+    items = [batch.BatchItem(0, '0', 'plain', 'a.jpg', jpeg(), False),
+             batch.BatchItem(1, '1', 'explained', 'b.jpg', jpeg(), True)]
+    store = artefacts.ArtefactStore(artefacts.ArtefactConfig(directory=str(tmp_path)))
+    lines = [json.loads(line) for line in batch.run(items, None, None, classify, store=store,
+                                                    verdict_class=admission.verdict,
+                                                    explain_class=admission.explain)]
+
+    assert lines[-1]['succeeded'] == 2
+    assert threads['score'].startswith('admit-verdict')
+    assert threads['classify'].startswith('admit-verdict')
+    assert threads['explained'][0].startswith('admit-explain') and threads['explained'][1]
+    assert threads['plain'][0].startswith('analyze_batch') and not threads['plain'][1]
+
+
+def tarball(entries, members):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w') as tar:
+        for name, data in [('manifest.json', json.dumps(entries).encode())] + members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    buf.seek(0)
+    return buf
+
+
+def test_tar_names_keep_leading_dots_and_reject_parent_dirs():
+    archive = tarball(
+        [{'title': 'a', 'image': '.hidden.jpg'}, {'title': 'b', 'image': './img/b.jpg'},
+         {'title': 'c', 'image': '../c.jpg'}, {'title': 'd', 'image': '../etc/d.jpg'}],
+        [('./.hidden.jpg', b'A'), ('img/b.jpg', b'B'), ('../c.jpg', b'C'), ('etc/d.jpg', b'D')],
+    )
+    items = batch.items_from_tar(archive)
+    assert [(i.name, i.data, i.error) for i in items[:2]] == [('.hidden.jpg', b'A', None), ('img/b.jpg', b'B', None)]
+    assert all('outside the archive' in i.error and not i.data for i in items[2:])
+
+
+def test_tar_images_over_the_byte_cap_are_refused(monkeypatch):
+    monkeypatch.setattr(batch, 'ANALYZE_BATCH_MAX_BYTES', 300)
+    archive = tarball([{'title': 'a', 'image': 'a.jpg'}, {'title': 'b', 'image': 'b.jpg'}],
+                      [('a.jpg', b'A' * 100), ('b.jpg', b'B' * 100)])
+    assert len(batch.items_from_tar(archive)) == 2
+
+    archive = tarball([{'title': t, 'image': f'{t}.jpg'} for t in 'abc'],
+                      [(f'{t}.jpg', t.encode() * 100) for t in 'abc'])
+    try:
+        batch.items_from_tar(archive)
+    except batch.BatchError as e:
+        assert e.status_code == 413
+    else:
+        raise AssertionError('archive over the byte cap was read')
+
+
+def test_first_chunk_streams_before_the_next_is_scored(monkeypatch):
+    second_chunk = threading.Event()
+
+    def score_batch(titles, images, *args):
+        if titles[0] == 'late':
+            assert second_chunk.wait(5)
+        return [{'resolved_early': False} for _ in titles]
+
+    monkeypatch.setattr(batch, 'score_batch', score_batch)
+    monkeypatch.setattr(batch, 'finish_analysis',
+                        lambda title, *args, **kwargs: {'title': title, 'image_analysis': {}})
+    monkeypatch.setattr(batch, 'match_prior_claim', lambda s, index: None)
+
+    items = [batch.BatchItem(0, '0', 'early', 'a.jpg', jpeg(), False),
+             batch.BatchItem(1, '1', 'late', 'b.jpg', jpeg(), False)]
+    lines = batch.run(items, None, None, lambda titles, labels, **kwargs: [{'labels': []} for _ in titles],
+                      chunk_size=1)
+    first = json.loads(next(lines))
+    assert first['result']['title'] == 'early'
+    second_chunk.set()
+    rest = [json.loads(line) for line in lines]
+    assert rest[-1]['succeeded'] == 2
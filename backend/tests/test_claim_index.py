@@ -0,0 +1,35 @@
+import numpy as np
+
+from claim_index import ClaimIndex
+
+
+def unit(seed, dim=16):
+    return np.random.default_rng(seed).standard_normal(dim)
+
+
+def test_match_survives_reopen(tmp_path):
+    index = ClaimIndex(str(tmp_path), capacity=8, dim=16, threshold=0.9)
+    for seed in range(5):
+        index.add(unit(seed), f'title {seed}', {'prediction': 'FAKE'})
+    paraphrase = unit(3) + 0.01 * unit(99)
+    assert index.match(paraphrase)['title'] == 'title 3'
+    assert index.match(unit(42)) is None
+
+    reopened = ClaimIndex(str(tmp_path), capacity=8, dim=16, threshold=0.9)
+    hit = reopened.match(paraphrase)
+    assert hit['title'] == 'title 3' and hit['similarity'] > 0.99
+
+
+def test_ring_overwrites_and_records_stay_bounded(tmp_path):
+    index = ClaimIndex(str(tmp_path), capacity=4, dim=16)
+    for seed in range(50):
+        index.add(unit(seed), f'title {seed}', {})
+    with open(tmp_path / 'records.jsonl', encoding='utf-8') as f:
+        assert len(f.readlines()) <= 2 * 4
+    assert len(index) == 4
+    assert [rec['title'] for _, rec in index.search(unit(49), k=4)][0] == 'title 49'
+    assert index.match(unit(0)) is None
+
+    reopened = ClaimIndex(str(tmp_path), capacity=4, dim=16)
+    assert sorted(rec['title'] for rec in reopened.records.values()) == [f'title {s}' for s in range(46, 50)]
+    assert reopened.search(unit(47), k=1)[0][1]['title'] == 'title 47'
@@ -0,0 +1,36 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import profiling
+import server
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # skip load_model() for this test only; other tests share the app
+    monkeypatch.setattr(server.app.router, 'on_startup', [])
+    return TestClient(server.app)
+
+
+def test_debug_routes_hidden_by_default(client, monkeypatch):
+    monkeypatch.setattr(server, 'DEBUG_ENDPOINTS', False)
+    monkeypatch.setattr(profiling, 'ENABLED', False)
+    assert client.get('/debug/memory', params={'tracemalloc': 'start'}).status_code == 404
+    assert client.get('/admin/profiles').status_code == 404
+    assert client.get('/admin/profiles/x.trace.json').status_code == 404
+
+
+def test_profiles_listed_with_debug_flag(client, monkeypatch):
+    monkeypatch.setattr(server, 'DEBUG_ENDPOINTS', True)
+    assert client.get('/admin/profiles').status_code == 200
+
+
+def test_capture_reports_sampler_failure(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', str(tmp_path))
+
+    def broken(self):
+        raise RuntimeError('cannot start sampler')
+    monkeypatch.setattr(profiling.StackSampler, '__enter__', broken)
+    with pytest.raises(RuntimeError, match='cannot start sampler'):
+        with profiling.capture('broken'):
+            pass
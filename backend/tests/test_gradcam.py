@@ -0,0 +1,20 @@
+import torch
+
+import prediction
+import token_merging
+from benchmarks import stubs
+from model import GradCAMViT
+
+
+def test_gradcam_map_is_not_flat():
+    model = stubs.make_model(stubs.make_tokenizer())
+    cam = GradCAMViT(model.image_model).generate_cam(torch.randn(1, 3, 224, 224))
+    assert cam.shape == (224, 224)
+    assert cam.max() > cam.min()
+
+
+def test_gradcam_map_is_not_flat_under_token_reduction():
+    model = stubs.make_model(stubs.make_tokenizer())
+    token_merging.apply(model.image_model, token_merging.TokenReduction(mode='tome', ratio=0.5))
+    cam = prediction.compute_attention_map(torch.randn(1, 3, 224, 224), model)
+    assert cam.max() > cam.min()
@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+from image_index import ImageIndex
+
+
+def picture(seed):
+    rng = np.random.default_rng(seed)
+    # coarse blocks, so the hashes of different seeds are far apart
+    blocks = rng.integers(0, 256, (8, 8, 3), dtype=np.uint8)
+    return Image.fromarray(np.kron(blocks, np.ones((32, 32, 1), dtype=np.uint8)))
+
+
+def test_cam_added_later_is_stored(tmp_path):
+    index = ImageIndex(str(tmp_path))
+    img = picture(0)
+    entry_id = index.add(img, np.ones(4))
+    assert index.lookup(img)['cam'] is None
+
+    cam = np.full((224, 224), 0.5)
+    assert index.set_cam(entry_id, cam)
+    assert not index.set_cam(entry_id, np.zeros((224, 224)))
+    hit = ImageIndex(str(tmp_path)).lookup(img)
+    assert np.allclose(hit['cam'], 0.5) and np.allclose(hit['embedding'], 1)
+
+
+def test_oldest_entries_are_evicted(tmp_path):
+    index = ImageIndex(str(tmp_path), capacity=3)
+    images = [picture(seed) for seed in range(5)]
+    ids = [index.add(img, np.full(4, seed)) for seed, img in enumerate(images)]
+
+    assert len(index) == 3
+    assert index.lookup(images[0]) is None and index.lookup(images[1]) is None
+    assert index.lookup(images[4])['id'] == ids[4]
+    assert sorted(os.listdir(tmp_path / 'entries')) == sorted(i + '.npz' for i in ids[2:])
+    # evicted entries ignore late updates
+    index.add_verdict(ids[0], {'prediction': 'FAKE'})
+    assert not index.set_cam(ids[0], np.zeros((224, 224)))
+
+    reopened = ImageIndex(str(tmp_path), capacity=3)
+    assert reopened.ids == ids[2:]
+    assert reopened.lookup(images[2])['id'] == ids[2]
+
+
+def test_records_are_compacted(tmp_path):
+    index = ImageIndex(str(tmp_path), capacity=2)
+    img = picture(0)
+    entry_id = index.add(img, np.ones(4))
+    for i in range(10):
+        index.add_verdict(entry_id, {'prediction': 'REAL', 'n': i})
+    with open(tmp_path / 'records.jsonl', encoding='utf-8') as f:
+        assert len(f.readlines()) <= 4
+    assert len(ImageIndex(str(tmp_path), capacity=2).lookup(img)['verdicts']) == 10
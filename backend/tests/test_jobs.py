@@ -0,0 +1,90 @@
+import threading
+import time
+
+import jobs
+
+
+def wait_for(manager, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get(job_id)
+        # _run drops the job from inflight and releases its upload under the lock
+        with manager.lock:
+            finished = job_id not in manager.inflight
+        if job['status'] in (jobs.DONE, jobs.FAILED) and finished:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'job {job_id} did not finish')
+
+
+def make_manager(tmp_path, runner):
+    return jobs.JobManager(runner, store=jobs.JobStore(str(tmp_path / 'jobs.db')), workers=2)
+
+
+def upload(tmp_path, name='video.mp4'):
+    path = tmp_path / name
+    path.write_bytes(b'video')
+    return str(path)
+
+
+def test_upload_removed_when_job_finishes(tmp_path):
+    manager = make_manager(tmp_path, lambda path, progress: {'ok': True})
+    done_id, _ = manager.submit(upload(tmp_path, 'a.mp4'), 'a')
+    assert wait_for(manager, done_id)['status'] == jobs.DONE
+    assert not (tmp_path / 'a.mp4').exists()
+
+    def fail(path, progress):
+        raise RuntimeError('boom')
+    manager.runner = fail
+    failed_id, _ = manager.submit(upload(tmp_path, 'b.mp4'), 'b')
+    assert wait_for(manager, failed_id)['status'] == jobs.FAILED
+    assert not (tmp_path / 'b.mp4').exists()
+
+
+def test_upload_kept_while_another_job_uses_it(tmp_path):
+    release = threading.Event()
+
+    def runner(path, progress):
+        release.wait(5)
+        return {}
+    manager = make_manager(tmp_path, runner)
+    path = upload(tmp_path)
+    first, _ = manager.submit(path, 'same')
+    second, _ = manager.submit(path, 'same', force=True)
+    # a duplicate of a running job shares its file
+    again, deduplicated = manager.submit(path, 'same')
+    assert deduplicated and again == second
+    assert (tmp_path / 'video.mp4').exists()
+    release.set()
+    wait_for(manager, first)
+    wait_for(manager, second)
+    assert not (tmp_path / 'video.mp4').exists()
+
+
+def test_duplicate_of_finished_job_drops_new_upload(tmp_path):
+    manager = make_manager(tmp_path, lambda path, progress: {})
+    job_id, _ = manager.submit(upload(tmp_path), 'same')
+    wait_for(manager, job_id)
+    assert manager.submit(upload(tmp_path), 'same') == (job_id, True)
+    assert not (tmp_path / 'video.mp4').exists()
+
+
+def test_job_shed_past_queue_deadline_fails_and_cleans_up(tmp_path):
+    import admission
+    release = threading.Event()
+
+    def runner(path, progress):
+        release.wait(5)
+        return {}
+    pool = admission.RequestClass('video_test', admission.ClassConfig(concurrency=1, queue_limit=4, deadline=0.05))
+    manager = jobs.JobManager(runner, store=jobs.JobStore(str(tmp_path / 'jobs.db')), pool=pool)
+    first, _ = manager.submit(upload(tmp_path, 'a.mp4'), 'a')
+    second, _ = manager.submit(upload(tmp_path, 'b.mp4'), 'b')
+    time.sleep(0.2)
+    release.set()
+
+    shed = wait_for(manager, second)
+    assert shed['status'] == jobs.FAILED and shed['error'] == 'shed: queued too long'
+    assert not (tmp_path / 'b.mp4').exists()
+    assert wait_for(manager, first)['status'] == jobs.DONE
+    assert manager.inflight == {}
@@ -0,0 +1,39 @@
+import threading
+import time
+
+import pytest
+
+from pipeline import StageGraph
+
+
+def test_stages_run_concurrently_in_dependency_order():
+    order = []
+    graph = StageGraph()
+    graph.add('a', lambda: order.append('a') or 1)
+    graph.add('b', lambda: (time.sleep(0.05), order.append('b'))[1] or 2)
+    graph.add('c', lambda a, b: a + b, deps=['a', 'b'])
+    results, timings = graph.run()
+    assert results['c'] == 3 and order == ['a', 'b']
+    assert timings['critical_path'] == ['b', 'c']
+
+
+def test_failing_stage_surfaces_without_waiting_for_siblings():
+    release = threading.Event()
+    started = []
+
+    def fail():
+        raise ValueError('transcription failed')
+
+    graph = StageGraph()
+    graph.add('transcription', fail)
+    graph.add('upload', lambda: release.wait(5))
+    graph.add('after_upload', lambda upload: started.append('after_upload'), deps=['upload'])
+    start = time.perf_counter()
+    try:
+        with pytest.raises(ValueError, match='transcription failed'):
+            graph.run()
+        assert time.perf_counter() - start < 1
+    finally:
+        release.set()
+    time.sleep(0.05)
+    assert started == []
@@ -0,0 +1,103 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import clients
+import prediction
+from loadtest.fakes import FAKE_SUMMARY, FakeGenAI
+
+EVIDENCE = {'title': 'ಪರೀಕ್ಷೆ', 'prediction': 'FAKE', 'confidence': 0.9}
+
+
+class _Chunk:
+    def __init__(self, text=None):
+        self._text = text
+
+    @property
+    def text(self):
+        if self._text is None:
+            # what the SDK does for a chunk without text parts
+            raise ValueError('no text parts')
+        return self._text
+
+
+class StubModel:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        return iter(self.chunks) if not callable(self.chunks) else self.chunks()
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    client = clients.OutboundClient('gemini_test', clients.ServiceConfig(timeout=5.0, stream_timeout=0.2, retries=0))
+    monkeypatch.setattr(clients, 'gemini', client)
+    monkeypatch.setattr(prediction, 'summary_cache', prediction.SummaryCache())
+    monkeypatch.setattr(prediction, 'summary_contents', lambda evidence: 'summary prompt')
+    return client
+
+
+def use_model(monkeypatch, model):
+    monkeypatch.setattr(prediction, 'get_summary_model', lambda: model)
+
+
+def test_streams_chunks_then_serves_from_cache(gemini, monkeypatch):
+    use_model(monkeypatch, FakeGenAI(stream_chunk_ms=1).GenerativeModel('stub'))
+    chunks = list(prediction.stream_explanation_with_gemini(EVIDENCE))
+    assert len(chunks) > 1
+    assert ''.join(chunks) == FAKE_SUMMARY
+    assert gemini.breaker.snapshot()['state'] == 'closed'
+
+    use_model(monkeypatch, None)   # a second generation would fail
+    assert list(prediction.stream_explanation_with_gemini(EVIDENCE)) == [FAKE_SUMMARY]
+
+
+def test_stalled_stream_times_out_and_counts_as_failure(gemini, monkeypatch):
+    def stalled():
+        yield _Chunk('first ')
+        time.sleep(2)
+        yield _Chunk('never')
+
+    use_model(monkeypatch, StubModel(stalled))
+    stream = prediction.stream_explanation_with_gemini(EVIDENCE)
+    assert next(stream) == 'first '
+    start = time.monotonic()
+    with pytest.raises(clients.OutboundTimeout):
+        next(stream)
+    assert time.monotonic() - start < 1.0
+    assert gemini.breaker.snapshot()['consecutive_failures'] == 1
+    assert prediction.summary_cache.get(prediction.SummaryCache.key(EVIDENCE)) is None
+
+
+def test_blocked_stream_is_not_cached(gemini, monkeypatch):
+    use_model(monkeypatch, StubModel([_Chunk(), _Chunk()]))
+    assert list(prediction.stream_explanation_with_gemini(EVIDENCE)) == []
+    assert prediction.summary_cache.get(prediction.SummaryCache.key(EVIDENCE)) is None
+
+    use_model(monkeypatch, StubModel([_Chunk('now '), _Chunk('it works')]))
+    assert ''.join(prediction.stream_explanation_with_gemini(EVIDENCE)) == 'now it works'
+
+
+def test_endpoint_streams_plain_text(gemini, monkeypatch):
+    import server
+    use_model(monkeypatch, FakeGenAI(stream_chunk_ms=1).GenerativeModel('stub'))
+    client = TestClient(server.app)   # no context manager: skip load_model()
+    r = client.post('/ai_summrise', json={'evidence': EVIDENCE})
+    assert r.status_code == 200
+    assert r.headers['content-type'].startswith('text/plain')
+    assert r.text == FAKE_SUMMARY
+
+
+def test_endpoint_reports_failure_before_first_chunk(gemini, monkeypatch):
+    import server
+
+    def broken():
+        raise RuntimeError('quota exceeded')
+        yield
+
+    use_model(monkeypatch, StubModel(broken))
+    client = TestClient(server.app)
+    r = client.post('/ai_summrise', json={'evidence': EVIDENCE})
+    assert r.status_code == 500
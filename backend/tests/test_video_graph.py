@@ -0,0 +1,24 @@
+import video_repr
+from loadtest.fakes import FakeGenAI
+
+
+def test_cached_verdict_skips_transcription_and_upload(tmp_path, monkeypatch):
+    monkeypatch.setattr(video_repr, 'genai', FakeGenAI())
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(b'same video bytes')
+    verifier = video_repr.VideoVerifier()
+    verdict = {'questions': [], 'analysis': {'verdict': 'cached'}}
+    verifier.cache[verifier.cache_key(str(path))] = verdict
+
+    def unexpected(*args, **kwargs):
+        raise AssertionError('should not run for a cached video')
+    monkeypatch.setattr(video_repr, 'get_transcript', unexpected)
+    monkeypatch.setattr(verifier, 'upload', unexpected)
+    monkeypatch.setattr(video_repr.video_transcode, 'submit', unexpected)
+
+    # a copy elsewhere has the same content, so the same verdict
+    copy = tmp_path / 'copy.mp4'
+    copy.write_bytes(path.read_bytes())
+    results, _ = video_repr.build_video_graph(str(copy), verifier).run()
+    assert results['verify'] is verdict
+    assert results['transcode'][1]['used'] is False
@@ -0,0 +1,13 @@
+import warmup
+
+
+def test_missing_tuning_does_not_autotune(monkeypatch):
+    calls = []
+    monkeypatch.setattr(warmup, 'load_tuning', lambda model: None)
+    monkeypatch.setattr(warmup, 'autotune', lambda *a: calls.append(a))
+    monkeypatch.setattr(warmup, 'warm', lambda *a: {})
+    monkeypatch.setattr(warmup, 'state', warmup.State())
+
+    assert warmup.run(object(), [], config=warmup.WarmupConfig(autotune=False)) is None
+    assert calls == []
+    assert warmup.state.snapshot()['ready']
@@ -0,0 +1,348 @@
+"""
+Token reduction for the ViT image encoder.
+
+Only the CLS output of the ViT is used, yet every block runs all 197
+tokens. With reduction on, each encoder block shrinks the token set by r
+tokens between attention and the MLP, so later blocks run on fewer tokens:
+
+    tome   ToMe-style bipartite soft matching: the r most similar token
+           pairs (cosine similarity of attention keys) are merged with a
+           size-weighted average. Attention is biased by log(size) so a
+           merged token still carries the weight of the patches it holds.
+    prune  EViT-style dropping: the r patches the CLS token attends to
+           least are fused into one token, weighted by that attention.
+
+The CLS token is never merged or dropped. Weights and state_dict keys are
+unchanged: apply() only swaps vit.encoder.forward, and remove() restores it.
+
+Off by default; enable with VIT_TOKEN_REDUCTION=tome|prune and
+VIT_REDUCTION_RATIO (fraction of patch tokens removed by the last block).
+Grad-CAM and attention rollout run inside full_tokens(), so explanations
+are still computed on every patch.
+
+    python token_merging.py report --images samples/ --ratio 0.9
+    python token_merging.py report --random-weights      # synthetic smoke run
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import sys
+import threading
+import time
+import types
+from dataclasses import dataclass
+
+import torch
+import torch.nn.functional as F
+
+MODES = ('off', 'tome', 'prune')
+
+_local = threading.local()
+
+
+@dataclass
+class TokenReduction:
+    mode: str = 'off'
+    ratio: float = 0.9
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            mode=os.getenv('VIT_TOKEN_REDUCTION', 'off'),
+            ratio=float(os.getenv('VIT_REDUCTION_RATIO', '0.9')),
+        )
+
+    @property
+    def enabled(self):
+        return self.mode != 'off'
+
+
+def reduction_schedule(num_tokens, num_layers, ratio, mode='tome'):
+    """Tokens removed in each block: a constant r, clipped so CLS plus one patch survive."""
+    patches = num_tokens - 1
+    r = int(ratio * patches / num_layers)
+    schedule = []
+    n = num_tokens
+    for _ in range(num_layers):
+        if mode == 'tome':
+            # bipartite matching can merge at most every token of the smaller set
+            step = min(r, (n - 1) // 2)
+        else:
+            # prune removes r patches and adds back one fused token
+            step = min(r, n - 3) if r > 1 else 0
+        schedule.append(max(step, 0))
+        n -= schedule[-1] if mode == 'tome' else max(schedule[-1] - 1, 0)
+    return schedule
+
+
+def _attend(attn, x, size, need_cls):
+    """
+    Multi-head self-attention equivalent to attn(x, x, x), also returning
+    the mean key per token (the ToMe similarity metric) and the CLS row of
+    the attention matrix.
+    """
+    B, N, D = x.shape
+    h = attn.num_heads
+    qkv = F.linear(x, attn.in_proj_weight, attn.in_proj_bias)
+    q, k, v = qkv.reshape(B, N, 3, h, D // h).permute(2, 0, 3, 1, 4)   # each (B,h,N,d)
+
+    bias = None
+    if size is not None:
+        bias = size.log()[:, None, None, :, 0].to(q.dtype)               # (B,1,1,N)
+    out = F.scaled_dot_product_attention(q, k, v, attn_mask=bias)
+    out = attn.out_proj(out.transpose(1, 2).reshape(B, N, D))
+
+    cls_attn = None
+    if need_cls:
+        logits = q[:, :, :1] @ k.transpose(-1, -2) / math.sqrt(D // h)   # (B,h,1,N)
+        if bias is not None:
+            logits = logits + bias
+        cls_attn = logits.softmax(-1).mean(1)[:, 0]                       # (B,N)
+    return out, k.mean(1), cls_attn
+
+
+def bipartite_merge(x, size, metric, r):
+    """Merge the r most similar (even, odd) token pairs; CLS at index 0 is kept in place."""
+    if r <= 0:
+        return x, size
+    metric = metric / metric.norm(dim=-1, keepdim=True)
+    a, b = metric[:, ::2], metric[:, 1::2]
+    scores = a @ b.transpose(-1, -2)
+    scores[:, 0, :] = -math.inf
+
+    node_max, node_idx = scores.max(dim=-1)
+    edge_idx = node_max.argsort(dim=-1, descending=True)[..., None]
+    unm_idx = edge_idx[:, r:].sort(dim=1)[0]     # keeps CLS first and patches in order
+    src_idx = edge_idx[:, :r]
+    dst_idx = node_idx[..., None].gather(1, src_idx)
+
+    def merge(t):
+        src, dst = t[:, ::2], t[:, 1::2]
+        B, n, c = src.shape
+        unm = src.gather(1, unm_idx.expand(B, n - r, c))
+        src = src.gather(1, src_idx.expand(B, r, c))
+        dst = dst.scatter_reduce(1, dst_idx.expand(B, r, c), src, reduce='sum')
+        return torch.cat([unm, dst], dim=1)
+
+    x = merge(x * size)
+    size = merge(size)
+    return x / size, size
+
+
+def prune_by_cls_attention(x, size, cls_attn, r):
+    """Drop the r patches with the least CLS attention and fuse them into one token."""
+    if r <= 1:
+        return x, size
+    B, N, D = x.shape
+    patch_attn = cls_attn[:, 1:]
+    order = patch_attn.argsort(dim=-1, descending=True)
+    keep = order[:, :N - 1 - r].sort(dim=-1)[0] + 1
+    drop = order[:, N - 1 - r:] + 1
+
+    kept = x.gather(1, keep[..., None].expand(-1, -1, D))
+    kept_size = size.gather(1, keep[..., None])
+
+    dropped = x.gather(1, drop[..., None].expand(-1, -1, D))
+    dropped_size = size.gather(1, drop[..., None])
+    w = cls_attn.gather(1, drop)[..., None] * dropped_size
+    fused = (dropped * w).sum(1, keepdim=True) / w.sum(1, keepdim=True).clamp_min(1e-12)
+
+    x = torch.cat([x[:, :1], kept, fused], dim=1)
+    size = torch.cat([size[:, :1], kept_size, dropped_size.sum(1, keepdim=True)], dim=1)
+    return x, size
+
+
+def _reduced_block(block, x, size, r, mode):
+    # torchvision EncoderBlock, with the token reduction between attention and MLP
+    y = block.ln_1(x)
+    out, metric, cls_attn = _attend(block.self_attention, y, size, need_cls=(mode == 'prune'))
+    x = x + block.dropout(out)
+    if mode == 'tome':
+        x, size = bipartite_merge(x, size, metric, r)
+    else:
+        x, size = prune_by_cls_attention(x, size, cls_attn, r)
+    return x + block.mlp(block.ln_2(x)), size
+
+
+def _reduced_encoder_forward(self, input):
+    if getattr(_local, 'full_tokens', False):
+        return self._full_forward(input)
+    x = self.dropout(input + self.pos_embedding)
+    size = torch.ones(x.shape[0], x.shape[1], 1, device=x.device, dtype=x.dtype)
+    for block, r in zip(self.layers, self._reduction_schedule):
+        x, size = _reduced_block(block, x, size, r, self._reduction_mode)
+    return self.ln(x)
+
+
+def apply(vit, reduction):
+    """Switch a torchvision VisionTransformer to reduced-token inference (in place)."""
+    remove(vit)
+    if not reduction.enabled:
+        return vit
+    if reduction.mode not in MODES:
+        raise ValueError(f"Unknown token reduction mode: {reduction.mode}")
+    encoder = vit.encoder
+    num_tokens = encoder.pos_embedding.shape[1]
+    encoder._reduction_mode = reduction.mode
+    encoder._reduction_schedule = reduction_schedule(num_tokens, len(encoder.layers), reduction.ratio, reduction.mode)
+    encoder._full_forward = encoder.forward
+    encoder.forward = types.MethodType(_reduced_encoder_forward, encoder)
+    return vit
+
+
+def remove(vit):
+    encoder = vit.encoder
+    if '_full_forward' in encoder.__dict__:
+        encoder.forward = encoder._full_forward
+        for name in ('_full_forward', '_reduction_mode', '_reduction_schedule'):
+            delattr(encoder, name)
+    return vit
+
+
+@contextlib.contextmanager
+def full_tokens():
+    """Run every reduced ViT at full resolution on this thread (explainers need all patches)."""
+    previous = getattr(_local, 'full_tokens', False)
+    _local.full_tokens = True
+    try:
+        yield
+    finally:
+        _local.full_tokens = previous
+
+
+def encoder_macs(vit, reduction=None):
+    """Multiply-accumulates of the transformer blocks for one image."""
+    encoder = vit.encoder
+    D = vit.hidden_dim
+    M = vit.mlp_dim
+    n = encoder.pos_embedding.shape[1]
+    mode = reduction.mode if reduction is not None else 'off'
+    schedule = [0] * len(encoder.layers)
+    if mode != 'off':
+        schedule = reduction_schedule(n, len(encoder.layers), reduction.ratio, mode)
+    total = 0
+    for r in schedule:
+        total += 4 * n * D * D + 2 * n * n * D        # qkv + out proj, QK^T + AV
+        if mode == 'tome':
+            n -= r
+        elif mode == 'prune' and r > 1:
+            n -= r - 1
+        total += 2 * n * D * M                        # MLP on the reduced set
+    return total
+
+
+# ---------------------------------------------------------------------------
+# fidelity report
+
+
+def _load(random_weights):
+    if random_weights:
+        from benchmarks import stubs
+        tokenizer = stubs.make_tokenizer()
+        return stubs.make_model(tokenizer), tokenizer, stubs.make_title(8)
+
+    from transformers import AutoTokenizer
+    from model import load_checkpoint
+    from prediction import CLAIM_TYPES, MODEL_PATH, TEXT_MODEL, DEVICE
+    model = load_checkpoint(MODEL_PATH, num_claims=len(CLAIM_TYPES), device=DEVICE)
+    return model, AutoTokenizer.from_pretrained(TEXT_MODEL), None
+
+
+def _images(folder, n):
+    from PIL import Image
+    from prediction import img_transform
+    if folder:
+        names = sorted(f for f in os.listdir(folder)
+                       if os.path.splitext(f)[1].lower() in ('.jpg', '.jpeg', '.png', '.webp'))[:n]
+        return [img_transform(Image.open(os.path.join(folder, f)).convert('RGB')) for f in names]
+    # smooth synthetic images: random low-res noise upsampled, so patches are correlated
+    torch.manual_seed(0)
+    low = torch.rand(n, 3, 14, 14)
+    return list(F.interpolate(low, size=224, mode='bilinear', align_corners=False) * 2 - 1)
+
+
+def _timed_encode(model, imgs, repeat):
+    with torch.no_grad():
+        model.encode_image(imgs[:1])
+        start = time.perf_counter()
+        for _ in range(repeat):
+            emb = model.encode_image(imgs)
+        return emb, (time.perf_counter() - start) / repeat / imgs.shape[0] * 1000
+
+
+def fidelity_report(model, tokenizer, imgs, title, reductions, repeat=3):
+    """CLS cosine similarity, fake-probability change, MACs and latency for each setting vs baseline."""
+    from prediction import DEVICE
+    imgs = torch.stack(imgs).to(DEVICE)
+    enc = tokenizer([title] * imgs.shape[0], truncation=True, max_length=128, padding=True, return_tensors='pt').to(DEVICE)
+    vit = model.image_model
+
+    with torch.no_grad():
+        txt = model.encode_text(enc['input_ids'], enc['attention_mask'])
+    remove(vit)
+    base_emb, base_ms = _timed_encode(model, imgs, repeat)
+    with torch.no_grad():
+        base_prob = model.heads(txt, base_emb)[0].squeeze(-1)
+    base_macs = encoder_macs(vit)
+
+    rows = []
+    for reduction in reductions:
+        apply(vit, reduction)
+        emb, ms = _timed_encode(model, imgs, repeat)
+        with torch.no_grad():
+            prob = model.heads(txt, emb)[0].squeeze(-1)
+        remove(vit)
+        cos = F.cosine_similarity(emb, base_emb, dim=-1)
+        delta = (prob - base_prob).abs()
+        macs = encoder_macs(vit, reduction)
+        rows.append({
+            'mode': reduction.mode,
+            'ratio': reduction.ratio,
+            'schedule': reduction_schedule(vit.encoder.pos_embedding.shape[1], len(vit.encoder.layers),
+                                           reduction.ratio, reduction.mode),
+            'cls_cosine_mean': cos.mean().item(),
+            'cls_cosine_min': cos.min().item(),
+            'fake_prob_delta_mean': delta.mean().item(),
+            'fake_prob_delta_max': delta.max().item(),
+            'verdict_flips': int(((prob > 0.5) != (base_prob > 0.5)).sum().item()),
+            'encoder_gmacs': macs / 1e9,
+            'mac_reduction': base_macs / macs,
+            'ms_per_image': ms,
+            'speedup': base_ms / ms,
+        })
+    return {
+        'images': imgs.shape[0],
+        'baseline': {'encoder_gmacs': base_macs / 1e9, 'ms_per_image': base_ms},
+        'settings': rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    rep = sub.add_parser('report', help='fidelity of reduced-token encoding vs the full ViT')
+    rep.add_argument('--images', default=None, help='folder of sample images (synthetic if omitted)')
+    rep.add_argument('--limit', type=int, default=16)
+    rep.add_argument('--title', default=None, help='headline fused with every image for the fake probability')
+    rep.add_argument('--modes', nargs='*', default=['tome', 'prune'])
+    rep.add_argument('--ratios', nargs='*', type=float, default=[0.5, 0.75, 0.9])
+    rep.add_argument('--repeat', type=int, default=3)
+    rep.add_argument('--threads', type=int, default=None)
+    rep.add_argument('--random-weights', action='store_true')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    with contextlib.redirect_stdout(sys.stderr):
+        model, tokenizer, stub_title = _load(args.random_weights)
+        imgs = _images(args.images, args.limit)
+        title = args.title or stub_title or 'ಸುದ್ದಿ'
+        reductions = [TokenReduction(mode, ratio) for mode in args.modes for ratio in args.ratios]
+        report = fidelity_report(model, tokenizer, imgs, title, reductions, args.repeat)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Shared tokenization for MuRIL and the XLM-R zero-shot model.
+
+load() returns the Rust ("fast") tokenizer. For a checkpoint that ships only
+a sentencepiece model, the fast tokenizer is converted once at load time.
+The slow Python tokenizer is used only when that conversion is not possible.
+
+/analyze tokenizes a title several times: for the forward pass, for the
+offsets the SHAP word aggregation needs, and again per request for the same
+headline. encode() memoizes (input_ids, offsets) per tokenizer in an LRU of
+TOKENIZER_CACHE_SIZE titles. encode_batch() builds padded model inputs from
+those entries, so the offsets come out of the same tokenizer call.
+Variable inputs such as SHAP's masked variants pass memo=False: one
+batched call padded by the tokenizer itself, without offsets, and without
+evicting titles from the cache.
+"""
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import torch
+from transformers import AutoTokenizer
+
+from metrics import record_cache
+
+TOKENIZER_CACHE_SIZE = int(os.getenv('TOKENIZER_CACHE_SIZE', '4096'))
+MAX_LENGTH = 128
+
+
+def load(name, **kwargs):
+    """The fast tokenizer for `name`, or the slow one if it cannot be built."""
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(name, use_fast=True, **kwargs)
+    except (ValueError, ImportError, OSError) as e:
+        # conversion from a sentencepiece model needs sentencepiece + protobuf
+        print(f"⚠️ No fast tokenizer for {name} ({e}); using the slow one")
+        return AutoTokenizer.from_pretrained(name, use_fast=False, **kwargs)
+    if not tokenizer.is_fast:
+        print(f"⚠️ {name} has no fast tokenizer; tokenization runs in Python")
+    return tokenizer
+
+
+class EncodingCache:
+    """LRU of title -> (input_ids, offsets) for one tokenizer."""
+    def __init__(self, capacity=TOKENIZER_CACHE_SIZE):
+        self.capacity = capacity
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, text):
+        with self.lock:
+            encoding = self.items.get(text)
+            if encoding is not None:
+                self.items.move_to_end(text)
+        return encoding
+
+    def put(self, text, encoding):
+        with self.lock:
+            self.items[text] = encoding
+            self.items.move_to_end(text)
+            while len(self.items) > self.capacity:
+                self.items.popitem(last=False)
+
+
+_caches = weakref.WeakKeyDictionary()
+_caches_lock = threading.Lock()
+
+
+def cache_for(tokenizer):
+    with _caches_lock:
+        cache = _caches.get(tokenizer)
+        if cache is None:
+            cache = _caches[tokenizer] = EncodingCache()
+        return cache
+
+
+def _freeze(ids, offsets):
+    ids = np.asarray(ids, dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64).reshape(-1, 2)
+    ids.setflags(write=False)
+    offsets.setflags(write=False)
+    return ids, offsets
+
+
+def _encode_many(tokenizer, texts):
+    """One batched call over texts, untruncated, with offsets when the tokenizer provides them."""
+    if tokenizer.is_fast:
+        enc = tokenizer(texts, add_special_tokens=True, return_offsets_mapping=True)
+        return [_freeze(ids, offs) for ids, offs in zip(enc['input_ids'], enc['offset_mapping'])]
+    # slow tokenizers have no offsets; (0, 0) spans mark every token as special
+    enc = tokenizer(texts, add_special_tokens=True)
+    return [_freeze(ids, np.zeros((len(ids), 2))) for ids in enc['input_ids']]
+
+
+def encode_many(tokenizer, texts, memo=True):
+    """(input_ids, offsets) per text, as SHAP's Text masker tokenizes it (special tokens, no truncation)."""
+    if not memo:
+        return _encode_many(tokenizer, list(texts))
+    cache = cache_for(tokenizer)
+    encodings = [cache.get(t) for t in texts]
+    for hit in encodings:
+        record_cache('tokenizer', hit is not None)
+    missing = list(dict.fromkeys(t for t, e in zip(texts, encodings) if e is None))
+    if missing:
+        fresh = dict(zip(missing, _encode_many(tokenizer, missing)))
+        for text, encoding in fresh.items():
+            cache.put(text, encoding)
+        encodings = [e if e is not None else fresh[t] for t, e in zip(texts, encodings)]
+    return encodings
+
+
+def encode(tokenizer, text, memo=True):
+    return encode_many(tokenizer, [text], memo)[0]
+
+
+def _truncate(tokenizer, text, ids, max_length):
+    if len(ids) <= max_length:
+        return ids
+    return tokenizer(text, truncation=True, max_length=max_length)['input_ids']
+
+
+def encode_batch(tokenizer, texts, max_length=MAX_LENGTH, memo=True, device=None):
+    """
+    Padded input_ids / attention_mask tensors for texts, equal to
+    tokenizer(texts, padding=True, truncation=True, max_length=max_length).
+    Returns (batch dict, per-text encodings; None with memo=False).
+    """
+    texts = list(texts)
+    if not memo:
+        # nothing to reuse and no offsets needed: let the tokenizer pad in Rust
+        batch = tokenizer(texts, padding=True, truncation=True, max_length=max_length, return_tensors='pt')
+        batch = {k: batch[k] for k in ('input_ids', 'attention_mask')}
+        if device is not None:
+            batch = {k: v.to(device) for k, v in batch.items()}
+        return batch, None
+    encodings = encode_many(tokenizer, texts)
+    rows = [_truncate(tokenizer, t, ids, max_length) for t, (ids, _) in zip(texts, encodings)]
+    width = max(len(r) for r in rows)
+    input_ids = np.full((len(rows), width), tokenizer.pad_token_id, dtype=np.int64)
+    attention_mask = np.zeros((len(rows), width), dtype=np.int64)
+    for i, row in enumerate(rows):
+        span = slice(width - len(row), width) if tokenizer.padding_side == 'left' else slice(0, len(row))
+        input_ids[i, span] = row
+        attention_mask[i, span] = 1
+    batch = {'input_ids': torch.from_numpy(input_ids), 'attention_mask': torch.from_numpy(attention_mask)}
+    if device is not None:
+        batch = {k: v.to(device) for k, v in batch.items()}
+    return batch, encodings
@@ -1,12 +1,18 @@
-import whisper
 import json
-import requests
-from pydub import AudioSegment
-from moviepy import VideoFileClip
 import os
 from dotenv import load_dotenv
+from audio_stream import VadChunker, make_vad, speech_chunks
+from metrics import timed, record_cache
+from pipeline import StageGraph
+import video_transcode
+from video_transcode import TranscodeConfig
+import clients
+import logging
+import logs
 load_dotenv()
+log = logs.get('video')
 file_name = 'result_video.json'
+SARVAM_STT_URL = os.getenv('SARVAM_STT_URL', 'https://api.sarvam.ai/speech-to-text')
 
 def create_json(result):
     with open(file_name,'w',encoding='utf-8') as f:
@@ -18,69 +24,149 @@ def open_json():
         loaded_data = json.load(f)
     return loaded_data
 
-def get_transcript(video_path):
-    print('transcribing....')
+def report_progress(progress, phase, **info):
+    if progress is not None:
+        progress(phase, **info)
+
+@timed('get_transcript')
+def get_transcript(video_path, progress=None):
+    """
+    Stream speech-only chunks out of the video (audio_stream) and transcribe
+    them in order. Nothing touches disk, and silence is never sent to the STT service.
+    """
+    log.info('transcribing')
     try:
         api_key = os.getenv('sarvam_api_key')
-        video = VideoFileClip(video_path)
-        audio_path = 'temp_audio.wav'
-        video.audio.write_audiofile(audio_path,logger = None)
-
-        audio = AudioSegment.from_file('temp_audio.wav')
-        
-        chukn_length = 30000
-        chunks = range(0,len(audio),chukn_length)
-
-        full_transcript = []
-        url = "https://api.sarvam.ai/speech-to-text"
+        url = SARVAM_STT_URL
         headers = {'api-subscription-key': api_key}
+        payload = {
+            'language_code': 'kn-IN',
+            'model': 'saarika:v2.5'
+        }
+        report_progress(progress, 'audio')
+        chunker = VadChunker(make_vad())
+        # chunks are cut while the audio streams, so their number is not known
+        # up front; progress is reported against the container's duration
+        try:
+            duration = video_transcode.probe_duration(video_path)
+        except Exception:
+            duration = None
 
-        print(f"✂️ Audio is {len(audio)/1000:.2f}s long. Splitting into {len(chunks)} parts...")
-
-        for i ,start_time in enumerate(chunks):
-            end_time = start_time + chukn_length
-            chunk = audio[start_time:end_time]
-
-            chunk_filename = f'chunk_{i}.wav'
-            chunk.export(chunk_filename,format='wav')
-
-            with open(chunk_filename,'rb') as audio_file:
-                files = {'file': (chunk_filename, audio_file, 'audio/wav')}
-                payload = {
-                    'language_code': 'kn-IN',
-                    'model': 'saarika:v2.5'
-                }
-
-                print(f"📡 Transcribing Part {i+1}...")
-                response = requests.post(url, data=payload, files=files, headers=headers)
-
+        full_transcript = []
+        for i, (start, wav) in enumerate(speech_chunks(video_path, chunker)):
+
+            def post_chunk():
+                files = {'file': (f'chunk_{i}.wav', wav, 'audio/wav')}
+                response = clients.sarvam.session.post(
+                    url, data=payload, files=files, headers=headers,
+                    timeout=clients.sarvam.config.timeout
+                )
+                if response.status_code == 429 or response.status_code >= 500:
+                    response.raise_for_status()
+                return response
+
+            log.debug('transcribing part', extra=logs.fields(part=i+1, start_s=round(start, 1)))
+            report_progress(progress, 'transcription', chunk=i+1, position_s=round(start, 1),
+                            duration_s=duration and round(duration, 1),
+                            fraction=duration and round(min(1.0, start / duration), 3))
+            try:
+                response = clients.sarvam.call(post_chunk)
                 if response.status_code == 200:
                     text = response.json().get('transcript', '')
                     full_transcript.append(text)
                 else:
-                    print(f"⚠️ Error in part {i+1}: {response.text}")
-            os.remove(chunk_filename)
+                    log.warning('transcription part failed', extra=logs.fields(
+                        part=i+1, status=response.status_code, body=logs.payload(response.text, 300)))
+            except Exception as e:
+                log.warning('transcription part failed', extra=logs.fields(part=i+1, error=str(e)))
+        stats = chunker.stats()
         final_text = " ".join(full_transcript)
-        print("\n✅ Full Transcription Complete!")
+        log.info('transcription complete', extra=logs.fields(
+            audio_s=stats['audio_seconds'], sent_s=stats['sent_seconds'], parts=len(full_transcript)))
         return final_text
-    except Exception as e:
-        print('error :\n',e)
+    except Exception:
+        log.error('transcription failed', exc_info=True)
         return ''
-            
 
 
-def wait_until_active(file):
+def build_video_graph(video_path, verifier, progress=None, transcode_config=None):
+    """
+    Video verification as a stage graph. Transcription (ffmpeg -> VAD ->
+    STT, streamed) and the upload branch (transcode -> upload_file ->
+    wait_until_active) are independent, so they run concurrently; verify
+    starts once both have finished.
+    A video whose verdict is cached (by content) skips every stage: the
+    graph only returns the cached verdict.
+    """
+    transcode_config = transcode_config or TranscodeConfig()
+    key = verifier.cache_key(video_path)
+    cached = verifier.lookup(key)
+    if cached is not None:
+        graph = StageGraph()
+        graph.add('transcode', lambda: (video_path, {'used': False, 'reason': 'cached verdict'}))
+        graph.add('verify', lambda: cached)
+        return graph
+
+    def transcription():
+        return get_transcript(video_path, progress)
+
+    @timed('transcode')
+    def transcode():
+        if transcode_config.enabled:
+            report_progress(progress, 'transcode')
+        try:
+            path, report = video_transcode.submit(video_path, transcode_config).result()
+        except Exception as e:
+            log.warning('transcode failed', extra=logs.fields(error=str(e)))
+            return video_path, {'used': False, 'error': str(e)}
+        if report['used']:
+            log.info('transcoded', extra=logs.fields(input_bytes=report['input_bytes'], output_bytes=report['output_bytes']))
+        return path, report
+
+    def upload(transcode):
+        path, _ = transcode
+        try:
+            return verifier.upload(path, progress)
+        finally:
+            if path != video_path:
+                os.remove(path)
+
+    def verify(transcription, upload):
+        return verifier.verify(video_path, transcription, progress=progress, video=upload, key=key)
+
+    graph = StageGraph()
+    graph.add('transcription', transcription)
+    graph.add('transcode', transcode)
+    graph.add('upload', upload, deps=['transcode'])
+    graph.add('verify', verify, deps=['transcription', 'upload'])
+    return graph
+
+
+def wait_until_active(file, timeout=None):
+    if timeout is None:
+        timeout = clients.gemini_upload.config.timeout
+    deadline = time.monotonic() + timeout
     while file.state.name != "ACTIVE":
-        print("⏳ Waiting for video to become ACTIVE...")
+        if time.monotonic() > deadline:
+            raise clients.OutboundTimeout(f'video {file.name} not ACTIVE after {timeout}s')
+        log.debug('waiting for video to become ACTIVE', extra=logs.fields(file=file.name))
         time.sleep(1)
-        file = genai.get_file(file.name)
+        try:
+            file = clients.gemini_upload.call(genai.get_file, file.name)
+        except clients.CircuitOpenError:
+            raise
+        except Exception:
+            # gemini_upload does not retry; polling is idempotent, so keep going until the deadline
+            log.debug('get_file failed', extra=logs.fields(file=file.name), exc_info=True)
     return file
 
 
 import google.generativeai as genai
 import json
 import hashlib
+import threading
 import time
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime,timedelta
 from typing import Dict,List,Optional
@@ -89,43 +175,81 @@ from dotenv import load_dotenv
 
 genai.configure(api_key = os.getenv('gemini_api_key'))
 
+_NOT_UPLOADED = object()
+
+VIDEO_VERIFY_CACHE_SIZE = int(os.getenv('VIDEO_VERIFY_CACHE_SIZE', '256'))
+
 class VideoVerifier:
-    def __init__(self,model_name = 'gemini-2.5-flash'):
+    def __init__(self,model_name = 'gemini-2.5-flash',cache_size = VIDEO_VERIFY_CACHE_SIZE):
         self.model = genai.GenerativeModel(model_name)
-        self.cache = {}
+        # LRU of finished verdicts; shared by all jobs, so bounded
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.cache_lock = threading.Lock()
         
-    def _cache_key(self,video_path, transcript):
-        return hashlib.md5(f'{video_path}{transcript}'.encode()).hexdigest()
+    def cache_key(self,video_path):
+        """SHA-256 of the video's bytes: a verdict depends on the video, not on where it is stored."""
+        h = hashlib.sha256()
+        with open(video_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        return h.hexdigest()
+
+    def lookup(self,key):
+        """The cached verdict for a cache_key(), or None."""
+        with self.cache_lock:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.cache.move_to_end(key)
+        record_cache('video_verify', cached is not None)
+        if cached is not None:
+            log.info('video verification cache hit')
+        return cached
     
     def _exrtact_json(self,text):
         start = text.find('{')
         end = text.rfind('}') + 1
         return json.loads(text[start:end])
     
-    def verify(self,video_path,transcript):
-        print('\n' + '=' * 60)
-        print('VIDEO VERIFICATION')
-
-        key = self._cache_key(video_path,transcript)
-        if key in self.cache:
-            print("✓ Using cached result")
-            return self.cache[key]
+    @timed('upload')
+    def upload(self,video_path,progress=None):
+        """Upload the video and wait until it is ACTIVE; None if that fails."""
+        try:
+            report_progress(progress, 'upload')
+            video = clients.gemini_upload.call(genai.upload_file, video_path)
+            return wait_until_active(video)
+        except Exception:
+            log.warning('upload failed', exc_info=True)
+            return None
+
+    @timed('verify')
+    def verify(self,video_path,transcript,progress=None,video=_NOT_UPLOADED,key=None):
+        """
+        `video`: result of upload() when it already ran, e.g. alongside transcription.
+        `key`: the video's cache_key() when the caller already looked it up.
+        """
+        log.info('video verification')
+        if key is None:
+            key = self.cache_key(video_path)
+            cached = self.lookup(key)
+            if cached is not None:
+                return cached
         
-        print('[1/2] Generating questions....')
         questions = None
-        video = None
+        if video is _NOT_UPLOADED:
+            video = self.upload(video_path,progress)
         try:
-            questions,video = self._generate_questions(video_path,transcript)
+            questions = self._generate_questions(video,transcript,progress)
             
             questions = [q["questions"] if isinstance(q, dict) else q for q in questions]
             questions  = list(dict.fromkeys(questions))
 
-            print('questions :\n',questions)
-        except Exception as e:
-            print(e)
+            log.info('questions', extra=logs.fields(count=len(questions), questions=logs.payload(questions, 500)))
+        except Exception:
+            log.warning('question post-processing failed', exc_info=True)
             questions =["SKEPTIC", "DEFENDER", "NEUTRAL"]
 
-        print("[2/2] Analyzing and generating verdict...")
+        report_progress(progress, 'analysis')
         anlyze_result = self._analyze(video,transcript,questions)
 
         result = {
@@ -134,12 +258,17 @@ class VideoVerifier:
         }
         
         
-        self.cache[key] = result
+        with self.cache_lock:
+            self.cache[key] = result
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
         
 
         return result
 
-    def _generate_questions(self,video_path,transcript):
+    @timed('_generate_questions')
+    def _generate_questions(self,video,transcript,progress=None):
         promot = f"""
                 You are a comprehensive fact-checker analyzing a video for authenticity.
 
@@ -195,18 +324,21 @@ class VideoVerifier:
                 }}
             """
         try:
-            video = genai.upload_file(video_path)
-            video = wait_until_active(video)
-            response = self.model.generate_content([promot,video])
-            print(f"Reponse questions:\n {response.text}")
+            if video is None:
+                raise RuntimeError('video was not uploaded')
+            report_progress(progress, 'questions')
+            response = clients.gemini.call(self.model.generate_content, [promot,video])
+            if log.isEnabledFor(logging.DEBUG) and logs.sampled():
+                log.debug('questions response', extra=logs.fields(text=logs.payload(response.text)))
             data = self._exrtact_json(response.text)
-            return data['questions'] , video
-        except Exception as e:
-            print('question generation error;\n',e)
+            return data['questions']
+        except Exception:
+            log.warning('question generation failed', exc_info=True)
             question = open_json()
-            return question['questions'] , None
+            return question['questions']
     
 
+    @timed('_analyze')
     def _analyze(self,video,transcript,questions):
         q_text = '\n'.join(f"{i+1}.{q}" for i , q in enumerate(questions))
 
@@ -248,13 +380,14 @@ class VideoVerifier:
         # video = genai.upload_file(video_path)
         # video = wait_until_active(video)
         try:
-            response = self.model.generate_content([prompt,video])
-            print('Response :\n ',response)
+            response = clients.gemini.call(self.model.generate_content, [prompt,video])
             result_text = self._exrtact_json(response.text)
-            print('response after extract json :\n',result_text)
+            if log.isEnabledFor(logging.DEBUG) and logs.sampled():
+                log.debug('analysis response', extra=logs.fields(text=logs.payload(response.text)))
+            log.info('analysis', extra=logs.fields(result=logs.payload(result_text, 300)))
             return (result_text)
-        except Exception as e:
-            print('Analysis error:\n',e)
+        except Exception:
+            log.warning('analysis failed', exc_info=True)
             load = open_json()
             return load['analysis']
             
@@ -0,0 +1,161 @@
+"""
+Shrink a video before it is uploaded to the LLM.
+
+Upload time and Gemini's server-side processing both scale with file
+size, and the raw user video is usually far larger than the model needs.
+This stage re-encodes it locally with ffmpeg:
+    - scaled down to VIDEO_TRANSCODE_HEIGHT (default 480p, never upscaled)
+    - resampled to VIDEO_TRANSCODE_FPS frames per second (default 5)
+    - cut to the first VIDEO_TRANSCODE_MAX_S seconds (0 = whole video)
+    - VIDEO_TRANSCODE_MONTAGE=1 decodes keyframes only and shows each for
+      one second (Gemini samples video at ~1 fps) as a silent slideshow,
+      which is far smaller for long videos
+Audio is kept as low-bitrate mono AAC, except in montage mode.
+
+ffmpeg runs as a subprocess, and at most VIDEO_TRANSCODE_WORKERS run at
+once across all jobs. If transcoding fails or does not make the file
+smaller, the original file is uploaded.
+
+Off by default; enable with VIDEO_TRANSCODE=1.
+
+    python video_transcode.py input.mp4 --height 480 --fps 5 --max-duration 120
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+
+from audio_stream import ffmpeg_binary
+
+VIDEO_TRANSCODE_WORKERS = int(os.getenv('VIDEO_TRANSCODE_WORKERS', '2'))
+MONTAGE_FPS = 1
+
+_pool = ThreadPoolExecutor(max_workers=VIDEO_TRANSCODE_WORKERS, thread_name_prefix='transcode')
+
+
+@dataclass
+class TranscodeConfig:
+    enabled: bool = False
+    height: int = 480
+    fps: float = 5.0
+    max_duration: float = 0.0
+    montage: bool = False
+    crf: int = 30
+    audio_bitrate: str = '48k'
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            enabled=os.getenv('VIDEO_TRANSCODE', '0') == '1',
+            height=int(os.getenv('VIDEO_TRANSCODE_HEIGHT', '480')),
+            fps=float(os.getenv('VIDEO_TRANSCODE_FPS', '5')),
+            max_duration=float(os.getenv('VIDEO_TRANSCODE_MAX_S', '0')),
+            montage=os.getenv('VIDEO_TRANSCODE_MONTAGE', '0') == '1',
+            crf=int(os.getenv('VIDEO_TRANSCODE_CRF', '30')),
+            audio_bitrate=os.getenv('VIDEO_TRANSCODE_AUDIO_BITRATE', '48k'),
+        )
+
+
+_DURATION = re.compile(r'Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)')
+
+
+def probe_duration(path):
+    """Container duration in seconds from ffmpeg's stream summary (no ffprobe needed), or None."""
+    proc = subprocess.run([ffmpeg_binary(), '-nostdin', '-hide_banner', '-i', path],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=60)
+    m = _DURATION.search(proc.stderr.decode('utf-8', 'replace'))
+    if not m:
+        return None
+    h, mnt, s = m.groups()
+    return int(h) * 3600 + int(mnt) * 60 + float(s)
+
+
+def build_command(src, dst, config):
+    cmd = [ffmpeg_binary(), '-nostdin', '-loglevel', 'error', '-y']
+    if config.montage:
+        cmd += ['-skip_frame', 'nokey']
+    if config.max_duration > 0:
+        cmd += ['-t', str(config.max_duration)]
+    cmd += ['-i', src]
+
+    filters = [f"scale=-2:'min({config.height},ih)'"]
+    fps = config.fps
+    if config.montage:
+        # one keyframe per output frame, one frame per second
+        fps = MONTAGE_FPS
+        filters.insert(0, f'setpts=N/({fps}*TB)')
+    cmd += ['-vf', ','.join(filters), '-r', str(fps),
+            '-c:v', 'libx264', '-preset', 'veryfast', '-crf', str(config.crf), '-pix_fmt', 'yuv420p']
+    if config.montage:
+        cmd += ['-an']
+    else:
+        cmd += ['-c:a', 'aac', '-ac', '1', '-b:a', config.audio_bitrate]
+    cmd += ['-movflags', '+faststart', dst]
+    return cmd
+
+
+def transcode(src, config, out_dir=None):
+    """
+    Re-encode src per config. Returns (path_to_upload, report). The path is
+    a temporary file owned by the caller, or src itself if the transcode was
+    skipped, failed, or did not save space (report['used'] says which).
+    """
+    report = {'used': False, 'input_bytes': os.path.getsize(src), 'config': asdict(config)}
+    if not config.enabled:
+        return src, report
+
+    fd, dst = tempfile.mkstemp(suffix='.mp4', prefix='transcode_', dir=out_dir)
+    os.close(fd)
+    start = time.perf_counter()
+    proc = subprocess.run(build_command(src, dst, config), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    report['seconds'] = round(time.perf_counter() - start, 3)
+
+    if proc.returncode != 0 or os.path.getsize(dst) == 0:
+        report['error'] = proc.stderr.decode('utf-8', 'replace').strip()[-500:]
+        os.remove(dst)
+        return src, report
+
+    report['output_bytes'] = os.path.getsize(dst)
+    report['bytes_saved'] = report['input_bytes'] - report['output_bytes']
+    if report['bytes_saved'] <= 0:
+        os.remove(dst)
+        return src, report
+    report['used'] = True
+    return dst, report
+
+
+def submit(src, config, out_dir=None):
+    """transcode() on the shared pool, so concurrent jobs don't oversubscribe the CPU."""
+    return _pool.submit(transcode, src, config, out_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video')
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--fps', type=float, default=5.0)
+    parser.add_argument('--max-duration', type=float, default=0.0)
+    parser.add_argument('--montage', action='store_true')
+    parser.add_argument('--crf', type=int, default=30)
+    parser.add_argument('--keep', action='store_true', help='keep the transcoded file and print its path')
+    args = parser.parse_args()
+
+    config = TranscodeConfig(True, args.height, args.fps, args.max_duration, args.montage, args.crf)
+    path, report = transcode(args.video, config)
+    report['input_duration_s'] = probe_duration(args.video)
+    if report['used']:
+        report['output_duration_s'] = probe_duration(path)
+        if args.keep:
+            report['output'] = path
+        else:
+            os.remove(path)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
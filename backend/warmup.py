@@ -0,0 +1,307 @@
+"""
+Startup warm-up, optional torch.compile and thread/batch autotuning.
+
+The first requests after load_model pay for lazy kernel initialisation,
+allocator growth, tokenizer and autograd set-up. After the model is loaded,
+server.py starts run() on a background thread:
+    1. apply the tuning stored for this host, if any
+    2. WARMUP_COMPILE=1: torch.compile the text and image encoders
+       (encode_text / encode_image only; explainers keep the eager ViT)
+    3. WARMUP_AUTOTUNE=1 only: time a few torch.set_num_threads values and
+       batch sizes, keep the best and save them to
+       WARMUP_TUNING_DIR/<hostname>.json
+    4. synthetic warm-up passes at WARMUP_SEQ_LENS and the tuned batch size,
+       plus one Grad-CAM and one zero-shot call
+GET /ready answers 503 until this finishes, then 200 with the report.
+
+/analyze already serves while this runs, and torch.set_num_threads is
+process-wide, so autotuning would change the thread count under live
+requests and skew its own timings. It is therefore opt-in, never implied
+by a missing tuning file; a host without one keeps torch's defaults.
+Tune a host offline with `python warmup.py`, which saves the tuning the
+server then applies at startup.
+
+Tuning is keyed on a fingerprint (CPU count, torch version, image
+architecture, device). If any of them change, the host is tuned again.
+Settings given explicitly in the environment (TORCH_NUM_THREADS,
+ANALYZE_BATCH_CHUNK) win over tuned ones.
+
+    python warmup.py --random-weights     # tune and print the report
+"""
+import argparse
+import contextlib
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from dataclasses import dataclass
+
+import torch
+
+WARMUP_TUNING_DIR = os.getenv('WARMUP_TUNING_DIR', 'tuning')
+THREAD_CANDIDATES = (1, 2, 4, 8, 16)
+BATCH_CANDIDATES = (8, 16, 32, 64)
+TUNE_SEQ_LEN = 64
+
+
+@dataclass
+class WarmupConfig:
+    enabled: bool = True
+    compile: bool = False
+    autotune: bool = False
+    seq_lens: tuple = (16, 64, 128)
+    repeat: int = 3
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            enabled=os.getenv('WARMUP', '1') == '1',
+            compile=os.getenv('WARMUP_COMPILE', '0') == '1',
+            autotune=os.getenv('WARMUP_AUTOTUNE', '0') == '1',
+            seq_lens=tuple(int(x) for x in os.getenv('WARMUP_SEQ_LENS', '16,64,128').split(',')),
+            repeat=int(os.getenv('WARMUP_REPEAT', '3')),
+        )
+
+
+class State:
+    """What /ready reports."""
+    def __init__(self):
+        self.ready = False
+        self.phase = 'loading'
+        self.report = {}
+        self.lock = threading.Lock()
+
+    def set(self, phase, ready=False, **report):
+        with self.lock:
+            self.phase = phase
+            self.ready = ready
+            self.report.update(report)
+
+    def snapshot(self):
+        with self.lock:
+            return {'ready': self.ready, 'phase': self.phase, **self.report}
+
+
+state = State()
+
+
+def fingerprint(model):
+    return {
+        'host': socket.gethostname(),
+        'cpu_count': os.cpu_count(),
+        'torch': torch.__version__,
+        'image_arch': getattr(model, 'config', {}).get('image_arch'),
+        'device': str(next(model.parameters()).device),
+    }
+
+
+def tuning_path(directory=WARMUP_TUNING_DIR):
+    return os.path.join(directory, f'{socket.gethostname()}.json')
+
+
+def load_tuning(model, path=None):
+    path = path or tuning_path()
+    try:
+        with open(path, encoding='utf-8') as f:
+            tuning = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return tuning if tuning.get('fingerprint') == fingerprint(model) else None
+
+
+def save_tuning(tuning, path=None):
+    path = path or tuning_path()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(tuning, f, indent=2)
+    os.replace(tmp, path)
+
+
+def apply_tuning(tuning):
+    """Set the tuned thread count unless the environment fixed one. Returns the batch chunk to use."""
+    if 'TORCH_NUM_THREADS' in os.environ:
+        torch.set_num_threads(int(os.environ['TORCH_NUM_THREADS']))
+    elif tuning:
+        torch.set_num_threads(tuning['threads'])
+    if 'ANALYZE_BATCH_CHUNK' in os.environ or not tuning:
+        return None
+    return tuning['batch_chunk']
+
+
+def _inputs(model, batch_size, seq_len, vocab_size):
+    device = next(model.parameters()).device
+    ids = torch.randint(5, vocab_size, (batch_size, seq_len), device=device)
+    mask = torch.ones(batch_size, seq_len, dtype=torch.long, device=device)
+    img = torch.randn(batch_size, 3, 224, 224, device=device, dtype=next(model.parameters()).dtype)
+    return ids, mask, img
+
+
+def _forward(model, ids, mask, img):
+    with torch.no_grad():
+        return model.heads(model.encode_text(ids, mask), model.encode_image(img))
+
+
+def _time(fn, repeat):
+    fn()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def autotune(model, vocab_size, repeat=3):
+    """
+    threads: lowest single-item latency (the interactive /analyze path).
+    batch_chunk: highest items/s at that thread count (/analyze_batch).
+    """
+    cpus = os.cpu_count() or 1
+    candidates = sorted({t for t in THREAD_CANDIDATES if t <= cpus} | {cpus})
+    original = torch.get_num_threads()
+    single = {}
+    try:
+        for threads in candidates:
+            torch.set_num_threads(threads)
+            single[threads] = _time(lambda: _forward(model, *_inputs(model, 1, TUNE_SEQ_LEN, vocab_size)), repeat)
+    finally:
+        torch.set_num_threads(original)
+    threads = min(single, key=single.get)
+
+    torch.set_num_threads(threads)
+    throughput = {}
+    for bs in BATCH_CANDIDATES:
+        inputs = _inputs(model, bs, TUNE_SEQ_LEN, vocab_size)
+        throughput[bs] = bs / _time(lambda: _forward(model, *inputs), max(1, repeat - 1))
+    batch_chunk = max(throughput, key=throughput.get)
+
+    return {
+        'threads': threads,
+        'batch_chunk': batch_chunk,
+        'single_item_ms': {str(k): round(v * 1000, 2) for k, v in single.items()},
+        'items_per_sec': {str(k): round(v, 2) for k, v in throughput.items()},
+        'fingerprint': fingerprint(model),
+        'tuned_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compile_encoders(model):
+    """Swap in compiled encode_text / encode_image; the eager modules stay for explainers and hooks."""
+    text = torch.compile(model.text_model, dynamic=True)
+    image = torch.compile(model.image_model)
+    model.encode_text = lambda ids, mask: text(ids, attention_mask=mask).last_hidden_state[:, 0, :]
+    model.encode_image = image
+
+
+def uncompile(model):
+    for name in ('encode_text', 'encode_image'):
+        model.__dict__.pop(name, None)
+
+
+def warm(model, tokenizer, classifier, config, batch_size):
+    """Representative passes so kernels, allocator pools and tokenizer caches exist before traffic."""
+    from prediction import compute_attention_map, CLAIM_LABELS
+    timings = {}
+    vocab_size = len(tokenizer)
+    for seq_len in config.seq_lens:
+        for bs in sorted({1, batch_size}):
+            inputs = _inputs(model, bs, seq_len, vocab_size)
+            start = time.perf_counter()
+            for _ in range(config.repeat):
+                _forward(model, *inputs)
+            timings[f'forward_b{bs}_l{seq_len}_ms'] = round((time.perf_counter() - start) / config.repeat * 1000, 2)
+
+    start = time.perf_counter()
+    tokenizer(['ಪರೀಕ್ಷಾ ಶೀರ್ಷಿಕೆ ' * n for n in (2, 8, 32)], padding=True, truncation=True, max_length=128)
+    timings['tokenizer_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+    start = time.perf_counter()
+    compute_attention_map(_inputs(model, 1, 1, vocab_size)[2], model)
+    timings['gradcam_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+    if classifier is not None:
+        start = time.perf_counter()
+        classifier('ಪರೀಕ್ಷಾ ಶೀರ್ಷಿಕೆ', CLAIM_LABELS, hypothesis_template="ಈ ಸುದ್ದಿ {} ಕುರಿತು ಇದೆ.")
+        timings['zero_shot_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    return timings
+
+
+def run(model, tokenizer, classifier=None, config=None, remote=False):
+    """
+    The whole startup phase. Returns the tuned /analyze_batch chunk size,
+    or None to keep the default. Always ends with state.ready = True: a failed
+    warm-up leaves a slower first request, not an unready server.
+    """
+    config = config or WarmupConfig.from_env()
+    batch_chunk = None
+    start = time.perf_counter()
+    try:
+        if not config.enabled:
+            return None
+        if remote:
+            # encoders live in encoder_service workers; only warm the local side
+            state.set('warming')
+            state.set('warming', timings=warm(model, tokenizer, classifier, config, 1))
+            return None
+
+        tuning = load_tuning(model)
+        if config.compile:
+            state.set('compiling')
+            try:
+                compile_encoders(model)
+                _forward(model, *_inputs(model, 1, TUNE_SEQ_LEN, len(tokenizer)))
+                state.set('compiling', compiled=True)
+            except Exception as e:
+                print(f"⚠️ torch.compile failed, staying eager: {e}")
+                uncompile(model)
+                state.set('compiling', compiled=False, compile_error=str(e))
+
+        if config.autotune:
+            state.set('autotuning')
+            tuning = autotune(model, len(tokenizer), config.repeat)
+            save_tuning(tuning)
+        batch_chunk = apply_tuning(tuning)
+        state.set('warming', tuning=tuning, threads=torch.get_num_threads(), batch_chunk=batch_chunk)
+
+        state.set('warming', timings=warm(model, tokenizer, classifier, config, batch_chunk or 1))
+        return batch_chunk
+    except Exception as e:
+        print(f"⚠️ warm-up failed: {e}")
+        state.set('warming', error=str(e))
+        return batch_chunk
+    finally:
+        state.set('ready', ready=True, warmup_s=round(time.perf_counter() - start, 2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--random-weights', action='store_true', help='benchmark stub model instead of the checkpoint')
+    parser.add_argument('--compile', action='store_true')
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(sys.stderr):
+        if args.random_weights:
+            from sandbox import use_temp_state
+            use_temp_state('warmup_state_')
+            from benchmarks import stubs
+            tokenizer = stubs.make_tokenizer()
+            model = stubs.make_model(tokenizer)
+            classifier = stubs.stub_classifier()
+        else:
+            from transformers import AutoTokenizer
+            from model import load_checkpoint
+            from prediction import MODEL_PATH, STUDENT_MODEL_PATH, MODEL_VARIANT, TEXT_MODEL, CLAIM_TYPES, DEVICE
+            path = STUDENT_MODEL_PATH if MODEL_VARIANT == 'student' else MODEL_PATH
+            model = load_checkpoint(path, num_claims=len(CLAIM_TYPES), device=DEVICE)
+            tokenizer = AutoTokenizer.from_pretrained(TEXT_MODEL)
+            classifier = None
+        config = WarmupConfig(compile=args.compile, autotune=True)
+        run(model, tokenizer, classifier, config)
+    print(json.dumps(state.snapshot(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
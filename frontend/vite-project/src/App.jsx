@@ -162,8 +162,19 @@ function FakeNewsDetection() {
 
       if (!response.ok) throw new Error('AI summary generation failed');
 
-      const data = await response.json();
-      setAiSummary(data.summary);
+      // the summary streams in as plain text; render it as it arrives
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let summary = '';
+      setAiSummary('');
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        summary += decoder.decode(value, { stream: true });
+        setAiSummary(summary);
+      }
+      summary += decoder.decode();
+      setAiSummary(summary);
     } catch (error) {
       console.error('Error:', error);
       alert('AI summary generation failed');
@@ -353,8 +364,18 @@ function VideoAnalysis() {
 
       if (!response.ok) throw new Error('Video analysis failed');
 
-      const data = await response.json();
-      setResult(data);
+      // verification runs as a background job; poll until it finishes
+      const { status_url } = await response.json();
+      let job;
+      do {
+        await new Promise((resolve) => setTimeout(resolve, 2000));
+        const jobResponse = await fetch(`${API_BASE}${status_url}`);
+        if (!jobResponse.ok) throw new Error('Video analysis failed');
+        job = await jobResponse.json();
+      } while (job.status === 'queued' || job.status === 'running');
+
+      if (job.status !== 'done') throw new Error(job.error || 'Video analysis failed');
+      setResult(job.result);
     } catch (error) {
       console.error('Error:', error);
       alert('Video analysis failed. Please ensure the backend is running.');
@@ -1040,9 +1061,10 @@ function TextForensicsCard({ result }) {
 
 function VisualAttentionCard({ result, imagePreview }) {
   const getGradCamUrl = () => {
+    if (result.image_analysis?.url) return `${API_BASE}${result.image_analysis.url}`;
     if (!result.image_analysis?.file) return imagePreview;
     const basename = result.image_analysis.file.split('/').pop();
-    return `${API_BASE}/${basename}`;
+    return `${API_BASE}/uploads/${basename}`;
   };
 
   const heatmapUrl = getGradCamUrl();